@@ -0,0 +1,11 @@
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def synchronous_thumbnails(settings):
+    """Миниатюры в тестах создаются сразу, без фоновых потоков.
+
+    Иначе поток может писать миниатюры во временный MEDIA_ROOT, который
+    тест уже удаляет.
+    """
+    settings.THUMBNAIL_WORKERS = 0
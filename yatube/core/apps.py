@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from .perf import slowlog
+
+        connection_created.connect(slowlog.install)
+        for connection in connections.all():
+            slowlog.install(connection)
@@ -0,0 +1,333 @@
+"""Бэкенды кэша, общие для нескольких процессов.
+
+SQLiteCache хранит записи в файле SQLite и подходит как общий кэш для
+всех воркеров одной машины. TieredCache ставит перед любым бэкендом
+из settings.CACHES небольшой LRU в памяти процесса и считает попадания
+по префиксам ключей (см. core.cache.metrics).
+"""
+import pickle
+import random
+import sqlite3
+import time
+from collections import OrderedDict
+from threading import Lock, local
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.utils.functional import cached_property
+
+from . import metrics
+
+
+class SQLiteCache(BaseCache):
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    # Доля операций записи, после которых чистятся устаревшие записи.
+    cull_probability = 0.01
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        self._local = local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(
+                self.location, timeout=10, isolation_level=None
+            )
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB, expires REAL)'
+            )
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+            )
+            self._local.connection = connection
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _dumps(self, value):
+        return pickle.dumps(value, self.pickle_protocol)
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self.connection.execute(
+            'SELECT value FROM cache WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (key, time.time()),
+        ).fetchone()
+        return default if row is None else pickle.loads(row[0])
+
+    def get_many(self, keys, version=None):
+        made = {self._key(key, version): key for key in keys}
+        if not made:
+            return {}
+        placeholders = ', '.join('?' * len(made))
+        rows = self.connection.execute(
+            f'SELECT key, value FROM cache WHERE key IN ({placeholders}) '
+            'AND (expires IS NULL OR expires > ?)',
+            (*made, time.time()),
+        )
+        return {made[key]: pickle.loads(value) for key, value in rows}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        self.connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, self._dumps(value), self.get_backend_timeout(timeout)),
+        )
+        self._maybe_cull()
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires = self.get_backend_timeout(timeout)
+        rows = [
+            (self._key(key, version), self._dumps(value), expires)
+            for key, value in data.items()
+        ]
+        with self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                rows,
+            )
+        self._maybe_cull()
+        return []
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'DELETE FROM cache WHERE key = ? AND expires <= ?',
+                (key, time.time()),
+            )
+            added = connection.execute(
+                'INSERT OR IGNORE INTO cache (key, value, expires) '
+                'VALUES (?, ?, ?)',
+                (key, self._dumps(value), self.get_backend_timeout(timeout)),
+            ).rowcount == 1
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._key(key, version)
+        return self.connection.execute(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), key, time.time()),
+        ).rowcount == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self.connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value FROM cache WHERE key = ? '
+                'AND (expires IS NULL OR expires > ?)',
+                (key, time.time()),
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Key '{key}' not found")
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (self._dumps(value), key),
+            )
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def delete(self, key, version=None):
+        self.connection.execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),)
+        )
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        self.connection.execute('DELETE FROM cache')
+
+    def _maybe_cull(self):
+        if random.random() < self.cull_probability:
+            self.cull()
+
+    def cull(self):
+        """Удалить устаревшие записи и лишние сверх MAX_ENTRIES."""
+        connection = self.connection
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),)
+        )
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        excess = count[0] - self._max_entries
+        if excess > 0:
+            excess += self._max_entries // max(self._cull_frequency, 1)
+            connection.execute(
+                'DELETE FROM cache WHERE key IN ('
+                'SELECT key FROM cache '
+                'ORDER BY expires IS NULL, expires LIMIT ?)',
+                (excess,),
+            )
+
+
+# Локальный уровень общий для всех потоков процесса.
+_local_tiers = {}
+_local_tiers_lock = Lock()
+
+
+class TieredCache(BaseCache):
+    """LRU в памяти процесса перед общим кэшем.
+
+    OPTIONS:
+        SHARED — алиас общего кэша в settings.CACHES;
+        LOCAL_MAX_ENTRIES — размер локального LRU;
+        LOCAL_TIMEOUT — сколько секунд запись живёт локально, это
+            предел расхождения между процессами;
+        LOCAL_SKIP_PREFIXES — префиксы ключей, которые всегда читаются
+            из общего кэша (например, версии лент).
+    """
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options['SHARED']
+        self.local_max_entries = options.get('LOCAL_MAX_ENTRIES', 1000)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 5)
+        self.skip_prefixes = tuple(options.get('LOCAL_SKIP_PREFIXES', ()))
+        with _local_tiers_lock:
+            self._entries, self._lock = _local_tiers.setdefault(
+                location or self.shared_alias, (OrderedDict(), Lock())
+            )
+
+    @cached_property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def _local_key(self, key, version):
+        return key, self.version if version is None else version
+
+    def _use_local(self, key):
+        return not str(key).startswith(self.skip_prefixes)
+
+    def _get_local(self, key, version):
+        local_key = self._local_key(key, version)
+        with self._lock:
+            entry = self._entries.get(local_key)
+            if entry is None:
+                return None
+            expires, pickled = entry
+            if expires <= time.monotonic():
+                del self._entries[local_key]
+                return None
+            self._entries.move_to_end(local_key)
+        return pickle.loads(pickled)
+
+    def _set_local(self, key, value, version, timeout=DEFAULT_TIMEOUT):
+        if not self._use_local(key):
+            return
+        lifetime = self.local_timeout
+        if timeout not in (DEFAULT_TIMEOUT, None):
+            lifetime = min(lifetime, timeout)
+        local_key = self._local_key(key, version)
+        if lifetime <= 0:
+            self._delete_local(key, version)
+            return
+        pickled = pickle.dumps(value, self.pickle_protocol)
+        with self._lock:
+            self._entries[local_key] = (time.monotonic() + lifetime, pickled)
+            self._entries.move_to_end(local_key)
+            while len(self._entries) > self.local_max_entries:
+                self._entries.popitem(last=False)
+
+    def _delete_local(self, key, version):
+        with self._lock:
+            self._entries.pop(self._local_key(key, version), None)
+
+    def get(self, key, default=None, version=None):
+        if self._use_local(key):
+            value = self._get_local(key, version)
+            if value is not None:
+                metrics.record(key, 'local_hit')
+                return value
+        value = self.shared.get(key, version=version)
+        if value is None:
+            metrics.record(key, 'miss')
+            return default
+        metrics.record(key, 'shared_hit')
+        self._set_local(key, value, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found, missing = {}, []
+        for key in keys:
+            value = None
+            if self._use_local(key):
+                value = self._get_local(key, version)
+            if value is None:
+                missing.append(key)
+            else:
+                metrics.record(key, 'local_hit')
+                found[key] = value
+        if missing:
+            shared = self.shared.get_many(missing, version=version)
+            for key in missing:
+                if key in shared:
+                    metrics.record(key, 'shared_hit')
+                    self._set_local(key, shared[key], version)
+                else:
+                    metrics.record(key, 'miss')
+            found.update(shared)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._set_local(key, value, version, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            self._set_local(key, value, version, timeout)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._set_local(key, value, version, timeout)
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        self._delete_local(key, version)
+        value = self.shared.incr(key, delta, version=version)
+        self._set_local(key, value, version)
+        return value
+
+    def delete(self, key, version=None):
+        self._delete_local(key, version)
+        self.shared.delete(key, version=version)
+
+    def has_key(self, key, version=None):
+        return self.get(key, self, version) is not self
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+        self.shared.clear()
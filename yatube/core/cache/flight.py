@@ -0,0 +1,72 @@
+"""Пересчёт записи кэша одним исполнителем (single flight).
+
+Блокировка — ключ, созданный через cache.add, поэтому она работает между
+процессами, если кэш общий (см. core.cache.backends). Пока один запрос
+пересчитывает значение, остальные получают устаревшую копию из
+stale_key или коротко ждут результата. Запись может пересчитываться
+раньше срока с вероятностью, растущей к концу TTL и пропорциональной
+времени вычисления (XFetch), чтобы горячие ключи не истекали у всех
+одновременно.
+"""
+import math
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+LOCK_KEY = 'lock:{}'
+POLL_INTERVAL = 0.05
+
+
+def expires_early(entry, beta=None):
+    _, expires, delta = entry
+    if expires is None:
+        return False
+    if beta is None:
+        beta = settings.CACHE_EARLY_EXPIRATION_BETA
+    gap = -delta * beta * math.log(1 - random.random())
+    return time.time() + gap >= expires
+
+
+def wait_for(key, wait):
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        time.sleep(POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry
+    return None
+
+
+def fetch(key, compute, timeout, stale_key=None, cacheable=None):
+    """Значение из кэша или результат compute(), вычисленный один раз.
+
+    cacheable(value) решает, сохранять ли результат; по умолчанию
+    сохраняется любой.
+    """
+    entry = cache.get(key)
+    if entry is not None and not expires_early(entry):
+        return entry[0]
+    lock = LOCK_KEY.format(key)
+    if not cache.add(lock, 1, settings.CACHE_LOCK_TIMEOUT):
+        if entry is None and stale_key is not None:
+            entry = cache.get(stale_key)
+        if entry is None:
+            entry = wait_for(key, settings.CACHE_LOCK_WAIT)
+        if entry is not None:
+            return entry[0]
+        return compute()
+    try:
+        started = time.monotonic()
+        value = compute()
+        if cacheable is None or cacheable(value):
+            expires = None if timeout is None else time.time() + timeout
+            entry = (value, expires, time.monotonic() - started)
+            data = {key: entry}
+            if stale_key is not None:
+                data[stale_key] = entry
+            cache.set_many(data, timeout)
+    finally:
+        cache.delete(lock)
+    return value
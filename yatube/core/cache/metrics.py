@@ -0,0 +1,63 @@
+"""Счётчики попаданий и промахов кэша по префиксу ключа.
+
+Префикс — первая известная часть ключа, разделённого двоеточиями,
+точками или '|': 'feed_page', 'feed_count', 'template' (фрагменты
+{% cache %}), 'sorl-thumbnail' и так далее; остальные ключи считаются
+как 'other', чтобы число счётчиков и меток в /metrics/ не росло с
+числом ключей. Счётчики живут в памяти процесса. Внутри track() события
+дополнительно считаются для текущего запроса.
+"""
+import re
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+
+_counters = Counter()
+_lock = Lock()
+_tracked = ContextVar('cache_metrics_tracked', default=None)
+
+PREFIXES = frozenset({
+    'feed_page', 'feed_stale', 'feed_version', 'feed_count',
+    'post_fragment', 'lock', 'trending', 'template', 'sorl-thumbnail',
+    'django',
+})
+OTHER = 'other'
+SEPARATORS = re.compile(r'[:.|]')
+
+
+def key_prefix(key):
+    for part in SEPARATORS.split(str(key)):
+        if part in PREFIXES:
+            return part
+    return OTHER
+
+
+def record(key, event, amount=1):
+    with _lock:
+        _counters[(key_prefix(key), event)] += amount
+    tracked = _tracked.get()
+    if tracked is not None:
+        tracked[event] += amount
+
+
+@contextmanager
+def track():
+    """Counter {событие: количество} для кода внутри блока."""
+    tracked = Counter()
+    token = _tracked.set(tracked)
+    try:
+        yield tracked
+    finally:
+        _tracked.reset(token)
+
+
+def snapshot():
+    """Словарь {(префикс, событие): количество}."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
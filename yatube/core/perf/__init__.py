@@ -0,0 +1,7 @@
+"""Замеры запросов: время, запросы к БД, шаблоны, кэш и память.
+
+PerformanceMiddleware собирает RequestStats для выбранной доли
+запросов к представлениям из PERF_VIEW_MODULES, отдаёт их в заголовке
+Server-Timing и копит в реестре процесса, который представление
+core.views.metrics выводит в текстовом формате Prometheus.
+"""
@@ -0,0 +1,77 @@
+import random
+from functools import wraps
+
+from django.conf import settings
+
+from . import registry
+from .stats import collect, serving
+
+
+def perf_exempt(view):
+    """Не замерять представление, например сам сбор показателей."""
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        return view(*args, **kwargs)
+    wrapped.perf_exempt = True
+    return wrapped
+
+
+def sampled(rate):
+    return rate >= 1 or random.random() < rate
+
+
+def server_timing(stats):
+    hits, misses = stats.cache_hits, stats.cache_misses
+    metrics = [
+        f'total;dur={stats.total * 1000:.1f}',
+        f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} '
+        f'queries, {stats.duplicates} duplicate"',
+        f'tpl;dur={stats.template_time * 1000:.1f}',
+        f'cache;desc="{hits} hits, {misses} misses"',
+    ]
+    if stats.peak_memory is not None:
+        metrics.append(f'mem;desc="{stats.peak_memory // 1024} KB"')
+    return ', '.join(metrics)
+
+
+class PerformanceMiddleware:
+    """Замеряет долю PERF_SAMPLE_RATE запросов к PERF_VIEW_MODULES.
+
+    Стоит первым в MIDDLEWARE, чтобы в замер попали запросы сессий и
+    аутентификации. Память замеряется у доли PERF_MEMORY_SAMPLE_RATE
+    замеряемых запросов: tracemalloc заметно замедляет Python.
+    Текущий запрос запоминается всегда: по нему журнал медленных
+    запросов (core.perf.slowlog) определяет представление.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with serving(request):
+            return self.measure(request)
+
+    def measure(self, request):
+        if not sampled(settings.PERF_SAMPLE_RATE):
+            return self.get_response(request)
+        request.perf_view = None
+        with collect(
+            memory=sampled(settings.PERF_MEMORY_SAMPLE_RATE)
+        ) as stats:
+            response = self.get_response(request)
+        if request.perf_view is None:
+            return response
+        registry.record(
+            request.perf_view, request.method, response.status_code, stats
+        )
+        if settings.PERF_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(stats)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not hasattr(request, 'perf_view'):
+            return
+        if getattr(view_func, 'perf_exempt', False):
+            return
+        if view_func.__module__ in settings.PERF_VIEW_MODULES:
+            request.perf_view = request.resolver_match.view_name
@@ -0,0 +1,162 @@
+"""Накопленные показатели запросов в памяти процесса.
+
+Ряды различаются представлением, методом и кодом ответа. При
+нескольких процессах каждый отдаёт свои значения, а суммирует их
+Prometheus.
+"""
+from threading import Lock
+
+from core.cache import metrics
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+# (имя, тип, описание, атрибут Series)
+SERIES = (
+    ('request_db_seconds', 'summary',
+     'Время запросов к БД', 'db_time'),
+    ('request_queries', 'summary',
+     'Число запросов к БД', 'queries'),
+    ('request_duplicate_queries', 'summary',
+     'Повторы одинаковых запросов к БД', 'duplicates'),
+    ('request_template_seconds', 'summary',
+     'Время отрисовки шаблонов', 'template_time'),
+)
+PREFIX = 'yatube_'
+
+_series = {}
+_lock = Lock()
+
+
+class Series:
+    def __init__(self):
+        self.count = 0
+        self.buckets = [0] * len(DURATION_BUCKETS)
+        self.total = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.duplicates = 0
+        self.template_time = 0.0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.memory_count = 0
+        self.memory_sum = 0
+        self.memory_max = 0
+
+    def add(self, stats):
+        self.count += 1
+        for index, bound in enumerate(DURATION_BUCKETS):
+            if stats.total <= bound:
+                self.buckets[index] += 1
+        self.total += stats.total
+        self.db_time += stats.db_time
+        self.queries += stats.queries
+        self.duplicates += stats.duplicates
+        self.template_time += stats.template_time
+        self.cache_hits += stats.cache_hits
+        self.cache_misses += stats.cache_misses
+        if stats.peak_memory is not None:
+            self.memory_count += 1
+            self.memory_sum += stats.peak_memory
+            self.memory_max = max(self.memory_max, stats.peak_memory)
+
+
+def record(view, method, status, stats):
+    with _lock:
+        _series.setdefault((view, method, status), Series()).add(stats)
+
+
+def reset():
+    with _lock:
+        _series.clear()
+
+
+def escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n'
+    )
+
+
+def labels(**values):
+    return '{' + ','.join(
+        f'{name}="{escape(value)}"' for name, value in values.items()
+    ) + '}'
+
+
+def header(name, kind, help_text):
+    return [f'# HELP {PREFIX}{name} {help_text}',
+            f'# TYPE {PREFIX}{name} {kind}']
+
+
+def render():
+    """Все ряды в текстовом формате Prometheus 0.0.4."""
+    with _lock:
+        series = sorted(
+            (key, vars(value).copy()) for key, value in _series.items()
+        )
+    lines = header(
+        'request_duration_seconds', 'histogram', 'Время ответа'
+    )
+    for (view, method, status), values in series:
+        label = dict(view=view, method=method, status=status)
+        for bound, count in zip(DURATION_BUCKETS, values['buckets']):
+            lines.append(
+                f'{PREFIX}request_duration_seconds_bucket'
+                f'{labels(**label, le=bound)} {count}'
+            )
+        lines += [
+            f'{PREFIX}request_duration_seconds_bucket'
+            f'{labels(**label, le="+Inf")} {values["count"]}',
+            f'{PREFIX}request_duration_seconds_sum{labels(**label)} '
+            f'{values["total"]}',
+            f'{PREFIX}request_duration_seconds_count{labels(**label)} '
+            f'{values["count"]}',
+        ]
+    for name, kind, help_text, attribute in SERIES:
+        lines += header(name, kind, help_text)
+        for (view, method, status), values in series:
+            label = labels(view=view, method=method, status=status)
+            lines += [
+                f'{PREFIX}{name}_sum{label} {values[attribute]}',
+                f'{PREFIX}{name}_count{label} {values["count"]}',
+            ]
+    for name, attribute, help_text in (
+        ('request_cache_hits_total', 'cache_hits', 'Попадания в кэш'),
+        ('request_cache_misses_total', 'cache_misses', 'Промахи кэша'),
+    ):
+        lines += header(name, 'counter', help_text)
+        for (view, method, status), values in series:
+            label = labels(view=view, method=method, status=status)
+            lines.append(f'{PREFIX}{name}{label} {values[attribute]}')
+    lines += header(
+        'request_peak_memory_bytes', 'summary',
+        'Пик памяти Python за запрос (выборочно)',
+    )
+    for (view, method, status), values in series:
+        label = labels(view=view, method=method, status=status)
+        lines += [
+            f'{PREFIX}request_peak_memory_bytes_sum{label} '
+            f'{values["memory_sum"]}',
+            f'{PREFIX}request_peak_memory_bytes_count{label} '
+            f'{values["memory_count"]}',
+        ]
+    lines += header(
+        'request_peak_memory_max_bytes', 'gauge',
+        'Наибольший замеренный пик памяти за запрос',
+    )
+    for (view, method, status), values in series:
+        label = labels(view=view, method=method, status=status)
+        lines.append(
+            f'{PREFIX}request_peak_memory_max_bytes{label} '
+            f'{values["memory_max"]}'
+        )
+    lines += header(
+        'cache_events_total', 'counter',
+        'События кэша по префиксам ключей',
+    )
+    for (prefix, event), count in sorted(metrics.snapshot().items()):
+        lines.append(
+            f'{PREFIX}cache_events_total'
+            f'{labels(prefix=prefix, event=event)} {count}'
+        )
+    return '\n'.join(lines) + '\n'
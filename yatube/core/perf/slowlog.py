@@ -0,0 +1,172 @@
+"""Журнал медленных запросов к БД.
+
+Обёртка выполнения запросов ставится на каждое соединение и замечает
+запросы дольше SLOW_QUERY_THRESHOLD секунд. Запросы одной формы
+(одинаковые после замены литералов и списков IN) сводятся в одну
+запись по отпечатку: число, суммарное и наибольшее время, план
+EXPLAIN, представления и шаблоны, из которых они выполнялись. План
+снимается не в медленном запросе, а при первом показе записи в
+журнале. Записи лежат в памяти процесса; при переполнении
+SLOW_QUERY_LOG_SIZE вытесняется та, что дольше всех не повторялась.
+Журнал виден в админке на странице slow-queries/.
+
+Обёртка стоит первой в списке обёрток соединения, вне стека, который
+снимает и ставит collect, поэтому соединение, открытое внутри
+collect, не сбивает порядок обёрток.
+"""
+import hashlib
+import logging
+import re
+from collections import Counter, OrderedDict
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from django.utils import timezone
+
+from .stats import location
+
+logger = logging.getLogger(__name__)
+
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b|%s")
+PLACEHOLDER_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+SPACES = re.compile(r'\s+')
+# Сколько разных представлений и шаблонов помнить для отпечатка.
+MAX_PLACES = 10
+
+_entries = OrderedDict()
+_lock = Lock()
+
+
+class Entry:
+    def __init__(self, fingerprint, shape):
+        self.fingerprint = fingerprint
+        self.shape = shape
+        self.sql = ''
+        self.params = ''
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_seen = None
+        self.plan = None
+        # (соединение, SQL, параметры) первого запроса для EXPLAIN.
+        self.sample = None
+        self.views = Counter()
+        self.templates = Counter()
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+    # Counter в шаблоне не годится: .most_common там — поиск ключа.
+    @property
+    def top_views(self):
+        return self.views.most_common()
+
+    @property
+    def top_templates(self):
+        return self.templates.most_common()
+
+    def add(self, sql, params, duration, view, template):
+        self.sql, self.params = sql, repr(params)
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last_seen = timezone.now()
+        for counter, place in (
+            (self.views, view), (self.templates, template),
+        ):
+            if place and (place in counter or len(counter) < MAX_PLACES):
+                counter[place] += 1
+
+    def explain(self):
+        """Снять план по сохранённому запросу, если его ещё нет."""
+        sample, self.sample = self.sample, None
+        if sample is not None and self.plan is None:
+            alias, sql, params = sample
+            self.plan = explain(connections[alias], sql, params)
+
+
+def shape(sql):
+    """SQL без литералов: одинаков у запросов, отличающихся значениями."""
+    sql = LITERALS.sub('?', sql)
+    sql = PLACEHOLDER_LISTS.sub('(...)', sql)
+    return SPACES.sub(' ', sql).strip()
+
+
+def fingerprint(sql):
+    normalized = shape(sql)
+    return hashlib.md5(normalized.encode()).hexdigest()[:16], normalized
+
+
+def explain(connection, sql, params):
+    """План запроса; курсор бэкенда минует обёртки и журнал запросов."""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    try:
+        connection.ensure_connection()
+        cursor = connection.create_cursor()
+        try:
+            cursor.execute(
+                f'{connection.ops.explain_query_prefix()} {sql}', params
+            )
+            return '\n'.join(str(row[-1]) for row in cursor.fetchall())
+        finally:
+            cursor.close()
+    except DatabaseError:
+        return None
+
+
+def record(connection, sql, params, many, duration):
+    key, normalized = fingerprint(sql)
+    view, template = location()
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            entry = _entries[key] = Entry(key, normalized)
+        _entries.move_to_end(key)
+        entry.add(sql, params, duration, view, template)
+        if entry.plan is None and entry.sample is None and not many:
+            entry.sample = (connection.alias, sql, params)
+        while len(_entries) > settings.SLOW_QUERY_LOG_SIZE:
+            _entries.popitem(last=False)
+    logger.warning(
+        'Медленный запрос %.1f мс (%s, %s): %s',
+        duration * 1000, view or '-', template or '-', normalized,
+    )
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    threshold = settings.SLOW_QUERY_THRESHOLD
+    if threshold is None:
+        return execute(sql, params, many, context)
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = perf_counter() - started
+        if duration >= threshold:
+            record(context['connection'], sql, params, many, duration)
+
+
+def install(connection, **kwargs):
+    """Поставить обёртку на соединение; приёмник connection_created."""
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, execute_wrapper)
+
+
+def entries(order='total'):
+    """Записи журнала, самые тяжёлые первыми, с планами запросов."""
+    with _lock:
+        result = list(_entries.values())
+    for entry in result:
+        entry.explain()
+    return sorted(
+        result, key=lambda entry: getattr(entry, order), reverse=True
+    )
+
+
+def reset():
+    with _lock:
+        _entries.clear()
@@ -0,0 +1,142 @@
+"""Сбор показателей одного запроса."""
+import tracemalloc
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from time import perf_counter
+
+from django.db import connections
+
+from core.cache import metrics
+
+_current = ContextVar('perf_request_stats', default=None)
+_request = ContextVar('perf_request', default=None)
+_templates = ContextVar('perf_templates', default=())
+
+
+class RequestStats:
+    def __init__(self):
+        self.total = 0.0
+        self.db_time = 0.0
+        self.queries = 0
+        self.statements = set()
+        self.duplicates = 0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache = None
+        self.peak_memory = None
+
+    @property
+    def cache_hits(self):
+        return self.cache['local_hit'] + self.cache['shared_hit']
+
+    @property
+    def cache_misses(self):
+        return self.cache['miss']
+
+    def add_query(self, sql, params, duration):
+        self.queries += 1
+        self.db_time += duration
+        statement = (sql, repr(params))
+        if statement in self.statements:
+            self.duplicates += 1
+        else:
+            self.statements.add(statement)
+
+
+def current():
+    """RequestStats текущего запроса или None, если он не замеряется."""
+    return _current.get()
+
+
+@contextmanager
+def serving(request):
+    """Запомнить обрабатываемый запрос для location()."""
+    token = _request.set(request)
+    try:
+        yield
+    finally:
+        _request.reset(token)
+
+
+def location():
+    """(представление, шаблон), в которых сейчас выполняется код."""
+    request = _request.get()
+    view = None
+    if request is not None:
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else request.path
+    templates = _templates.get()
+    return view, templates[-1] if templates else None
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    started = perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.add_query(sql, params, perf_counter() - started)
+
+
+@contextmanager
+def wrapped(connection):
+    """Поставить execute_wrapper на время блока.
+
+    Обёртка снимается по значению, а не с конца списка, как в
+    connection.execute_wrapper: за время блока соединение может открыться
+    и получить свои обёртки.
+    """
+    connection.execute_wrappers.append(execute_wrapper)
+    try:
+        yield
+    finally:
+        connection.execute_wrappers.remove(execute_wrapper)
+
+
+@contextmanager
+def timed_template(name):
+    """Время отрисовки шаблона; вложенные отрисовки не суммируются."""
+    token = _templates.set(_templates.get() + (name,))
+    stats = _current.get()
+    started = perf_counter()
+    if stats is not None:
+        stats.template_depth += 1
+    try:
+        yield
+    finally:
+        _templates.reset(token)
+        if stats is not None:
+            stats.template_depth -= 1
+            if not stats.template_depth:
+                stats.template_time += perf_counter() - started
+
+
+@contextmanager
+def collect(memory=False):
+    """Замерить код внутри блока; memory включает tracemalloc.
+
+    tracemalloc общий для процесса, поэтому при параллельных запросах
+    пик памяти приблизительный, а если трассировку уже включил кто-то
+    другой, память не замеряется.
+    """
+    stats = RequestStats()
+    token = _current.set(stats)
+    trace = memory and not tracemalloc.is_tracing()
+    started = perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(wrapped(connection))
+            stats.cache = stack.enter_context(metrics.track())
+            if trace:
+                tracemalloc.start()
+            try:
+                yield stats
+            finally:
+                if trace:
+                    stats.peak_memory = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+    finally:
+        stats.total = perf_counter() - started
+        _current.reset(token)
@@ -0,0 +1,21 @@
+"""Шаблонный движок Django с замером времени отрисовки.
+
+Имя отрисовываемого шаблона попадает в журнал медленных запросов.
+"""
+from django.template.backends import django
+
+from .stats import timed_template
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        with timed_template(self.template.name):
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
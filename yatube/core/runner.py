@@ -0,0 +1,25 @@
+import logging
+
+from django.test.runner import DiscoverRunner
+
+slowlog_logger = logging.getLogger('core.perf.slowlog')
+
+
+class QuietTestRunner(DiscoverRunner):
+    """Тесты без предупреждений журнала медленных запросов в выводе.
+
+    Первые запросы к только что созданной тестовой базе часто дольше
+    SLOW_QUERY_THRESHOLD. Запросы по-прежнему попадают в журнал, а
+    assertLogs ставит свой обработчик и видит предупреждения.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.slowlog_handler = logging.NullHandler()
+        slowlog_logger.addHandler(self.slowlog_handler)
+        slowlog_logger.propagate = False
+
+    def teardown_test_environment(self, **kwargs):
+        slowlog_logger.removeHandler(self.slowlog_handler)
+        slowlog_logger.propagate = True
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,401 @@
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache, caches
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from posts.models import Post
+
+from .cache import flight, metrics
+from .cache.backends import SQLiteCache
+from .perf import registry, slowlog
+from .perf.stats import collect, timed_template
+
+TIERED_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.backends.TieredCache',
+        'LOCATION': 'tiered-test',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_TIMEOUT': 60,
+            'LOCAL_MAX_ENTRIES': 2,
+            'LOCAL_SKIP_PREFIXES': ['feed_version:'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tiered-test-shared',
+    },
+}
+
+
+class SQLiteCacheTest(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {})
+
+    def test_basic_operations(self):
+        """Запись, чтение, add, incr и удаление."""
+        self.cache.set('feed_page:1', {'posts': [1, 2]})
+        self.assertEqual(self.cache.get('feed_page:1'), {'posts': [1, 2]})
+        self.assertFalse(self.cache.add('feed_page:1', 'другое'))
+        self.assertTrue(self.cache.add('feed_version:all', 1))
+        self.assertEqual(self.cache.incr('feed_version:all'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('feed_version:missing')
+        self.assertEqual(
+            self.cache.get_many(['feed_page:1', 'feed_version:all', 'none']),
+            {'feed_page:1': {'posts': [1, 2]}, 'feed_version:all': 2},
+        )
+        self.cache.delete('feed_page:1')
+        self.assertIsNone(self.cache.get('feed_page:1'))
+
+    def test_expiry(self):
+        """Устаревшая запись не читается и не мешает add."""
+        self.cache.set('feed_page:1', 'старое', 0.01)
+        time.sleep(0.02)
+        self.assertIsNone(self.cache.get('feed_page:1'))
+        self.assertTrue(self.cache.add('feed_page:1', 'новое'))
+
+    def test_shared_between_instances(self):
+        """Два экземпляра с одним файлом видят записи друг друга."""
+        other = SQLiteCache(self.location, {})
+        self.cache.set('feed_page:1', 'общее')
+        self.assertEqual(other.get('feed_page:1'), 'общее')
+
+    def test_cull(self):
+        """Лишние записи сверх MAX_ENTRIES удаляются."""
+        cache = SQLiteCache(
+            self.location, {'OPTIONS': {'MAX_ENTRIES': 10}}
+        )
+        cache.set_many({f'key:{number}': number for number in range(20)})
+        cache.cull()
+        count = cache.connection.execute('SELECT COUNT(*) FROM cache')
+        self.assertLessEqual(count.fetchone()[0], 10)
+
+    def test_cull_keeps_persistent(self):
+        """Вечные записи вытесняются последними."""
+        cache = SQLiteCache(
+            self.location, {'OPTIONS': {'MAX_ENTRIES': 10}}
+        )
+        cache.set('lock:forever', 1, timeout=None)
+        cache.set_many({f'key:{number}': number for number in range(20)})
+        cache.cull()
+        self.assertEqual(cache.get('lock:forever'), 1)
+
+
+class MetricsTest(SimpleTestCase):
+    def test_key_prefix(self):
+        """Метки метрик берутся из фиксированного набора префиксов."""
+        for key, prefix in (
+            ('feed_page:all:1:2', 'feed_page'),
+            (':1:feed_count:author:5', 'feed_count'),
+            ('template.cache.post_card.0123abcd', 'template'),
+            ('sorl-thumbnail||image||0123abcd', 'sorl-thumbnail'),
+            ('django.contrib.sessions.cache0123', 'django'),
+            ('user:12345:profile', 'other'),
+        ):
+            with self.subTest(key=key):
+                self.assertEqual(metrics.key_prefix(key), prefix)
+
+
+@override_settings(CACHES=TIERED_CACHES)
+class TieredCacheTest(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+        metrics.reset()
+
+    def test_local_tier(self):
+        """Повторное чтение обслуживает локальный уровень."""
+        self.cache.set('feed_page:1', 'страница')
+        self.shared.delete('feed_page:1')
+        self.assertEqual(self.cache.get('feed_page:1'), 'страница')
+        self.assertEqual(
+            metrics.snapshot(), {('feed_page', 'local_hit'): 1}
+        )
+
+    def test_shared_tier(self):
+        """Запись другого процесса читается из общего уровня."""
+        self.shared.set('feed_page:1', 'страница')
+        self.assertEqual(self.cache.get('feed_page:1'), 'страница')
+        self.assertEqual(self.cache.get('feed_page:2'), None)
+        self.assertEqual(metrics.snapshot(), {
+            ('feed_page', 'shared_hit'): 1,
+            ('feed_page', 'miss'): 1,
+        })
+
+    def test_skip_prefixes(self):
+        """Версии лент всегда читаются из общего уровня."""
+        self.cache.set('feed_version:all', 1)
+        self.shared.incr('feed_version:all')
+        self.assertEqual(self.cache.get('feed_version:all'), 2)
+
+    def test_lru(self):
+        """Локальный уровень вытесняет давно прочитанные записи."""
+        for number in range(3):
+            self.cache.set(f'feed_page:{number}', number)
+        self.shared.clear()
+        self.assertIsNone(self.cache.get('feed_page:0'))
+        self.assertEqual(
+            self.cache.get_many(['feed_page:1', 'feed_page:2']),
+            {'feed_page:1': 1, 'feed_page:2': 2},
+        )
+
+    def test_delete(self):
+        """Удаление действует на оба уровня."""
+        self.cache.set('feed_page:1', 'страница')
+        self.cache.delete('feed_page:1')
+        self.assertIsNone(self.cache.get('feed_page:1'))
+        self.assertIsNone(self.shared.get('feed_page:1'))
+
+
+class FlightTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.calls = 0
+
+    def compute(self):
+        self.calls += 1
+        return f'страница {self.calls}'
+
+    def test_computes_once(self):
+        """Сохранённое значение не пересчитывается."""
+        for _ in range(3):
+            value = flight.fetch('feed_page:1', self.compute, 60)
+        self.assertEqual(value, 'страница 1')
+        self.assertEqual(self.calls, 1)
+        self.assertIsNone(cache.get(flight.LOCK_KEY.format('feed_page:1')))
+
+    def test_stale_while_locked(self):
+        """Пока другой процесс пересчитывает, отдаётся старая копия."""
+        flight.fetch('feed_page:1', self.compute, 60, stale_key='stale:1')
+        cache.add(flight.LOCK_KEY.format('feed_page:2'), 1)
+        value = flight.fetch(
+            'feed_page:2', self.compute, 60, stale_key='stale:1'
+        )
+        self.assertEqual(value, 'страница 1')
+        self.assertEqual(self.calls, 1)
+
+    @override_settings(CACHE_LOCK_WAIT=0.1)
+    def test_locked_without_stale(self):
+        """Без старой копии запрос ждёт и считает сам."""
+        cache.add(flight.LOCK_KEY.format('feed_page:1'), 1)
+        value = flight.fetch('feed_page:1', self.compute, 60)
+        self.assertEqual(value, 'страница 1')
+        self.assertIsNone(cache.get('feed_page:1'))
+
+    def test_not_cacheable(self):
+        """Значение, отклонённое cacheable, не сохраняется."""
+        for _ in range(2):
+            flight.fetch(
+                'feed_page:1', self.compute, 60, cacheable=lambda _: False
+            )
+        self.assertEqual(self.calls, 2)
+
+    @override_settings(CACHE_EARLY_EXPIRATION_BETA=10 ** 6)
+    def test_early_expiration(self):
+        """Запись пересчитывается до истечения TTL."""
+        cache.set('feed_page:1', ('старая', time.time() + 60, 1))
+        value = flight.fetch('feed_page:1', self.compute, 60)
+        self.assertEqual(value, 'страница 1')
+
+
+@override_settings(PERF_SAMPLE_RATE=1, PERF_MEMORY_SAMPLE_RATE=1,
+                   PERF_SERVER_TIMING=True, METRICS_TOKEN='secret')
+class PerformanceTest(TestCase):
+    def setUp(self):
+        registry.reset()
+        cache.clear()
+
+    def test_collect(self):
+        """Запросы, повторы, кэш и память считаются внутри collect."""
+        with collect(memory=True) as stats:
+            for _ in range(3):
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            cache.get('feed_page:1')
+        self.assertEqual(stats.queries, 3)
+        self.assertEqual(stats.duplicates, 2)
+        self.assertEqual(stats.cache_misses, 1)
+        self.assertGreater(stats.peak_memory, 0)
+        self.assertGreater(stats.total, 0)
+
+    def test_collect_on_new_connection(self):
+        """Соединение, открытое внутри collect, не копит обёртки."""
+        wrappers = connection.execute_wrappers
+        self.assertEqual(wrappers, [slowlog.execute_wrapper])
+        for _ in range(2):
+            del wrappers[:]
+            with collect() as stats:
+                # Так обёртку ставит connection_created при подключении.
+                connection_created.send(
+                    sender=connection.__class__, connection=connection
+                )
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+            self.assertEqual(stats.queries, 1)
+            self.assertEqual(wrappers, [slowlog.execute_wrapper])
+
+    def test_server_timing(self):
+        """Замеряемые представления получают заголовок Server-Timing."""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for metric in ('total;dur=', 'db;dur=', 'tpl;dur=', 'cache;desc=',
+                       'mem;desc='):
+            with self.subTest(metric=metric):
+                self.assertIn(metric, timing)
+        self.assertNotIn(
+            'Server-Timing', self.client.get(reverse('about:author'))
+        )
+
+    @override_settings(PERF_SAMPLE_RATE=0)
+    def test_sampling(self):
+        """Запросы вне выборки не замеряются."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertNotIn('posts:index', registry.render())
+
+    def test_metrics_endpoint(self):
+        """Показатели отдаются в формате Prometheus."""
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        response = self.client.get(
+            reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret'
+        )
+        text = response.content.decode()
+        label = '{view="posts:index",method="GET",status="200"}'
+        self.assertIn(f'yatube_request_duration_seconds_count{label} 2', text)
+        self.assertIn(f'yatube_request_queries_count{label} 2', text)
+        self.assertIn('yatube_request_cache_hits_total', text)
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', text)
+        self.assertNotIn('view="metrics"', text)
+
+    def test_metrics_forbidden(self):
+        """Без токена показатели доступны только администраторам."""
+        url = reverse('metrics')
+        for token, status in (
+            (None, 403), ('Bearer wrong', 403), ('Bearer secret', 200)
+        ):
+            with self.subTest(token=token):
+                headers = {'HTTP_AUTHORIZATION': token} if token else {}
+                response = self.client.get(url, **headers)
+                self.assertEqual(response.status_code, status)
+        with self.settings(METRICS_TOKEN=None):
+            self.assertEqual(
+                self.client.get(url, HTTP_AUTHORIZATION='Bearer None')
+                .status_code,
+                403,
+            )
+            self.client.force_login(get_user_model().objects.create_user(
+                username='admin', is_staff=True
+            ))
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class SlowQueryLogTest(TestCase):
+    def setUp(self):
+        slowlog.reset()
+        cache.clear()
+
+    @contextmanager
+    def slow(self):
+        """Считать медленными все запросы внутри блока."""
+        with self.settings(SLOW_QUERY_THRESHOLD=0):
+            with self.assertLogs('core.perf.slowlog', 'WARNING'):
+                yield
+
+    def query(self, sql, params=()):
+        with self.slow():
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    def test_shape(self):
+        """Литералы и списки IN не влияют на форму запроса."""
+        self.assertEqual(
+            slowlog.shape(
+                "SELECT * FROM t1 WHERE id IN (%s, %s, %s) AND name = 'a''b'"
+                " AND   n > 10"
+            ),
+            'SELECT * FROM t1 WHERE id IN (...) AND name = ? AND n > ?',
+        )
+        self.assertEqual(
+            slowlog.fingerprint('SELECT 1')[0],
+            slowlog.fingerprint('SELECT  2')[0],
+        )
+
+    def test_aggregates_by_fingerprint(self):
+        """Одинаковые по форме запросы сводятся в одну запись с планом."""
+        with mock.patch.object(
+            slowlog, 'explain', wraps=slowlog.explain
+        ) as explain:
+            for post_id in (1, 2):
+                self.query(
+                    'SELECT id FROM posts_post WHERE id = %s', [post_id]
+                )
+            # План снимается при показе журнала, а не в медленном запросе.
+            explain.assert_not_called()
+            entry, = slowlog.entries()
+            slowlog.entries()
+        explain.assert_called_once()
+        self.assertEqual(entry.count, 2)
+        self.assertEqual(entry.params, '[2]')
+        self.assertIn('posts_post', entry.plan)
+
+    @override_settings(SLOW_QUERY_LOG_SIZE=2)
+    def test_bounded(self):
+        """Дольше всех не повторявшаяся форма вытесняется."""
+        self.query('SELECT 1')
+        self.query('SELECT 1, 2')
+        self.query('SELECT 1')
+        self.query('SELECT 1, 2, 3')
+        self.assertEqual(
+            {entry.shape for entry in slowlog.entries()},
+            {'SELECT ?', 'SELECT ?, ?, ?'},
+        )
+
+    def test_view_and_template(self):
+        """Запись помнит представление и шаблон, выполнившие запрос."""
+        author = get_user_model().objects.create_user('author')
+        Post.objects.create(author=author, text='Пост')
+        with self.slow():
+            self.client.get(reverse('posts:index'))
+        views = set()
+        for entry in slowlog.entries():
+            views.update(entry.views)
+        self.assertIn('posts:index', views)
+        slowlog.reset()
+        with timed_template('posts/index.html'):
+            self.query('SELECT 1')
+        entry, = slowlog.entries()
+        self.assertEqual(entry.templates, {'posts/index.html': 1})
+
+    def test_admin_page(self):
+        """Журнал виден сотрудникам в админке."""
+        staff = get_user_model().objects.create_user(
+            'staff', is_staff=True
+        )
+        self.client.force_login(staff)
+        with self.slow():
+            response = self.client.get(reverse('admin:index'))
+            self.assertContains(response, reverse('slow_queries'))
+            response = self.client.get(reverse('slow_queries'))
+        self.assertContains(response, slowlog.entries()[0].fingerprint)
+        with self.slow():
+            self.client.post(reverse('slow_queries'))
+        self.assertFalse(
+            [e for e in slowlog.entries() if 'posts_post' in e.shape]
+        )
+        self.client.logout()
+        response = self.client.get(reverse('slow_queries'))
+        self.assertEqual(response.status_code, 302)
@@ -1,4 +1,14 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import redirect, render
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_http_methods
+
+from .perf import registry, slowlog
+from .perf.middleware import perf_exempt
 
 
 def page_not_found(request, exception):
@@ -15,3 +25,52 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def has_metrics_token(request):
+    token = settings.METRICS_TOKEN
+    return bool(token) and constant_time_compare(
+        request.META.get('HTTP_AUTHORIZATION', ''), f'Bearer {token}'
+    )
+
+
+@perf_exempt
+def metrics(request):
+    """Показатели запросов в формате Prometheus.
+
+    Доступны администраторам и сборщику с токеном METRICS_TOKEN. Адресу
+    клиента не доверяем: за прокси он у всех запросов один.
+    """
+    if not (request.user.is_staff or has_metrics_token(request)):
+        raise PermissionDenied
+    return HttpResponse(
+        registry.render(), content_type='text/plain; version=0.0.4'
+    )
+
+
+SLOW_QUERY_ORDERS = (
+    ('total', 'всего'), ('max', 'максимум'), ('average', 'среднее'),
+    ('count', 'число'), ('last_seen', 'последние'),
+)
+
+
+@perf_exempt
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def slow_queries(request):
+    """Журнал медленных запросов в оформлении админки."""
+    if request.method == 'POST':
+        slowlog.reset()
+        return redirect('slow_queries')
+    order = request.GET.get('o')
+    if order not in dict(SLOW_QUERY_ORDERS):
+        order = 'total'
+    return render(request, 'admin/slow_queries.html', {
+        **admin.site.each_context(request),
+        'title': 'Медленные запросы',
+        'entries': slowlog.entries(order),
+        'order': order,
+        'orders': SLOW_QUERY_ORDERS,
+        'threshold': settings.SLOW_QUERY_THRESHOLD,
+        'size': settings.SLOW_QUERY_LOG_SIZE,
+    })
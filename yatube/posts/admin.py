@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Comment, Follow, Group, Post
+from .search import search_ids
 
 
 @admin.register(Post)
@@ -11,6 +12,12 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по полнотекстовому индексу вместо LIKE по всей таблице.
+        if not search_term:
+            return queryset, False
+        return queryset.filter(id__in=search_ids(search_term)), False
+
 
 @admin.register(Group)
 class GroupAdmin(admin.ModelAdmin):
@@ -0,0 +1,81 @@
+"""Кэш страниц и фрагментов с версиями лент.
+
+Ключ кэша включает текущую версию каждой ленты, от которой зависит
+страница ('all', 'group:<slug>', 'author:<username>', 'post:<id>').
+Сигналы Post, Comment и Follow увеличивают версию затронутых лент,
+поэтому старые записи просто перестают читаться и доживают свой TTL,
+а время жизни кэша можно держать большим.
+
+Страницы пересчитываются через core.cache.flight: пока один запрос
+рендерит новую версию, остальные получают предыдущую.
+"""
+import time
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+
+from core.cache import flight
+
+VERSION_KEY = 'feed_version:{}'
+
+
+def new_version():
+    # Версия от времени не совпадёт со старой, даже если ключ версии
+    # был вытеснен из кэша.
+    return time.time_ns()
+
+
+def get_versions(*feeds):
+    keys = [VERSION_KEY.format(feed) for feed in feeds]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, new_version(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump(*feeds):
+    for feed in feeds:
+        key = VERSION_KEY.format(feed)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, new_version(), None)
+
+
+def page_keys(request, feeds):
+    """Ключ текущей версии страницы и ключ её последней копии."""
+    versions = '.'.join(map(str, get_versions(*feeds)))
+    url = md5(force_bytes(request.get_full_path())).hexdigest()
+    page = f'{request.user.pk or 0}:{url}'
+    return f'feed_page:{page}:{versions}', f'feed_stale:{page}'
+
+
+def cache_feed(*feeds):
+    """Кэшировать GET-ответ view до изменения одной из лент.
+
+    Имена лент форматируются аргументами view, например
+    cache_feed('group:{slug}'). Страница кэшируется отдельно для
+    каждого пользователя и общей записью для анонимных.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            key, stale_key = page_keys(
+                request, [feed.format(**kwargs) for feed in feeds]
+            )
+            return flight.fetch(
+                key,
+                lambda: view(request, *args, **kwargs),
+                settings.FEED_CACHE_TIMEOUT,
+                stale_key=stale_key,
+                cacheable=lambda response: response.status_code == 200,
+            )
+        return wrapper
+    return decorator
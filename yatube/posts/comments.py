@@ -0,0 +1,146 @@
+"""Страницы комментариев поста с деревом ответов.
+
+По курсору (см. CommentPaginator) листаются только корневые
+комментарии, ответы на них приходят одним запросом по root и
+выстраиваются в порядке обхода дерева: после комментария идут ответы
+на него, каждый со своими ответами. Каждая ветка показывает не больше
+REPLIES_ON_PAGE первых ответов; остальные подгружаются страницами
+ветки по ссылке more_replies после её последнего показанного ответа.
+"""
+from django.conf import settings
+from django.db import connection
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+from django.urls import reverse
+from django.utils.functional import cached_property
+
+from .models import Comment
+from .utils import COMMENTS_ON_PAGE, REPLIES_ON_PAGE, CommentPaginator
+
+
+def thread(roots, replies):
+    """Корневые комментарии и ответы в порядке обхода дерева."""
+    children = {}
+    for reply in replies:
+        children.setdefault(reply.parent_id, []).append(reply)
+    ordered = []
+    stack = list(reversed(roots))
+    while stack:
+        comment = stack.pop()
+        ordered.append(comment)
+        stack.extend(reversed(children.get(comment.id, ())))
+    return ordered
+
+
+def first_replies(roots, count):
+    """Не больше count первых ответов каждой ветки одним запросом.
+
+    Ответ создаётся позже своего родителя, поэтому у каждого из первых
+    ответов ветки родитель тоже среди них.
+    """
+    ranked = Comment.objects.filter(root__in=roots).annotate(
+        position=Window(
+            RowNumber(), partition_by=[F('root')],
+            order_by=[F('created').asc(), F('id').asc()],
+        )
+    ).values('id', 'position')
+    sql, params = ranked.query.sql_with_params()
+    # filter(id__in=RawSQL(...)) обернул бы подзапрос в лишние скобки,
+    # и SQLite прочитал бы его как скалярный.
+    table = connection.ops.quote_name(Comment._meta.db_table)
+    return Comment.objects.extra(
+        where=[f'{table}.id IN (SELECT id FROM ({sql}) WHERE position <= %s)'],
+        params=[*params, count],
+    ).select_related('author').order_by('created', 'id')
+
+
+def replies_url(post_id, root_id, cursor):
+    url = reverse('posts:post_comments', args=[post_id])
+    return f'{url}?root={root_id}&cursor={cursor}'
+
+
+class CommentPage:
+    """Страница комментариев, загружаемая при первом обращении.
+
+    С root это следующая страница ответов ветки: ответы идут по
+    времени создания, без перестановки в порядок обхода дерева.
+    Шаблон обращается к странице внутри {% cache %}, поэтому при
+    попадании в кэш запросов к комментариям нет.
+    """
+
+    def __init__(self, post_id, cursor=None, root=None):
+        self.post_id = post_id
+        self.cursor = cursor
+        self.root = root
+
+    @cached_property
+    def page(self):
+        if self.root is not None:
+            replies = Comment.objects.filter(
+                post=self.post_id, root=self.root
+            ).select_related('author')
+            return CommentPaginator(replies, REPLIES_ON_PAGE).get_cursor_page(
+                self.cursor
+            )
+        roots = Comment.objects.filter(
+            post=self.post_id, root=None
+        ).select_related('author')
+        return CommentPaginator(roots, COMMENTS_ON_PAGE).get_cursor_page(
+            self.cursor
+        )
+
+    @property
+    def next_cursor(self):
+        return self.page.next_cursor
+
+    @property
+    def next_url(self):
+        if self.next_cursor is None:
+            return None
+        if self.root is not None:
+            return replies_url(self.post_id, self.root, self.next_cursor)
+        url = reverse('posts:post_comments', args=[self.post_id])
+        return f'{url}?cursor={self.next_cursor}'
+
+    @cached_property
+    def comments(self):
+        if self.root is not None:
+            return list(self.page.object_list)
+        roots = self.page.object_list
+        if not roots or settings.COMMENT_MAX_DEPTH <= 0:
+            return list(roots)
+        by_root = {}
+        for reply in first_replies(roots, REPLIES_ON_PAGE + 1):
+            by_root.setdefault(reply.root_id, []).append(reply)
+        replies, more = [], {}
+        for root_id, shown in by_root.items():
+            if len(shown) > REPLIES_ON_PAGE:
+                shown = shown[:REPLIES_ON_PAGE]
+                cursor = CommentPaginator(
+                    Comment.objects.none(), REPLIES_ON_PAGE
+                ).make_cursor(shown[-1], 2)
+                more[root_id] = replies_url(self.post_id, root_id, cursor)
+            replies.extend(shown)
+        comments = thread(roots, replies)
+        # Ссылка на остальные ответы — после последнего ответа ветки.
+        for position, comment in enumerate(comments):
+            root_id = comment.root_id or comment.id
+            following = comments[position + 1:position + 2]
+            if root_id in more and (
+                not following or following[0].root_id is None
+            ):
+                comment.more_replies = more[root_id]
+        return comments
+
+
+def serialize(comment):
+    return {
+        'id': comment.id,
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+        'author': comment.author.username,
+        'author_url': reverse('posts:profile', args=[comment.author.username]),
+        'text': comment.text,
+        'created': comment.created.isoformat(),
+        'more_replies': getattr(comment, 'more_replies', None),
+    }
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from .models import AuthorStats, FeedCounter
+
+
+class ExactCounter:
+    """Точный COUNT(*) по выборке на каждый запрос."""
+
+    def count(self, queryset):
+        return queryset.count()
+
+
+class CachedCounter:
+    """COUNT(*), закэшированный на POSTS_COUNT_CACHE_TIMEOUT секунд."""
+
+    def __init__(self, key, timeout=None):
+        self.key = f'feed_count:{key}'
+        self.timeout = timeout or settings.POSTS_COUNT_CACHE_TIMEOUT
+
+    def count(self, queryset):
+        value = cache.get(self.key)
+        if value is None:
+            value = queryset.count()
+            cache.set(self.key, value, self.timeout)
+        return value
+
+
+class TableCounter:
+    """Счётчик из таблицы FeedCounter, который ведут сигналы Post."""
+
+    def __init__(self, feed, object_id=0):
+        self.feed = feed
+        self.object_id = object_id
+
+    def count(self, queryset):
+        return FeedCounter.get_value(self.feed, self.object_id)
+
+
+class AuthorCounter:
+    """Счётчик автора из AuthorStats, по умолчанию число постов."""
+
+    def __init__(self, author_id, field='posts'):
+        self.author_id = author_id
+        self.field = field
+
+    def count(self, queryset):
+        return getattr(AuthorStats.get_for(self.author_id), self.field)
+
+
+def feed_counter(feed, object_id=0):
+    strategy = settings.POSTS_COUNT_STRATEGY
+    if strategy == 'exact':
+        return ExactCounter()
+    if strategy == 'table' and feed == 'author':
+        return AuthorCounter(object_id)
+    if strategy == 'table' and feed in dict(FeedCounter.FEEDS):
+        return TableCounter(feed, object_id)
+    return CachedCounter(f'{feed}:{object_id}')
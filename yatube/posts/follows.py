@@ -0,0 +1,80 @@
+"""Массовые подписки для импорта графа подписок.
+
+bulk_follow записывает пары (подписчик, автор) пачками: каждая пачка —
+одна транзакция, уже существующие подписки и подписки на себя
+пропускаются. Сигналы при этом не отправляются, поэтому производные
+данные обновляются на пачку целиком: статистика затронутых
+пользователей пересчитывается до дополнения лент, чтобы посты авторов,
+ставших популярными, не раздавались; ленты подписчиков дополняются
+постами новых авторов, посты авторов получают вес подписок в
+популярном, версии страниц авторов сдвигаются.
+"""
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+
+from . import timeline, trending
+from .caching import bump
+from .models import AuthorStats, Follow
+
+User = get_user_model()
+
+BATCH_SIZE = 5000
+
+
+def batches(edges, size):
+    batch = []
+    for edge in edges:
+        batch.append(edge)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def bulk_follow(edges, batch_size=BATCH_SIZE):
+    """Создать подписки из пар id (user, author); вернуть (создано, пропущено).
+
+    Пользователи должны существовать.
+    """
+    created = skipped = 0
+    for batch in batches(edges, batch_size):
+        with transaction.atomic():
+            added = follow_batch(batch)
+        created += added
+        skipped += len(batch) - added
+    return created, skipped
+
+
+def follow_batch(edges):
+    edges = {(user, author) for user, author in edges if user != author}
+    if not edges:
+        return 0
+    existing = set(Follow.objects.filter(
+        user__in={user for user, _ in edges},
+        author__in={author for _, author in edges},
+    ).values_list('user_id', 'author_id'))
+    new = edges - existing
+    Follow.objects.bulk_create(
+        (Follow(user_id=user, author_id=author) for user, author in new),
+        ignore_conflicts=True,
+    )
+    authors_by_user = defaultdict(list)
+    for user, author in new:
+        authors_by_user[user].append(author)
+    followers = Counter(author for _, author in new)
+    # Профили подписчиков тоже меняются: подписки и взаимные подписки.
+    users = set(followers) | set(authors_by_user)
+    AuthorStats.reset_many(users)
+    for user, user_authors in authors_by_user.items():
+        timeline.backfill_many(user, user_authors)
+    for author, count in followers.items():
+        trending.author_followed(author, count)
+    bump(*(
+        f'author:{username}' for username in User.objects.filter(
+            pk__in=users
+        ).values_list('username', flat=True)
+    ))
+    return len(new)
@@ -1,4 +1,6 @@
 from django import forms
+from django.conf import settings
+from django.template.defaultfilters import filesizeformat
 
 from .models import Comment, Follow, Post
 
@@ -18,6 +20,15 @@ class PostForm(forms.ModelForm):
             'image': 'Изображение',
         }
 
+    def clean_image(self):
+        image = self.cleaned_data['image']
+        limit = settings.POST_IMAGE_MAX_UPLOAD_SIZE
+        if image and image.size > limit:
+            raise forms.ValidationError(
+                f'Размер файла больше {filesizeformat(limit)}'
+            )
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
@@ -0,0 +1,73 @@
+"""Кэш отрендеренных карточек постов (single_post.html).
+
+Ключ включает id поста, время его изменения и вариант карточки, поэтому
+правка поста делает недействительной только его карточку. Вместе с
+карточкой хранятся версии имени автора и названия группы (name_feeds):
+после переименования карточка не совпадает с ними и рендерится заново.
+Карточки страницы читаются одним get_many, недостающие рендерятся и
+сохраняются одним set_many.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .caching import get_versions
+
+TEMPLATE = 'posts/includes/single_post.html'
+FRAGMENT_KEY = 'post_fragment:{}:{}:{}'
+VARIANTS = ('feed', 'profile', 'group')
+
+
+def variant_for(is_profile=False, is_group=False):
+    if is_profile:
+        return 'profile'
+    if is_group:
+        return 'group'
+    return 'feed'
+
+
+def fragment_key(post_id, updated_at, variant):
+    return FRAGMENT_KEY.format(post_id, updated_at.timestamp(), variant)
+
+
+def name_feeds(post):
+    """Версии, которые сбрасываются при переименовании автора и группы."""
+    feeds = [f'name:user:{post.author_id}']
+    if post.group_id is not None:
+        feeds.append(f'name:group:{post.group_id}')
+    return feeds
+
+
+def render_posts(posts, variant='feed'):
+    """Пары (пост, html карточки) для постов страницы."""
+    posts = list(posts)
+    feeds = sorted({feed for post in posts for feed in name_feeds(post)})
+    versions = dict(zip(feeds, get_versions(*feeds)))
+    keys = [fragment_key(post.id, post.updated_at, variant) for post in posts]
+    fragments = cache.get_many(keys)
+    missing = {}
+    for key, post in zip(keys, posts):
+        names = [versions[feed] for feed in name_feeds(post)]
+        cached = fragments.get(key)
+        if isinstance(cached, tuple) and cached[0] == names:
+            fragments[key] = cached[1]
+            continue
+        fragments[key] = render_to_string(TEMPLATE, {
+            'post': post,
+            'is_profile': variant == 'profile',
+            'is_group': variant == 'group',
+        })
+        missing[key] = (names, fragments[key])
+    if missing:
+        cache.set_many(missing, settings.POST_FRAGMENT_TIMEOUT)
+    return [
+        (post, mark_safe(fragments[key])) for key, post in zip(keys, posts)
+    ]
+
+
+def forget(post_id, updated_at):
+    """Удалить карточки поста в версии updated_at."""
+    cache.delete_many(
+        [fragment_key(post_id, updated_at, variant) for variant in VARIANTS]
+    )
@@ -0,0 +1,80 @@
+"""Приём загруженных картинок постов.
+
+Перед сохранением картинка уменьшается до POST_IMAGE_MAX_SIDE, теряет
+EXIF (ориентация применяется к пикселям) и пересохраняется:
+фотографии — в progressive JPEG, остальное — в PNG. Анимированные GIF,
+PNG и WebP копируются как есть, у многокадровых фото (MPO) остаётся
+первый кадр. Одинаковые результаты хранятся одним файлом
+(см. posts.storage). Загрузка читается и пишется кусками, результат
+держится в памяти только до FILE_UPLOAD_MAX_MEMORY_SIZE.
+"""
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 85
+# Форматы, которые сохраняются как фотографии.
+PHOTO_FORMATS = ('JPEG', 'MPO', 'WEBP', 'HEIF', 'TIFF')
+# Форматы, анимация которых сохраняется копированием файла. Pillow
+# считает анимированными и MPO (стереопары, серии кадров камеры).
+ANIMATED_FORMATS = ('GIF', 'PNG', 'WEBP')
+CHUNK_SIZE = 64 * 1024
+
+
+def spooled_file():
+    return SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+
+
+def copy(source, target):
+    """Скопировать файл кусками."""
+    source.seek(0)
+    for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+        target.write(chunk)
+    target.seek(0)
+
+
+def is_animated(image):
+    return image.format in ANIMATED_FORMATS and getattr(
+        image, 'is_animated', False
+    )
+
+
+def encode(image, target):
+    """Пересохранить картинку без метаданных, вернуть расширение."""
+    max_side = settings.POST_IMAGE_MAX_SIDE
+    if image.format == 'JPEG':
+        # Декодер JPEG умеет сразу уменьшать картинку в 2-8 раз.
+        image.draft('RGB', (max_side, max_side))
+    photo = image.format in PHOTO_FORMATS
+    # Многокадровые картинки пересохраняются первым кадром.
+    image.seek(0)
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if photo:
+        image.convert('RGB').save(
+            target, 'JPEG', quality=JPEG_QUALITY,
+            optimize=True, progressive=True,
+        )
+        return 'jpg'
+    if image.mode not in ('1', 'L', 'LA', 'P', 'RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    image.save(target, 'PNG', optimize=True)
+    return 'png'
+
+
+def ingest(upload):
+    """Подготовить загрузку к сохранению в Post.image."""
+    upload.seek(0)
+    image = Image.open(upload)
+    output = spooled_file()
+    if is_animated(image):
+        extension = image.format.lower()
+        copy(upload, output)
+    else:
+        extension = encode(image, output)
+        output.seek(0)
+    return File(output, name=f'image.{extension}')
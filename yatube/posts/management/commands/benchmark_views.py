@@ -0,0 +1,137 @@
+import json
+import tracemalloc
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import AuthorStats, Follow, Group, Post
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * percent // 100))
+    return ordered[rank - 1]
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет ленты и страницу поста через тестовый клиент: '
+        'p50/p95/p99 времени ответа, число запросов и пик памяти.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help='Сколько запросов не учитывать в замере',
+        )
+        parser.add_argument(
+            '--cold', action='store_true',
+            help='Очищать кэш перед каждым запросом',
+        )
+        parser.add_argument('--page', type=int, default=1)
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести результаты в JSON для сравнения между прогонами',
+        )
+
+    def handle(self, *args, **options):
+        client = Client()
+        reader = Follow.objects.order_by().values('user').annotate(
+            total=Count('id')
+        ).order_by('-total').values_list('user', flat=True).first()
+        if reader is not None:
+            client.force_login(User.objects.get(pk=reader))
+        results = {
+            name: self.measure(client, url, options)
+            for name, url in self.urls(options['page'])
+        }
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        self.stdout.write(
+            f'{"view":<14}' + ''.join(
+                f'{f"p{percent}, мс":>11}' for percent in PERCENTILES
+            ) + f'{"запросы":>9}{"память, КБ":>12}'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<14}' + ''.join(
+                    f'{result[f"p{percent}"]:>11.2f}'
+                    for percent in PERCENTILES
+                ) + f'{result["queries"]:>9}{result["memory_kb"]:>12.1f}'
+            )
+
+    def urls(self, page):
+        query = f'?page={page}' if page > 1 else ''
+        group = Group.objects.annotate(
+            total=Count('posts')
+        ).order_by('-total').first()
+        author = AuthorStats.objects.select_related('author').order_by(
+            '-followers'
+        ).first()
+        post = Post.objects.annotate(
+            total=Count('comments')
+        ).order_by('-total').first()
+        urls = [('index', reverse('posts:index') + query)]
+        if group:
+            urls.append((
+                'group_posts',
+                reverse('posts:group_list', args=[group.slug]) + query,
+            ))
+        if author:
+            urls.append((
+                'profile',
+                reverse('posts:profile', args=[author.author.username])
+                + query,
+            ))
+        if post:
+            urls.append((
+                'post_detail', reverse('posts:post_detail', args=[post.id])
+            ))
+        urls.append(('follow_index', reverse('posts:follow_index') + query))
+        return urls
+
+    def measure(self, client, url, options):
+        timings, queries = [], []
+        for number in range(options['warmup'] + options['repeat']):
+            if options['cold']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as captured:
+                started = perf_counter()
+                client.get(url)
+                elapsed = (perf_counter() - started) * 1000
+            if number >= options['warmup']:
+                timings.append(elapsed)
+                queries.append(len(captured))
+        result = {
+            f'p{percent}': percentile(timings, percent)
+            for percent in PERCENTILES
+        }
+        result['queries'] = max(queries)
+        result['memory_kb'] = self.peak_memory(client, url, options) / 1024
+        return result
+
+    def peak_memory(self, client, url, options):
+        # tracemalloc замедляет Python в разы, поэтому память меряется
+        # отдельным запросом, а не в каждом замере времени.
+        if options['cold']:
+            cache.clear()
+        tracemalloc.start()
+        try:
+            client.get(url)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts.suggestions import BATCH_SIZE, build_suggestions
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает рекомендации «на кого подписаться» по графу '
+        'подписок: друзья друзей и совместные подписки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=None,
+            help='Сколько рекомендаций хранить на читателя',
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        created = build_suggestions(options['top'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Рекомендаций сохранено: {created}'
+        ))
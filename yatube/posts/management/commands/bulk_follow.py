@@ -0,0 +1,50 @@
+import csv
+import sys
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from posts.follows import BATCH_SIZE, batches, bulk_follow
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает подписки из CSV со строками «подписчик,автор» '
+        '(имена пользователей). Каждая пачка — одна транзакция; '
+        'существующие подписки, подписки на себя и неизвестные '
+        'пользователи пропускаются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл CSV или - для stdin')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['input'] == '-':
+            created, skipped = self.load(sys.stdin, options['batch_size'])
+        else:
+            with open(
+                options['input'], encoding='utf-8', newline=''
+            ) as source:
+                created, skipped = self.load(source, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Подписок создано: {created}, пропущено: {skipped}'
+        ))
+
+    def load(self, source, batch_size):
+        created = skipped = 0
+        rows = (row for row in csv.reader(source) if len(row) == 2)
+        for batch in batches(rows, batch_size):
+            ids = dict(User.objects.filter(
+                username__in={name for row in batch for name in row}
+            ).values_list('username', 'id'))
+            edges = [
+                (ids[user], ids[author]) for user, author in batch
+                if user in ids and author in ids
+            ]
+            added, _ = bulk_follow(edges, len(batch))
+            created += added
+            skipped += len(batch) - added
+        return created, skipped
@@ -0,0 +1,32 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from posts.models import MediaBlob, Post
+from posts.storage import collect, content_storage
+
+UPLOAD_DIR = Post._meta.get_field('image').upload_to
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает ссылки на картинки постов и удаляет файлы, '
+        'на которые не ссылается ни один пост'
+    )
+
+    def handle(self, *args, **options):
+        refs = MediaBlob.rebuild()
+        removed = 0
+        for name in self.stored_files(UPLOAD_DIR):
+            if name not in refs and collect(name):
+                removed += 1
+        self.stdout.write(self.style.SUCCESS(f'Удалено файлов: {removed}'))
+
+    def stored_files(self, directory):
+        if not content_storage.exists(directory):
+            return
+        directories, files = content_storage.listdir(directory)
+        for name in files:
+            yield os.path.join(directory, name)
+        for name in directories:
+            yield from self.stored_files(os.path.join(directory, name))
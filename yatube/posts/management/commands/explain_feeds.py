@@ -0,0 +1,141 @@
+import random
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.follows import bulk_follow
+from posts.models import Comment, Follow, Group, Post, TimelineEntry
+from posts.timeline import TimelinePaginator
+from posts.utils import POSTS_ON_PAGE
+
+User = get_user_model()
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает планы и время запросов лент с индексами и без них. '
+        'Все изменения, включая тестовые данные, откатываются.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--posts', type=int, default=0,
+            help='Сколько постов добавить перед замером',
+        )
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='Сколько раз выполнить каждый запрос',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['posts']:
+                    self.seed(options)
+                self.analyze()
+                self.report('С индексами', options['repeat'])
+                self.drop_indexes()
+                self.analyze()
+                self.report('Без индексов', options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def seed(self, options):
+        users = User.objects.bulk_create(
+            (
+                User(username=f'explain_{number}')
+                for number in range(options['users'])
+            )
+        )
+        if not users[0].pk:
+            users = list(User.objects.filter(username__startswith='explain_'))
+        groups = Group.objects.bulk_create(
+            (
+                Group(title=f'Группа {number}', slug=f'explain-{number}')
+                for number in range(options['groups'])
+            )
+        )
+        if not groups[0].pk:
+            groups = list(Group.objects.filter(slug__startswith='explain-'))
+        Post.objects.bulk_create(
+            (
+                Post(
+                    text=f'Пост {number}',
+                    author=random.choice(users),
+                    group=random.choice(groups + [None]),
+                )
+                for number in range(options['posts'])
+            )
+        )
+        follows = {
+            (random.choice(users).pk, random.choice(users).pk)
+            for _ in range(len(users) * 10)
+        }
+        # bulk_follow заполняет и ленты подписок, которые читает
+        # follow_index.
+        bulk_follow(follows)
+
+    def analyze(self):
+        if connection.vendor in ('sqlite', 'postgresql'):
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+
+    def drop_indexes(self):
+        # Схемный редактор SQLite нельзя открыть внутри транзакции,
+        # поэтому выполняем только SQL удаления индексов.
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model in (Post, Comment, TimelineEntry):
+                for index in model._meta.indexes:
+                    cursor.execute(str(index.remove_sql(model, editor)))
+
+    def feed_queries(self):
+        post = Post.objects.order_by('-id').first()
+        follow = Follow.objects.order_by('-id').first()
+        group_id = post.group_id if post else None
+        author_id = post.author_id if post else None
+        user_id = follow.user_id if follow else None
+        feeds = Post.objects.select_related('author', 'group').order_by(
+            '-pub_date', '-id'
+        )
+        # Первая страница ленты подписок читается как в TimelinePaginator:
+        # записи ленты и посты популярных авторов. Популярных авторов в
+        # тестовых данных обычно нет, план от списка авторов не зависит.
+        celebrities = TimelinePaginator(
+            Post.objects.none(), POSTS_ON_PAGE, user=user_id
+        ).celebrities or [follow.author_id if follow else None]
+        return (
+            ('index', feeds),
+            ('group_posts', feeds.filter(group_id=group_id)),
+            ('profile', feeds.filter(author_id=author_id)),
+            ('follow_index', TimelineEntry.objects.filter(
+                user=user_id
+            ).order_by('-pub_date', '-post').values_list('pub_date', 'post')),
+            ('follow_index_celebrities', Post.objects.filter(
+                author__in=celebrities
+            ).order_by('-pub_date', '-id').values_list('pub_date', 'id')),
+            # Первая страница корневых комментариев, как в CommentPage.
+            ('post_detail', Comment.objects.select_related('author').filter(
+                post=post.id if post else None, root=None
+            ).order_by('created', 'id')),
+        )
+
+    def report(self, title, repeat):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in self.feed_queries():
+            page = queryset[:POSTS_ON_PAGE + 1]
+            started = perf_counter()
+            for _ in range(repeat):
+                list(page)
+            elapsed = (perf_counter() - started) / repeat * 1000
+            self.stdout.write(self.style.SUCCESS(f'{name}: {elapsed:.2f} мс'))
+            self.stdout.write(page.explain())
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+
+from posts.transfer import (clear_checkpoint, export_chunks,
+                            read_checkpoint, write_checkpoint)
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает группы, посты, комментарии и подписки в NDJSON. '
+        'С --checkpoint прерванная выгрузка продолжается с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'output', nargs='?', default='-',
+            help='Файл для выгрузки, по умолчанию stdout',
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--images', action='store_true',
+            help='Включить содержимое картинок в base64',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл контрольной точки; требует файла для выгрузки',
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        if checkpoint and options['output'] == '-':
+            self.stderr.write('--checkpoint работает только с файлом')
+            return
+        state = read_checkpoint(checkpoint)
+        if options['output'] == '-':
+            self.export(self.stdout, state, options)
+            return
+        mode = 'a' if state else 'w'
+        with open(options['output'], mode, encoding='utf-8') as output:
+            self.export(output, state, options)
+        clear_checkpoint(checkpoint)
+
+    def export(self, output, state, options):
+        total = 0
+        for model, last_id, lines in export_chunks(
+            state, options['chunk_size'], options['images']
+        ):
+            output.write('\n'.join(lines) + '\n')
+            output.flush()
+            write_checkpoint(
+                options['checkpoint'], {'model': model, 'after': last_id}
+            )
+            total += len(lines)
+        if options['output'] != '-':
+            self.stdout.write(
+                self.style.SUCCESS(f'Выгружено записей: {total}')
+            )
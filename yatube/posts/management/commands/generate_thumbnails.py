@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate, is_ready
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт недостающие миниатюры картинок постов: для постов, '
+        'созданных до фоновой подготовки миниатюр, в админке или '
+        'загруженных командами'
+    )
+
+    def handle(self, *args, **options):
+        # Сначала только id: generate закрывает соединение с базой.
+        post_ids = list(Post.objects.exclude(image='').order_by(
+            'id'
+        ).values_list('id', flat=True))
+        generated = 0
+        for post_id in post_ids:
+            post = Post.objects.get(id=post_id)
+            if not is_ready(post.image):
+                generate(post_id)
+                generated += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Миниатюры созданы для постов: {generated}'
+        ))
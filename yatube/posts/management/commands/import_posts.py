@@ -0,0 +1,49 @@
+import json
+from itertools import islice
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from posts.transfer import (ImportConflict, clear_checkpoint, import_chunk,
+                            read_checkpoint, write_checkpoint)
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает NDJSON, созданный export_posts. Существующие записи '
+        'пропускаются, поэтому загрузку можно повторять; с --checkpoint '
+        'прерванная загрузка продолжается с места остановки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Файл NDJSON')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--checkpoint', help='Файл контрольной точки')
+
+    def handle(self, *args, **options):
+        checkpoint = options['checkpoint']
+        line = read_checkpoint(checkpoint).get('line', 0)
+        total = 0
+        with open(options['input'], encoding='utf-8') as source:
+            lines = islice(source, line, None)
+            while True:
+                chunk = list(islice(lines, options['chunk_size']))
+                if not chunk:
+                    break
+                try:
+                    with transaction.atomic():
+                        import_chunk([
+                            json.loads(text) for text in chunk
+                            if text.strip()
+                        ])
+                except ImportConflict as error:
+                    raise CommandError(
+                        f'{error} (пачка со строки {line + 1})'
+                    )
+                line += len(chunk)
+                total += len(chunk)
+                write_checkpoint(checkpoint, {'line': line})
+        cache.clear()
+        clear_checkpoint(checkpoint)
+        self.stdout.write(self.style.SUCCESS(f'Загружено записей: {total}'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts.trending import rebuild
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает оценки популярных постов за окно TRENDING_WINDOW '
+        'и обновляет готовый список; запускается по расписанию.'
+    )
+
+    def handle(self, *args, **options):
+        posts = rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Популярных постов: {posts}'
+        ))
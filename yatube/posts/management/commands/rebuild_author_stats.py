@@ -0,0 +1,42 @@
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from posts.models import AuthorStats
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает статистику авторов с нуля'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки для bulk_create',
+        )
+
+    def handle(self, *args, **options):
+        counts = defaultdict(dict)
+        for name, (model, field, condition) in AuthorStats.SOURCES.items():
+            totals = model.objects.filter(**condition).order_by().values_list(
+                field
+            ).annotate(total=Count('pk'))
+            for author_id, total in totals.iterator():
+                counts[author_id][name] = total
+        authors = User.objects.order_by('pk').values_list('pk', flat=True)
+        with transaction.atomic():
+            AuthorStats.objects.all().delete()
+            AuthorStats.objects.bulk_create(
+                (
+                    AuthorStats(author_id=author_id, **counts[author_id])
+                    for author_id in authors.iterator()
+                ),
+                batch_size=options['batch_size'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'Статистика пересчитана для {authors.count()} авторов'
+        ))
@@ -0,0 +1,248 @@
+import random
+from datetime import timedelta
+from io import BytesIO
+from itertools import accumulate
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image
+
+from posts import search
+from posts.models import (AuthorStats, Comment, Follow, Group, MediaBlob,
+                          Post, TimelineEntry)
+from posts.transfer import forget_derived_data, restore_dates
+
+User = get_user_model()
+
+CHUNK_SIZE = 5000
+WORDS = (
+    'кот', 'собака', 'город', 'река', 'лес', 'утро', 'вечер', 'дорога',
+    'книга', 'музыка', 'поезд', 'море', 'снег', 'солнце', 'друг', 'дом',
+    'работа', 'отпуск', 'фото', 'кофе', 'новость', 'погода', 'праздник',
+)
+
+
+class Skewed:
+    """Выбор элементов с весом 1 / rank ** exponent (закон Ципфа)."""
+
+    def __init__(self, items, exponent, rng):
+        self.items = list(items)
+        self.rng = rng
+        self.weights = list(accumulate(
+            1 / rank ** exponent for rank in range(1, len(self.items) + 1)
+        ))
+
+    def choice(self):
+        return self.rng.choices(self.items, cum_weights=self.weights)[0]
+
+
+def chunks(objects, size=CHUNK_SIZE):
+    chunk = []
+    for obj in objects:
+        chunk.append(obj)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу тестовыми данными: пользователи, группы, посты, '
+        'комментарии, картинки и подписки с неравномерным '
+        'распределением популярности авторов.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100000)
+        parser.add_argument(
+            '--comments', type=int, default=200000,
+            help='Всего комментариев',
+        )
+        parser.add_argument(
+            '--follows', type=int, default=20,
+            help='Среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько разных картинок раздать постам',
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель распределения популярности авторов',
+        )
+        parser.add_argument('--days', type=int, default=365)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        users = self.create_users(options['users'])
+        groups = self.create_groups(options['groups'])
+        # Популярные авторы и пишут больше, и читают их чаще.
+        authors = Skewed(users, options['skew'], self.rng)
+        images = self.create_images(options['images'])
+        post_ids = self.create_posts(
+            options['posts'], authors, groups, images, options['days']
+        )
+        self.create_comments(
+            options['comments'], users, post_ids, options['days']
+        )
+        self.create_follows(options['follows'], users, authors)
+        self.rebuild_derived_data(groups)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: пользователей {len(users)}, групп {len(groups)}, '
+            f'постов {len(post_ids)}'
+        ))
+
+    def random_text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words)).capitalize()
+
+    def random_date(self, days):
+        return self.now - timedelta(seconds=self.rng.randint(0, days * 86400))
+
+    def create_users(self, count):
+        password = make_password(None)
+        start = User.objects.count()
+        for chunk in chunks(
+            User(username=f'seed_{start + number}', password=password)
+            for number in range(count)
+        ):
+            User.objects.bulk_create(chunk)
+        users = list(User.objects.filter(
+            username__startswith='seed_'
+        ).values_list('id', flat=True))
+        self.rng.shuffle(users)
+        return users
+
+    def create_groups(self, count):
+        start = Group.objects.count()
+        Group.objects.bulk_create(
+            Group(
+                title=f'Группа {start + number}',
+                slug=f'seed-{start + number}',
+                description=self.random_text(10),
+            )
+            for number in range(count)
+        )
+        return list(Group.objects.filter(
+            slug__startswith='seed-'
+        ).values_list('id', flat=True)) + [None]
+
+    def create_images(self, count):
+        names = []
+        storage = Post.image.field.storage
+        for number in range(count):
+            buffer = BytesIO()
+            color = tuple(self.rng.randrange(256) for _ in range(3))
+            Image.new('RGB', (1200, 800), color).save(buffer, 'JPEG')
+            names.append(storage.save(
+                f'{Post.image.field.upload_to}seed.jpg',
+                ContentFile(buffer.getvalue()),
+            ))
+        return names
+
+    def first_id(self, model):
+        return (model.objects.order_by('-id').values_list(
+            'id', flat=True
+        ).first() or 0) + 1
+
+    def create_posts(self, count, authors, groups, images, days):
+        first_id = self.first_id(Post)
+        for chunk in chunks(
+            Post(
+                id=first_id + number,
+                text=self.random_text(self.rng.randint(5, 60)),
+                author_id=authors.choice(),
+                group_id=self.rng.choice(groups),
+                pub_date=date,
+                updated_at=date,
+                image=self.rng.choice(images) if images and (
+                    self.rng.random() < 0.3
+                ) else '',
+            )
+            for number, date in enumerate(
+                self.random_date(days) for _ in range(count)
+            )
+        ):
+            # Даты запоминаются до bulk_create, который их подменяет.
+            dates = [
+                (post.id, (post.pub_date, post.updated_at)) for post in chunk
+            ]
+            with transaction.atomic():
+                Post.objects.bulk_create(chunk)
+                restore_dates(Post, ('pub_date', 'updated_at'), dates)
+        return list(Post.objects.filter(id__gte=first_id).values_list(
+            'id', flat=True
+        ))
+
+    def create_comments(self, count, users, post_ids, days):
+        if not post_ids:
+            return
+        posts = Skewed(post_ids, 1.0, self.rng)
+        first_id = self.first_id(Comment)
+        for chunk in chunks(
+            Comment(
+                id=first_id + number,
+                post_id=posts.choice(),
+                author_id=self.rng.choice(users),
+                text=self.random_text(self.rng.randint(3, 20)),
+                created=self.random_date(days),
+            )
+            for number in range(count)
+        ):
+            dates = [(comment.id, (comment.created,)) for comment in chunk]
+            with transaction.atomic():
+                Comment.objects.bulk_create(chunk)
+                restore_dates(Comment, ('created',), dates)
+
+    def create_follows(self, average, users, authors):
+        pairs = set()
+        for user_id in users:
+            for _ in range(self.rng.randint(0, average * 2)):
+                author_id = authors.choice()
+                if author_id != user_id:
+                    pairs.add((user_id, author_id))
+        for chunk in chunks(
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs
+        ):
+            Follow.objects.bulk_create(chunk, ignore_conflicts=True)
+
+    def rebuild_derived_data(self, groups):
+        """bulk_create не вызывает сигналы, поэтому всё считаем заново."""
+        forget_derived_data(group_ids=groups, all_posts=True)
+        call_command('rebuild_author_stats', stdout=self.stdout)
+        if search.is_available():
+            search.rebuild(Post.objects.all())
+        # Раздача одним запросом вместо fan_out для каждого поста;
+        # посты популярных авторов не раздаются, как и в posts.timeline.
+        tables = {
+            'timeline': TimelineEntry._meta.db_table,
+            'follow': Follow._meta.db_table,
+            'post': Post._meta.db_table,
+            'stats': AuthorStats._meta.db_table,
+        }
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO {timeline} (user_id, post_id, pub_date) '
+                'SELECT f.user_id, p.id, p.pub_date '
+                'FROM {follow} f JOIN {post} p ON p.author_id = f.author_id '
+                'WHERE p.author_id NOT IN ('
+                'SELECT author_id FROM {stats} WHERE followers > %s) '
+                'AND NOT EXISTS (SELECT 1 FROM {timeline} t '
+                'WHERE t.user_id = f.user_id AND t.post_id = p.id)'
+                .format(**tables),
+                [settings.TIMELINE_FANOUT_LIMIT],
+            )
+        call_command('trim_timelines', stdout=self.stdout)
+        MediaBlob.rebuild()
@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from posts.models import TimelineEntry
+from posts.timeline import trim
+
+
+class Command(BaseCommand):
+    help = 'Обрезает ленты подписок до TIMELINE_MAX_ENTRIES записей'
+
+    def handle(self, *args, **options):
+        users = TimelineEntry.objects.order_by().values('user').annotate(
+            entries=Count('id')
+        ).filter(
+            entries__gt=settings.TIMELINE_MAX_ENTRIES
+        ).values_list('user', flat=True)
+        trimmed = 0
+        for user_id in users.iterator():
+            trim(user_id)
+            trimmed += 1
+        self.stdout.write(self.style.SUCCESS(f'Обрезано лент: {trimmed}'))
@@ -0,0 +1,27 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_auto_20221109_0026'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedCounter',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('feed', models.CharField(choices=[('all', 'Все посты'), ('group', 'Посты сообщества'), ('author', 'Посты автора')], max_length=10, verbose_name='Лента')),
+                ('object_id', models.PositiveIntegerField(default=0, verbose_name='Сообщество или автор')),
+                ('value', models.IntegerField(default=0, verbose_name='Количество постов')),
+            ],
+            options={
+                'verbose_name': 'Счётчик ленты',
+                'verbose_name_plural': 'Счётчики лент',
+                'unique_together': {('feed', 'object_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:16
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def drop_author_counters(apps, schema_editor):
+    FeedCounter = apps.get_model('posts', 'FeedCounter')
+    FeedCounter.objects.filter(feed='author').delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0013_feedcounter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('author', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('posts', models.IntegerField(default=0, verbose_name='Постов')),
+                ('comments', models.IntegerField(default=0, verbose_name='Комментариев к постам')),
+                ('followers', models.IntegerField(default=0, verbose_name='Подписчиков')),
+                ('following', models.IntegerField(default=0, verbose_name='Подписок')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.AlterField(
+            model_name='feedcounter',
+            name='feed',
+            field=models.CharField(choices=[('all', 'Все посты'), ('group', 'Посты сообщества')], max_length=10, verbose_name='Лента'),
+        ),
+        migrations.AlterField(
+            model_name='feedcounter',
+            name='object_id',
+            field=models.PositiveIntegerField(default=0, verbose_name='Сообщество'),
+        ),
+        migrations.RunPython(drop_author_counters, migrations.RunPython.noop),
+    ]
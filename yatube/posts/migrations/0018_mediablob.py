@@ -0,0 +1,44 @@
+# Generated by Django 2.2.16 on 2026-10-17 07:38
+
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def count_image_refs(apps, schema_editor):
+    MediaBlob = apps.get_model('posts', 'MediaBlob')
+    Post = apps.get_model('posts', 'Post')
+    refs = Post.objects.exclude(image='').order_by().values_list(
+        'image'
+    ).annotate(Count('pk'))
+    MediaBlob.objects.bulk_create(
+        MediaBlob(name=name, refs=count) for name, count in refs
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaBlob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Файл')),
+                ('refs', models.PositiveIntegerField(default=0, verbose_name='Ссылки')),
+            ],
+            options={
+                'verbose_name': 'Файл',
+                'verbose_name_plural': 'Файлы',
+            },
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(count_image_refs, migrations.RunPython.noop),
+    ]
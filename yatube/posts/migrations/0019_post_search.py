@@ -0,0 +1,29 @@
+from django.db import migrations
+
+
+def create_index(apps, schema_editor):
+    from posts import search
+
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    schema_editor.execute(search.CREATE_SQL)
+    search.rebuild(Post.objects.all())
+
+
+def drop_index(apps, schema_editor):
+    from posts import search
+
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(search.DROP_SQL)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_mediablob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:05
+
+from django.db import migrations, models
+import django.db.models.expressions
+
+
+def drop_self_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    Follow.objects.filter(
+        user=django.db.models.expressions.F('author')
+    ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0020_comment_tree'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_self_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.CheckConstraint(check=models.Q(_negated=True, user=django.db.models.expressions.F('author')), name='prevent_self_follow'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 2.2.16 on 2026-10-17 08:07
+
+from django.db import migrations, models
+
+
+def drop_author_stats(apps, schema_editor):
+    # Статистика без счётчика взаимных подписок пересчитается при
+    # первом чтении (AuthorStats.get_for).
+    apps.get_model('posts', 'AuthorStats').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_follow_self_check'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_author_stats, migrations.RunPython.noop),
+        migrations.AddField(
+            model_name='authorstats',
+            name='mutual',
+            field=models.IntegerField(default=0, verbose_name='Взаимных подписок'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['author', 'id'], name='follow_author_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(fields=['user', 'id'], name='follow_user_id_idx'),
+        ),
+    ]
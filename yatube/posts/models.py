@@ -1,5 +1,11 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_delete, post_save
+
+from .images import ingest
+from .storage import content_storage
 
 User = get_user_model()
 
@@ -21,6 +27,7 @@ class Group(models.Model):
 class Post(models.Model):
     text = models.TextField(verbose_name='Текст')
     pub_date = models.DateTimeField(auto_now_add=True, verbose_name='Дата')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='Изменён')
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -37,17 +44,38 @@ class Post(models.Model):
     image = models.ImageField(
         'Картинка',
         upload_to='posts/',
+        storage=content_storage,
         blank=True
     )
 
     class Meta:
         ordering = ['-pub_date']
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_pub_date_idx',
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_pub_date_idx',
+            ),
+        ]
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Новая картинка проходит приём (см. posts.images) при любом
+        # способе сохранения: форма, админка, код.
+        if self.image and not self.image._committed:
+            self.image = ingest(self.image)
+        super().save(*args, **kwargs)
+
 
 class Comment(models.Model):
     post = models.ForeignKey(
@@ -65,13 +93,69 @@ class Comment(models.Model):
         "date published",
         auto_now_add=True,
     )
+    # Дерево ответов: parent — на что ответили, root — корневой
+    # комментарий ветки, path — id предков через точку (материализованный
+    # путь), у корневых комментариев пустой.
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='replies',
+        blank=True,
+        null=True,
+    )
+    root = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        related_name='thread',
+        blank=True,
+        null=True,
+    )
+    path = models.CharField(max_length=255, blank=True, default='')
 
     class Meta:
+        ordering = ('created', 'id')
+        indexes = [
+            # Страница корневых комментариев поста по ключу (created, id).
+            models.Index(
+                fields=['post', 'root', 'created', 'id'],
+                name='comment_post_root_created_idx',
+            ),
+        ]
         verbose_name = 'Комментарий'
         verbose_name_plural = 'Комментарии'
 
     def __str__(self):
-        return self.title
+        return self.text[:15]
+
+    @property
+    def depth(self):
+        return self.path.count('.') + 1 if self.path else 0
+
+    def descendants(self):
+        prefix = f'{self.path}.{self.id}' if self.path else str(self.id)
+        return Comment.objects.filter(root=self.root_id or self.id).filter(
+            models.Q(path=prefix) | models.Q(path__startswith=prefix + '.')
+        )
+
+    def save(self, *args, **kwargs):
+        if self._state.adding and self.parent_id and not self.path:
+            self.place_reply(self.parent)
+        super().save(*args, **kwargs)
+
+    def place_reply(self, parent):
+        """Заполнить parent, root и path ответа на комментарий parent.
+
+        Ответ глубже COMMENT_MAX_DEPTH становится ответом на родителя
+        parent; при COMMENT_MAX_DEPTH = 0 ответов нет вовсе.
+        """
+        if settings.COMMENT_MAX_DEPTH < 1:
+            self.parent = None
+            return
+        if parent.depth >= settings.COMMENT_MAX_DEPTH:
+            parent = parent.parent
+        self.parent = parent
+        self.root_id = parent.root_id or parent.id
+        self.path = '.'.join(filter(None, (parent.path, str(parent.id))))
 
 
 class Follow(models.Model):
@@ -85,8 +169,379 @@ class Follow(models.Model):
         related_name='following')
 
     class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'
+            ),
+            models.CheckConstraint(
+                check=~Q(user=F('author')), name='prevent_self_follow'
+            ),
+        ]
+        # Страницы подписчиков и подписок, новые первыми.
+        indexes = [
+            models.Index(fields=['author', 'id'], name='follow_author_id_idx'),
+            models.Index(fields=['user', 'id'], name='follow_user_id_idx'),
+        ]
         verbose_name = 'Подписку'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
-        return self.title
+        return f'{self.user_id} -> {self.author_id}'
+
+    # follow и unfollow меняют строку одним запросом и сами отправляют
+    # сигналы, если подписка действительно появилась или исчезла:
+    # параллельные нажатия не создают дублей и не сбивают счётчики.
+
+    @classmethod
+    def follow(cls, user, author):
+        """Подписать user на author; вернуть True, если подписки не было."""
+        if user.id == author.id:
+            return False
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'INSERT INTO {cls._meta.db_table} (user_id, author_id) '
+                    f'VALUES (%s, %s) ON CONFLICT DO NOTHING RETURNING id',
+                    [user.id, author.id],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                return False
+            post_save.send(
+                sender=cls, instance=cls(id=row[0], user=user, author=author),
+                created=True, update_fields=None, raw=False,
+                using=connection.alias,
+            )
+        return True
+
+    @classmethod
+    def unfollow(cls, user, author):
+        """Отписать user от author; вернуть True, если подписка была."""
+        with transaction.atomic(savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f'DELETE FROM {cls._meta.db_table} '
+                    f'WHERE user_id = %s AND author_id = %s RETURNING id',
+                    [user.id, author.id],
+                )
+                row = cursor.fetchone()
+            if row is None:
+                return False
+            post_delete.send(
+                sender=cls, instance=cls(id=row[0], user=user, author=author),
+                using=connection.alias,
+            )
+        return True
+
+    @classmethod
+    def followed_authors(cls, user, author_ids):
+        """Множество id из author_ids, на которых подписан user."""
+        if not user.is_authenticated:
+            return set()
+        return set(cls.objects.filter(
+            user=user, author_id__in=author_ids
+        ).values_list('author_id', flat=True))
+
+    @classmethod
+    def followers_among(cls, author, user_ids):
+        """Множество id из user_ids, подписанных на author."""
+        return set(cls.objects.filter(
+            author=author, user_id__in=user_ids
+        ).values_list('user_id', flat=True))
+
+
+class FeedCounter(models.Model):
+    ALL = 'all'
+    GROUP = 'group'
+    FEEDS = (
+        (ALL, 'Все посты'),
+        (GROUP, 'Посты сообщества'),
+    )
+    feed = models.CharField(
+        max_length=10,
+        choices=FEEDS,
+        verbose_name='Лента',
+    )
+    object_id = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Сообщество',
+    )
+    value = models.IntegerField(default=0, verbose_name='Количество постов')
+
+    class Meta:
+        unique_together = ('feed', 'object_id')
+        verbose_name = 'Счётчик ленты'
+        verbose_name_plural = 'Счётчики лент'
+
+    def __str__(self):
+        return f'{self.feed}:{self.object_id}'
+
+    @classmethod
+    def posts(cls, feed, object_id=0):
+        if feed == cls.GROUP:
+            return Post.objects.filter(group_id=object_id)
+        return Post.objects.all()
+
+    @classmethod
+    def get_value(cls, feed, object_id=0):
+        value = cls.objects.filter(
+            feed=feed, object_id=object_id
+        ).values_list('value', flat=True).first()
+        if value is None:
+            value = cls.reset(feed, object_id)
+        return value
+
+    @classmethod
+    def reset(cls, feed, object_id=0):
+        """Пересчитать счётчик по таблице постов."""
+        value = cls.posts(feed, object_id).count()
+        cls.objects.update_or_create(
+            feed=feed, object_id=object_id, defaults={'value': value}
+        )
+        return value
+
+    @classmethod
+    def change(cls, feed, object_id, delta):
+        updated = cls.objects.filter(
+            feed=feed, object_id=object_id
+        ).update(value=F('value') + delta)
+        if not updated:
+            cls.reset(feed, object_id)
+
+
+class AuthorStats(models.Model):
+    author = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats',
+        verbose_name='Автор',
+    )
+    posts = models.IntegerField(default=0, verbose_name='Постов')
+    comments = models.IntegerField(
+        default=0,
+        verbose_name='Комментариев к постам',
+    )
+    followers = models.IntegerField(default=0, verbose_name='Подписчиков')
+    following = models.IntegerField(default=0, verbose_name='Подписок')
+    mutual = models.IntegerField(default=0, verbose_name='Взаимных подписок')
+
+    class Meta:
+        verbose_name = 'Статистика автора'
+        verbose_name_plural = 'Статистика авторов'
+
+    def __str__(self):
+        return f'{self.author_id}: {self.posts}'
+
+    # Счётчик -> модель, поле, по которому строки относятся к автору,
+    # и условие на строки. Взаимная подписка — подписчик автора, на
+    # которого подписан сам автор.
+    SOURCES = {
+        'posts': (Post, 'author', {}),
+        'comments': (Comment, 'post__author', {}),
+        'followers': (Follow, 'author', {}),
+        'following': (Follow, 'user', {}),
+        'mutual': (Follow, 'author', {'user__following__user': F('author')}),
+    }
+
+    @classmethod
+    def get_for(cls, author_id):
+        stats = cls.objects.filter(pk=author_id).first()
+        if stats is None:
+            stats = cls.reset(author_id)
+        return stats
+
+    @classmethod
+    def reset(cls, author_id):
+        """Пересчитать статистику одного автора по исходным таблицам."""
+        counts = {
+            name: model.objects.filter(
+                **{field: author_id}, **condition
+            ).count()
+            for name, (model, field, condition) in cls.SOURCES.items()
+        }
+        stats, _ = cls.objects.update_or_create(
+            author_id=author_id, defaults=counts
+        )
+        return stats
+
+    @classmethod
+    def reset_many(cls, author_ids):
+        """reset для многих авторов: по запросу на счётчик."""
+        author_ids = set(author_ids)
+        counts = {author_id: {} for author_id in author_ids}
+        for name, (model, field, condition) in cls.SOURCES.items():
+            totals = model.objects.filter(
+                **{f'{field}__in': author_ids}, **condition
+            ).order_by().values_list(field).annotate(total=models.Count('pk'))
+            for author_id, total in totals:
+                counts[author_id][name] = total
+        cls.objects.filter(pk__in=author_ids).delete()
+        cls.objects.bulk_create(
+            cls(author_id=author_id, **values)
+            for author_id, values in counts.items()
+        )
+
+    @classmethod
+    def change(cls, author_id, **deltas):
+        # Отсутствующая строка не создаётся: она будет посчитана
+        # целиком при первом чтении через get_for.
+        cls.objects.filter(pk=author_id).update(**{
+            name: F(name) + delta for name, delta in deltas.items()
+        })
+
+    @classmethod
+    def change_mutual(cls, user_id, author_id, delta):
+        """Учесть подписку user на author, если author подписан на user.
+
+        Проверка встречной подписки и обновление обоих счётчиков —
+        один UPDATE.
+        """
+        cls.objects.filter(
+            Q(pk=user_id, author__following__user=author_id)
+            | Q(pk=author_id, author__follower__author=user_id)
+        ).update(mutual=F('mutual') + delta)
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Пост',
+    )
+    pub_date = models.DateTimeField(verbose_name='Дата поста')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_pub_date_idx',
+            ),
+        ]
+        verbose_name = 'Запись ленты подписок'
+        verbose_name_plural = 'Записи лент подписок'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class FollowSuggestion(models.Model):
+    """Рекомендация автора читателю, см. posts.suggestions."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggestions',
+        verbose_name='Читатель',
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='suggested_to',
+        verbose_name='Автор',
+    )
+    score = models.FloatField(verbose_name='Оценка')
+    rank = models.PositiveSmallIntegerField(verbose_name='Место')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow_suggestion'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'rank'], name='suggestion_user_rank_idx'
+            ),
+        ]
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+
+    def __str__(self):
+        return f'{self.user_id}: {self.author_id}'
+
+
+class TrendingPost(models.Model):
+    """Оценка популярности поста, см. posts.trending.
+
+    Все оценки — логарифмы сумм, приведённых к общей эпохе.
+    """
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='trending',
+        verbose_name='Пост',
+    )
+    comments = models.FloatField(null=True, verbose_name='Комментарии')
+    follows = models.FloatField(null=True, verbose_name='Подписки')
+    score = models.FloatField(verbose_name='Оценка')
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-score'], name='trending_score_idx'),
+        ]
+        verbose_name = 'Популярный пост'
+        verbose_name_plural = 'Популярные посты'
+
+    def __str__(self):
+        return f'{self.post_id}: {self.score}'
+
+
+class MediaBlob(models.Model):
+    """Число постов, ссылающихся на файл в content_storage."""
+    name = models.CharField(max_length=100, unique=True, verbose_name='Файл')
+    refs = models.PositiveIntegerField(default=0, verbose_name='Ссылки')
+
+    class Meta:
+        verbose_name = 'Файл'
+        verbose_name_plural = 'Файлы'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def reset(cls, name):
+        """Пересчитать ссылки по таблице постов."""
+        refs = Post.objects.filter(image=name).count()
+        if refs:
+            cls.objects.update_or_create(name=name, defaults={'refs': refs})
+        else:
+            cls.objects.filter(name=name).delete()
+        return refs
+
+    @classmethod
+    def rebuild(cls):
+        """Пересчитать все ссылки; вернуть {имя файла: число ссылок}."""
+        refs = dict(
+            Post.objects.exclude(image='').order_by().values_list(
+                'image'
+            ).annotate(models.Count('pk'))
+        )
+        cls.objects.exclude(name__in=refs).delete()
+        for name, count in refs.items():
+            cls.objects.update_or_create(name=name, defaults={'refs': count})
+        return refs
+
+    @classmethod
+    def change(cls, name, delta):
+        """Изменить число ссылок; вернуть False, если их не осталось."""
+        updated = cls.objects.filter(name=name).update(
+            refs=F('refs') + delta
+        )
+        if not updated:
+            return cls.reset(name) > 0
+        if delta < 0:
+            cls.objects.filter(name=name, refs__lte=0).delete()
+        return cls.objects.filter(name=name).exists()
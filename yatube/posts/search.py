@@ -0,0 +1,138 @@
+"""Полнотекстовый поиск по постам.
+
+В SQLite индекс — таблица FTS5 posts_search с основами слов текста
+поста (rowid совпадает с id поста). Индекс обновляется сигналами
+Post и ранжирует результаты по bm25. На других СУБД поиск сводится к
+icontains. Фрагменты с подсветкой строятся по исходному тексту: слово
+подсвечивается, если его основа есть в запросе.
+"""
+from django.conf import settings
+from django.db import connection
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .stemmer import stem, stems, words
+
+TABLE = 'posts_search'
+CREATE_SQL = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} "
+    f"USING fts5(stems, tokenize='unicode61 remove_diacritics 2')"
+)
+DROP_SQL = f'DROP TABLE IF EXISTS {TABLE}'
+SNIPPET_WORDS = 30
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def index_text(text):
+    return ' '.join(stems(text))
+
+
+def index_post(post):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post.id])
+        cursor.execute(
+            f'INSERT INTO {TABLE} (rowid, stems) VALUES (%s, %s)',
+            [post.id, index_text(post.text)],
+        )
+
+
+def index_posts(posts):
+    """Проиндексировать пачку постов одним executemany."""
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {TABLE} WHERE rowid = %s',
+            [(post.id,) for post in posts],
+        )
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, stems) VALUES (%s, %s)',
+            [(post.id, index_text(post.text)) for post in posts],
+        )
+
+
+def remove_post(post_id):
+    if not is_available():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild(posts):
+    """Заполнить индекс заново по постам из posts."""
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {TABLE}')
+        cursor.executemany(
+            f'INSERT INTO {TABLE} (rowid, stems) VALUES (%s, %s)',
+            (
+                (post_id, index_text(text))
+                for post_id, text in posts.values_list(
+                    'id', 'text'
+                ).iterator()
+            ),
+        )
+
+
+def match_query(query):
+    """Запрос FTS5: все основы слов, последняя — как префикс."""
+    terms = [f'"{term}"' for term in stems(query)]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def search_ids(query, limit=None):
+    """id постов по убыванию релевантности."""
+    match = match_query(query)
+    if not match:
+        return []
+    limit = limit or settings.SEARCH_MAX_RESULTS
+    if not is_available():
+        from .models import Post
+
+        return list(Post.objects.filter(
+            text__icontains=query.strip()
+        ).values_list('id', flat=True)[:limit])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s '
+            f'ORDER BY bm25({TABLE}) LIMIT %s',
+            [match, limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def snippet(text, query, size=SNIPPET_WORDS):
+    """Фрагмент текста вокруг первого совпадения с подсветкой <mark>."""
+    terms = set(stems(query))
+    prefix = stem(words(query)[-1]) if words(query) else None
+    tokens = text.split()
+
+    def matches(token):
+        for word in words(token):
+            word_stem = stem(word)
+            if word_stem in terms or (
+                prefix and word_stem.startswith(prefix)
+            ):
+                return True
+        return False
+
+    marked = [matches(token) for token in tokens]
+    first = marked.index(True) if True in marked else 0
+    start = max(0, min(first - size // 3, len(tokens) - size))
+    parts = [
+        f'<mark>{escape(token)}</mark>' if hit else escape(token)
+        for token, hit in zip(tokens[start:start + size],
+                              marked[start:start + size])
+    ]
+    result = ' '.join(parts)
+    if start > 0:
+        result = '… ' + result
+    if start + size < len(tokens):
+        result += ' …'
+    return mark_safe(result)
@@ -0,0 +1,229 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from . import search, thumbnails, timeline, trending
+from .caching import bump
+from .models import (AuthorStats, Comment, FeedCounter, Follow, Group,
+                     MediaBlob, Post)
+from .storage import collect
+
+User = get_user_model()
+
+
+def group_feed(group_id):
+    slug = Group.objects.filter(pk=group_id).values_list('slug', flat=True)
+    return f'group:{slug.first()}'
+
+
+def bump_post_feeds(post, *group_ids):
+    feeds = ['all', f'author:{post.author.username}', f'post:{post.id}']
+    bump(*feeds, *(
+        group_feed(group_id) for group_id in set(group_ids)
+        if group_id is not None
+    ))
+
+
+def change_post_counters(post, delta, group_id):
+    FeedCounter.change(FeedCounter.ALL, 0, delta)
+    AuthorStats.change(post.author_id, posts=delta)
+    if group_id is not None:
+        FeedCounter.change(FeedCounter.GROUP, group_id, delta)
+
+
+def release_image(name):
+    if name and not MediaBlob.change(name, -1):
+        transaction.on_commit(lambda: collect(name))
+
+
+@receiver(post_init, sender=Post)
+def remember_post_group(sender, instance, **kwargs):
+    instance._counted_group_id = instance.group_id
+    # Имя ещё не сохранённой загрузки ('small.gif') — не файл хранилища,
+    # и ссылку на него освобождать не нужно.
+    instance._counted_image = (
+        instance.image.name if instance.image._committed else ''
+    )
+
+
+@receiver(post_save, sender=Post)
+def queue_thumbnails(sender, instance, **kwargs):
+    # Раньше count_image_refs, который запоминает новое имя картинки.
+    if instance.image.name != instance._counted_image:
+        thumbnails.schedule(instance)
+
+
+@receiver(post_save, sender=Post)
+def count_image_refs(sender, instance, **kwargs):
+    if instance.image.name == instance._counted_image:
+        return
+    if instance.image:
+        MediaBlob.change(instance.image.name, 1)
+    release_image(instance._counted_image)
+    instance._counted_image = instance.image.name
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, **kwargs):
+    if created:
+        change_post_counters(instance, 1, instance.group_id)
+        timeline.fan_out(instance)
+    elif instance.group_id != instance._counted_group_id:
+        if instance._counted_group_id is not None:
+            FeedCounter.change(
+                FeedCounter.GROUP, instance._counted_group_id, -1
+            )
+        if instance.group_id is not None:
+            FeedCounter.change(FeedCounter.GROUP, instance.group_id, 1)
+    bump_post_feeds(instance, instance.group_id, instance._counted_group_id)
+    instance._counted_group_id = instance.group_id
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, **kwargs):
+    search.index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def remove_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.id)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_post_counters(instance, -1, instance.group_id)
+    bump_post_feeds(instance, instance.group_id)
+    release_image(instance.image.name)
+
+
+# Названия групп и имена авторов выводятся в чужих лентах, поэтому их
+# изменение сбрасывает все ленты, где они видны. Значения берутся из
+# __dict__, чтобы не загружать отложенные поля.
+
+def shown_names(instance, fields):
+    return tuple(instance.__dict__.get(field) for field in fields)
+
+
+@receiver(post_init, sender=Group)
+def remember_group_title(sender, instance, **kwargs):
+    instance._shown_names = shown_names(instance, ('slug', 'title'))
+
+
+@receiver(post_save, sender=Group)
+def bump_renamed_group(sender, instance, created, **kwargs):
+    old_slug, old_title = instance._shown_names
+    if created or (old_slug, old_title) == (instance.slug, instance.title):
+        return
+    authors = User.objects.filter(
+        posts__group=instance
+    ).distinct().values_list('username', flat=True)
+    bump(
+        'all', f'group:{instance.slug}', f'group:{old_slug}',
+        f'name:group:{instance.id}',
+        *(f'author:{username}' for username in authors),
+    )
+    instance._shown_names = shown_names(instance, ('slug', 'title'))
+
+
+@receiver(post_init, sender=User)
+def remember_author_name(sender, instance, **kwargs):
+    instance._shown_names = shown_names(
+        instance, ('username', 'first_name', 'last_name')
+    )
+
+
+@receiver(post_save, sender=User)
+def bump_renamed_author(sender, instance, created, **kwargs):
+    names = shown_names(instance, ('username', 'first_name', 'last_name'))
+    if created or names == instance._shown_names:
+        return
+    groups = Group.objects.filter(
+        posts__author=instance
+    ).distinct().values_list('slug', flat=True)
+    bump(
+        'all', f'author:{instance.username}',
+        f'author:{instance._shown_names[0]}', f'name:user:{instance.id}',
+        *(f'group:{slug}' for slug in groups),
+    )
+    instance._shown_names = names
+
+
+@receiver(pre_delete, sender=User)
+def remember_follow_peers(sender, instance, **kwargs):
+    # Каскад удаляет подписки в обе стороны до того, как change_mutual
+    # успеет увидеть встречную, поэтому счётчики соседей пересчитываются
+    # целиком после удаления.
+    instance._follow_peers = set(Follow.objects.filter(
+        author=instance
+    ).values_list('user', flat=True)) | set(Follow.objects.filter(
+        user=instance
+    ).values_list('author', flat=True))
+
+
+@receiver(post_delete, sender=User)
+def reset_follow_peers(sender, instance, **kwargs):
+    # Соседи, удалённые вместе с пользователем, уже пропали из базы.
+    peers = dict(User.objects.filter(
+        pk__in=instance._follow_peers
+    ).values_list('id', 'username'))
+    if not peers:
+        return
+    AuthorStats.reset_many(peers)
+    bump(*(f'author:{username}' for username in peers.values()))
+
+
+@receiver(post_delete, sender=Group)
+def drop_group_counter(sender, instance, **kwargs):
+    FeedCounter.objects.filter(
+        feed=FeedCounter.GROUP, object_id=instance.id
+    ).delete()
+    bump('all', f'group:{instance.slug}')
+
+
+def change_comment_counter(comment, delta):
+    AuthorStats.objects.filter(author__posts=comment.post_id).update(
+        comments=F('comments') + delta
+    )
+    bump(f'post:{comment.post_id}', f'author:{comment.post.author.username}')
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, **kwargs):
+    if created:
+        change_comment_counter(instance, 1)
+        trending.comment_added(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_comment_counter(instance, -1)
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, **kwargs):
+    if created:
+        AuthorStats.change(instance.author_id, followers=1)
+        AuthorStats.change(instance.user_id, following=1)
+        AuthorStats.change_mutual(instance.user_id, instance.author_id, 1)
+        timeline.backfill(instance.user_id, instance.author_id)
+        trending.author_followed(instance.author_id)
+        bump(
+            f'author:{instance.author.username}',
+            f'author:{instance.user.username}',
+        )
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    AuthorStats.change(instance.author_id, followers=-1)
+    AuthorStats.change(instance.user_id, following=-1)
+    AuthorStats.change_mutual(instance.user_id, instance.author_id, -1)
+    timeline.remove_author(instance.user_id, instance.author_id)
+    timeline.author_unfollowed(instance.author_id)
+    bump(
+        f'author:{instance.author.username}',
+        f'author:{instance.user.username}',
+    )
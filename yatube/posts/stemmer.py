@@ -0,0 +1,125 @@
+"""Стеммер русского языка (алгоритм Snowball).
+
+Если установлен пакет snowballstemmer, используется он; встроенная
+реализация повторяет тот же алгоритм и нужна, чтобы поиск работал без
+дополнительных зависимостей.
+"""
+import re
+
+try:
+    import snowballstemmer
+except ImportError:
+    snowballstemmer = None
+
+VOWELS = 'аеиоуыэюя'
+WORD = re.compile(r'\w+')
+
+
+def endings(group1=(), group2=()):
+    """Окончания по убыванию длины; group1 требует перед собой а или я."""
+    table = [(ending, True) for ending in group1]
+    table += [(ending, False) for ending in group2]
+    return sorted(table, key=lambda item: len(item[0]), reverse=True)
+
+
+PERFECTIVE_GERUND = endings(
+    ('в', 'вши', 'вшись'),
+    ('ив', 'ивши', 'ившись', 'ыв', 'ывши', 'ывшись'),
+)
+ADJECTIVE = endings(group2=(
+    'ее', 'ие', 'ые', 'ое', 'ими', 'ыми', 'ей', 'ий', 'ый', 'ой', 'ем',
+    'им', 'ым', 'ом', 'его', 'ого', 'ему', 'ому', 'их', 'ых', 'ую', 'юю',
+    'ая', 'яя', 'ою', 'ею',
+))
+PARTICIPLE = endings(
+    ('ем', 'нн', 'вш', 'ющ', 'щ'),
+    ('ивш', 'ывш', 'ующ'),
+)
+REFLEXIVE = endings(group2=('ся', 'сь'))
+VERB = endings(
+    (
+        'ла', 'на', 'ете', 'йте', 'ли', 'й', 'л', 'ем', 'н', 'ло', 'но',
+        'ет', 'ют', 'ны', 'ть', 'ешь', 'нно',
+    ),
+    (
+        'ила', 'ыла', 'ена', 'ейте', 'уйте', 'ите', 'или', 'ыли', 'ей',
+        'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ило', 'ыло', 'ено', 'ят',
+        'ует', 'уют', 'ит', 'ыт', 'ены', 'ить', 'ыть', 'ишь', 'ую', 'ю',
+    ),
+)
+NOUN = endings(group2=(
+    'а', 'ев', 'ов', 'ие', 'ье', 'е', 'иями', 'ями', 'ами', 'еи', 'ии',
+    'и', 'ией', 'ей', 'ой', 'ий', 'й', 'иям', 'ям', 'ием', 'ем', 'ам',
+    'ом', 'о', 'у', 'ах', 'иях', 'ях', 'ы', 'ь', 'ию', 'ью', 'ю', 'ия',
+    'ья', 'я',
+))
+DERIVATIONAL = endings(group2=('ост', 'ость'))
+SUPERLATIVE = endings(group2=('ейш', 'ейше'))
+
+
+def strip(word, table, start=0):
+    """Убрать самое длинное окончание из table, лежащее после start."""
+    for ending, after_a in table:
+        if not word.endswith(ending):
+            continue
+        stem = word[:-len(ending)]
+        if len(stem) < start:
+            continue
+        if after_a and not stem[start:].endswith(('а', 'я')):
+            return word, False
+        return stem, True
+    return word, False
+
+
+def region(word, start=0):
+    """Начало области после первой согласной, следующей за гласной."""
+    for index in range(start + 1, len(word)):
+        if word[index] not in VOWELS and word[index - 1] in VOWELS:
+            return index + 1
+    return len(word)
+
+
+def builtin_stem(word):
+    rv_start = next(
+        (index + 1 for index, char in enumerate(word) if char in VOWELS),
+        len(word),
+    )
+    r2_start = region(word, region(word))
+    prefix, rv = word[:rv_start], word[rv_start:]
+    rv, done = strip(rv, PERFECTIVE_GERUND)
+    if not done:
+        rv, _ = strip(rv, REFLEXIVE)
+        rv, done = strip(rv, ADJECTIVE)
+        if done:
+            rv, _ = strip(rv, PARTICIPLE)
+        else:
+            rv, done = strip(rv, VERB)
+            if not done:
+                rv, _ = strip(rv, NOUN)
+    if rv.endswith('и'):
+        rv = rv[:-1]
+    rv, _ = strip(rv, DERIVATIONAL, max(r2_start - rv_start, 0))
+    rv, done = strip(rv, SUPERLATIVE)
+    if rv.endswith('нн'):
+        rv = rv[:-1]
+    elif not done and rv.endswith('ь'):
+        rv = rv[:-1]
+    return prefix + rv
+
+
+if snowballstemmer is not None:
+    _stemmer = snowballstemmer.stemmer('russian')
+
+    def stem(word):
+        return _stemmer.stemWord(word.lower().replace('ё', 'е'))
+else:
+    def stem(word):
+        return builtin_stem(word.lower().replace('ё', 'е'))
+
+
+def words(text):
+    return WORD.findall(text)
+
+
+def stems(text):
+    return [stem(word) for word in words(text)]
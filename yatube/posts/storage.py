@@ -0,0 +1,91 @@
+"""Хранилище файлов, адресуемых содержимым.
+
+Файл сохраняется под именем <каталог>/<2 символа хеша>/<SHA-256>.<ext>,
+поэтому одинаковое содержимое занимает на диске одно место, а URL файла
+никогда не меняет содержимое и может кэшироваться CDN бессрочно.
+Ссылки постов на файлы считает MediaBlob; файл без ссылок удаляется
+вместе с его миниатюрами (см. collect).
+
+Повторная загрузка того же содержимого не пишет файл заново, а только
+обновляет время его изменения. Пост с такой загрузкой ещё не сохранён,
+и ссылки на файл в базе нет, поэтому collect не трогает файлы моложе
+MEDIA_COLLECT_GRACE секунд: иначе он мог бы удалить файл, который вот-вот
+получит ссылку.
+"""
+import hashlib
+import os
+from datetime import timedelta
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+
+def content_name(name, digest):
+    directory, filename = os.path.split(name)
+    extension = os.path.splitext(filename)[1].lower()
+    return os.path.join(directory, digest[:2], digest + extension)
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        buffer = SpooledTemporaryFile(
+            max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+        )
+        with buffer:
+            content.seek(0)
+            for chunk in content.chunks():
+                digest.update(chunk)
+                buffer.write(chunk)
+            name = content_name(name, digest.hexdigest())
+            try:
+                os.utime(self.path(name))
+            except FileNotFoundError:
+                pass
+            else:
+                return name
+            buffer.seek(0)
+            return super()._save(name, File(buffer))
+
+
+content_storage = ContentAddressedStorage()
+
+
+def is_fresh(name):
+    """Файл записан или загружен повторно меньше MEDIA_COLLECT_GRACE назад."""
+    try:
+        modified = content_storage.get_modified_time(name)
+    except FileNotFoundError:
+        return False
+    grace = timedelta(seconds=settings.MEDIA_COLLECT_GRACE)
+    return modified > timezone.now() - grace
+
+
+def collect(name):
+    """Удалить файл и его миниатюры, если на него не ссылается ни один пост.
+
+    Вызывается после коммита транзакции, в которой исчезла последняя
+    ссылка. Свежие файлы остаются до следующего collect_media. Возвращает
+    True, если файл удалён.
+    """
+    from sorl.thumbnail import delete
+
+    from .models import MediaBlob, Post
+
+    field = Post._meta.get_field('image')
+    # Файлы вне каталога загрузок хранилищу не принадлежат.
+    if not name.startswith(field.upload_to) or is_fresh(name):
+        return False
+    if MediaBlob.objects.filter(name=name).exists():
+        return False
+    if Post.objects.filter(image=name).exists():
+        MediaBlob.reset(name)
+        return False
+    delete(field.attr_class(None, field, name), delete_file=False)
+    content_storage.delete(name)
+    return True
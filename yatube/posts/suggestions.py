@@ -0,0 +1,262 @@
+"""Рекомендации «на кого подписаться».
+
+build_suggestions читает таблицу Follow целиком в разреженную матрицу
+смежности в формате CSR — массивы indptr и indices по сжатым номерам
+пользователей, прямую («на кого подписан») и обратную («кто
+подписан») — и оценивает кандидатов для каждого читателя по двум
+сигналам:
+
+* друзья друзей: на кандидата подписаны авторы, которых читает
+  читатель;
+* совместные подписки: на кандидата подписаны похожие читатели, с
+  весом косинусной близости их подписок к подпискам читателя.
+
+Авторы, у которых больше SUGGESTIONS_FANOUT_LIMIT подписчиков, при
+поиске похожих читателей пропускаются: их читают почти все, сигнала
+они не дают, а число пар растёт квадратично. Лучшие SUGGESTIONS_COUNT
+кандидатов сохраняются в FollowSuggestion, и follow_index читает их
+одним запросом по индексу (user, rank).
+
+Если установлен numpy, читатели обрабатываются векторно пачками;
+встроенная реализация считает то же самое по одному читателю.
+"""
+import heapq
+from array import array
+from collections import Counter, defaultdict
+from math import sqrt
+
+from django.conf import settings
+from django.db import transaction
+
+from .follows import batches
+from .models import Follow, FollowSuggestion
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+BATCH_SIZE = 1000
+SIMILAR_USERS = 50
+FOF_WEIGHT = 1.0
+COFOLLOW_WEIGHT = 1.0
+
+
+def csr(rows, cols, size):
+    """Рёбра (rows[i], cols[i]) → (indptr, indices).
+
+    Соседи каждой строки идут в порядке рёбер, поэтому рёбра,
+    упорядоченные по (строка, столбец), дают соседей по возрастанию.
+    """
+    if numpy is not None:
+        order = numpy.lexsort((cols, rows))
+        indptr = numpy.zeros(size + 1, dtype=numpy.int64)
+        numpy.cumsum(numpy.bincount(rows, minlength=size), out=indptr[1:])
+        return indptr, cols[order]
+    indptr = array('q', bytes(8 * (size + 1)))
+    for row in rows:
+        indptr[row + 1] += 1
+    for position in range(size):
+        indptr[position + 1] += indptr[position]
+    indices = array('q', bytes(8 * len(cols)))
+    fill = array('q', indptr)
+    for row, col in zip(rows, cols):
+        indices[fill[row]] = col
+        fill[row] += 1
+    return indptr, indices
+
+
+class Graph:
+    """Граф подписок: ids[i] — id пользователя с номером i."""
+
+    def __init__(self, users, authors):
+        if numpy is not None:
+            users, authors = numpy.asarray(users), numpy.asarray(authors)
+            self.ids = numpy.unique(numpy.concatenate((users, authors)))
+            rows = numpy.searchsorted(self.ids, users)
+            cols = numpy.searchsorted(self.ids, authors)
+        else:
+            self.ids = array('q', sorted(set(users).union(authors)))
+            index = {user_id: i for i, user_id in enumerate(self.ids)}
+            rows = array('q', map(index.__getitem__, users))
+            cols = array('q', map(index.__getitem__, authors))
+        self.indptr, self.indices = csr(rows, cols, len(self.ids))
+        self.rindptr, self.rindices = csr(cols, rows, len(self.ids))
+
+    @classmethod
+    def load(cls):
+        users, authors = array('q'), array('q')
+        edges = Follow.objects.order_by('user', 'author').values_list(
+            'user', 'author'
+        )
+        for user, author in edges.iterator():
+            users.append(user)
+            authors.append(author)
+        return cls(users, authors)
+
+    def following(self, user):
+        return self.indices[self.indptr[user]:self.indptr[user + 1]]
+
+    def followers(self, user):
+        return self.rindices[self.rindptr[user]:self.rindptr[user + 1]]
+
+    def readers(self):
+        """Номера пользователей, у которых есть подписки."""
+        return [
+            user for user in range(len(self.ids))
+            if self.indptr[user + 1] > self.indptr[user]
+        ]
+
+
+def user_suggestions(graph, user, count, fanout_limit):
+    """Лучшие кандидаты читателя: [(номер, оценка)] по убыванию оценки."""
+    follows = graph.following(user)
+    scores = defaultdict(float)
+    for author in follows:
+        for candidate in graph.following(author):
+            scores[candidate] += FOF_WEIGHT
+    overlap = Counter()
+    for author in follows:
+        followers = graph.followers(author)
+        if len(followers) <= fanout_limit:
+            overlap.update(followers)
+    del overlap[user]
+    similarity = {
+        other: shared / sqrt(len(follows) * len(graph.following(other)))
+        for other, shared in overlap.items()
+    }
+    similar = heapq.nsmallest(
+        SIMILAR_USERS, similarity, key=lambda other: (
+            -similarity[other], other
+        )
+    )
+    for other in similar:
+        for candidate in graph.following(other):
+            scores[candidate] += COFOLLOW_WEIGHT * similarity[other]
+    scores.pop(user, None)
+    for author in follows:
+        scores.pop(author, None)
+    return heapq.nsmallest(
+        count, scores.items(), key=lambda item: (-item[1], item[0])
+    )
+
+
+def gather(indptr, indices, rows):
+    """Соседи строк: (позиция строки в rows, сосед) для каждого ребра."""
+    starts = indptr[rows]
+    lengths = indptr[rows + 1] - starts
+    owners = numpy.repeat(numpy.arange(len(rows)), lengths)
+    offsets = numpy.arange(lengths.sum()) - numpy.repeat(
+        numpy.cumsum(lengths) - lengths, lengths
+    )
+    return owners, indices[numpy.repeat(starts, lengths) + offsets]
+
+
+def top_per_row(rows, cols, values, count):
+    """Индексы и места count лучших значений каждой строки.
+
+    При равных значениях выше меньший номер столбца.
+    """
+    order = numpy.lexsort((cols, -values, rows))
+    rows = rows[order]
+    starts = numpy.flatnonzero(numpy.r_[True, rows[1:] != rows[:-1]])
+    ranks = numpy.arange(len(rows)) - numpy.repeat(
+        starts, numpy.diff(numpy.r_[starts, len(rows)])
+    )
+    keep = ranks < count
+    return order[keep], ranks[keep]
+
+
+def batch_suggestions(graph, users, count, fanout_limit):
+    """Те же оценки, что user_suggestions, для пачки читателей сразу.
+
+    Пары (читатель, кандидат) кодируются одним числом
+    читатель * size + кандидат, суммы по парам считает bincount.
+    """
+    users = numpy.asarray(users, dtype=numpy.int64)
+    size = len(graph.ids)
+    out_degree = numpy.diff(graph.indptr)
+    owners, follows = gather(graph.indptr, graph.indices, users)
+    fof_owners, fof = gather(graph.indptr, graph.indices, follows)
+    fof_owners = owners[fof_owners]
+
+    keep = numpy.diff(graph.rindptr)[follows] <= fanout_limit
+    pairs, others = gather(graph.rindptr, graph.rindices, follows[keep])
+    keys, shared = numpy.unique(
+        owners[keep][pairs] * size + others, return_counts=True
+    )
+    similar_owners, others = numpy.divmod(keys, size)
+    similarity = shared / numpy.sqrt(
+        out_degree[users][similar_owners] * out_degree[others]
+    )
+    distinct = others != users[similar_owners]
+    similar_owners = similar_owners[distinct]
+    others, similarity = others[distinct], similarity[distinct]
+    top, _ = top_per_row(similar_owners, others, similarity, SIMILAR_USERS)
+    similar_owners, others = similar_owners[top], others[top]
+    co_positions, co = gather(graph.indptr, graph.indices, others)
+    co_weights = COFOLLOW_WEIGHT * similarity[top][co_positions]
+    co_owners = similar_owners[co_positions]
+
+    keys, inverse = numpy.unique(numpy.concatenate((
+        fof_owners * size + fof, co_owners * size + co
+    )), return_inverse=True)
+    scores = numpy.bincount(inverse, weights=numpy.concatenate((
+        numpy.full(len(fof), FOF_WEIGHT), co_weights
+    )))
+    known = numpy.concatenate((
+        owners * size + follows, numpy.arange(len(users)) * size + users
+    ))
+    fresh = ~numpy.isin(keys, known)
+    rows, candidates = numpy.divmod(keys[fresh], size)
+    scores = scores[fresh]
+    top, ranks = top_per_row(rows, candidates, scores, count)
+    return zip(
+        users[rows[top]].tolist(), candidates[top].tolist(),
+        scores[top].tolist(), ranks.tolist(),
+    )
+
+
+def suggestions(graph, users, count, fanout_limit):
+    """Рекомендации пачки: (читатель, кандидат, оценка, место)."""
+    if numpy is not None:
+        return batch_suggestions(graph, users, count, fanout_limit)
+    return (
+        (user, candidate, score, rank)
+        for user in users
+        for rank, (candidate, score) in enumerate(
+            user_suggestions(graph, user, count, fanout_limit)
+        )
+    )
+
+
+def build_suggestions(count=None, batch_size=BATCH_SIZE):
+    """Пересчитать рекомендации всех читателей; вернуть число записей.
+
+    Рекомендации каждой пачки заменяются в одной транзакции, так что
+    читатель всегда видит либо старый, либо новый список.
+    """
+    count = count or settings.SUGGESTIONS_COUNT
+    fanout_limit = settings.SUGGESTIONS_FANOUT_LIMIT
+    graph = Graph.load()
+    created = 0
+    for users in batches(graph.readers(), batch_size):
+        rows = [
+            FollowSuggestion(
+                user_id=int(graph.ids[user]),
+                author_id=int(graph.ids[candidate]),
+                score=score,
+                rank=rank,
+            )
+            for user, candidate, score, rank in suggestions(
+                graph, users, count, fanout_limit
+            )
+        ]
+        with transaction.atomic():
+            FollowSuggestion.objects.filter(
+                user__in=[int(graph.ids[user]) for user in users]
+            ).delete()
+            FollowSuggestion.objects.bulk_create(rows)
+        created += len(rows)
+    FollowSuggestion.objects.filter(user__follower__isnull=True).delete()
+    return created
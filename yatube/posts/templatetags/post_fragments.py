@@ -0,0 +1,13 @@
+from django import template
+
+from ..fragments import render_posts, variant_for
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_fragments(context, posts):
+    """{% post_fragments page_obj as fragments %}: пары (пост, html)."""
+    return render_posts(posts, variant_for(
+        context.get('is_profile', False), context.get('is_group', False)
+    ))
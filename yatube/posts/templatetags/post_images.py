@@ -0,0 +1,14 @@
+from django import template
+
+from ..thumbnails import picture
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_picture(image):
+    """{% post_picture post.image as pic %}: src, srcset и sources.
+
+    Возвращает None, пока миниатюры создаются.
+    """
+    return picture(image)
@@ -0,0 +1,439 @@
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from .. import suggestions, thumbnails
+from ..follows import bulk_follow
+from ..models import (AuthorStats, Comment, Follow, FollowSuggestion, Group,
+                      MediaBlob, Post, TimelineEntry, TrendingPost)
+from ..search import search_ids
+from ..storage import collect, content_storage
+
+User = get_user_model()
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+SMALL_GIF = (
+    b'\x47\x49\x46\x38\x39\x61\x01\x00'
+    b'\x01\x00\x00\x00\x00\x21\xf9\x04'
+    b'\x01\x0a\x00\x01\x00\x2c\x00\x00'
+    b'\x00\x00\x01\x00\x01\x00\x00\x02'
+    b'\x02\x4c\x01\x00\x3b'
+)
+
+
+class ExplainFeedsTests(TestCase):
+    def test_explain_feeds_rolls_back(self):
+        """explain_feeds печатает планы и не оставляет изменений."""
+        out = StringIO()
+        call_command(
+            'explain_feeds', posts=30, users=5, groups=2, repeat=1,
+            stdout=out,
+        )
+        output = out.getvalue()
+        for name in (
+            'index', 'group_posts', 'profile', 'follow_index',
+            'follow_index_celebrities', 'post_detail',
+        ):
+            with self.subTest(name=name):
+                self.assertIn(f'{name}:', output)
+        self.assertIn('post_pub_date_idx', output)
+        self.assertIn('timeline_user_pub_date_idx', output)
+        self.assertEqual(Post.objects.count(), 0)
+        with connection.cursor() as cursor:
+            indexes = connection.introspection.get_constraints(
+                cursor, Post._meta.db_table
+            )
+        self.assertIn('post_pub_date_idx', indexes)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class MediaTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def create_post(self):
+        return Post.objects.create(
+            text='Пост',
+            author=self.author,
+            image=SimpleUploadedFile('small.gif', SMALL_GIF, 'image/gif'),
+        )
+
+    @override_settings(MEDIA_COLLECT_GRACE=0)
+    def test_shared_file_is_collected_with_last_post(self):
+        """Файл живёт, пока на него ссылается хотя бы один пост."""
+        first, second = self.create_post(), self.create_post()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 2)
+        first.delete()
+        self.assertEqual(MediaBlob.objects.get(name=name).refs, 1)
+        collect(name)
+        self.assertTrue(content_storage.exists(name))
+        second.image = ''
+        second.save()
+        self.assertFalse(MediaBlob.objects.filter(name=name).exists())
+        collect(name)
+        self.assertFalse(content_storage.exists(name))
+
+    def test_upload_name_is_not_released(self):
+        """Имя загрузки до сохранения не считается ссылкой на файл."""
+        with mock.patch.object(
+            MediaBlob, 'change', wraps=MediaBlob.change
+        ) as change:
+            post = self.create_post()
+        change.assert_called_once_with(post.image.name, 1)
+
+    def test_fresh_file_is_kept(self):
+        """Свежий файл может получить ссылку, и collect его не удаляет."""
+        post = self.create_post()
+        name = post.image.name
+        path = content_storage.path(name)
+        with content_storage.open(name) as stored:
+            content = stored.read()
+        post.delete()
+        os.utime(path, (0, 0))
+        # Повторная загрузка того же содержимого освежает файл.
+        self.assertEqual(
+            content_storage.save('posts/copy.png', ContentFile(content)),
+            name,
+        )
+        self.assertFalse(collect(name))
+        self.assertTrue(content_storage.exists(name))
+        os.utime(path, (0, 0))
+        self.assertTrue(collect(name))
+        self.assertFalse(content_storage.exists(name))
+
+    @override_settings(MEDIA_COLLECT_GRACE=0)
+    def test_collect_media(self):
+        """collect_media удаляет файлы без ссылок и чинит счётчики."""
+        post = self.create_post()
+        orphan = content_storage.save('posts/orphan.txt', ContentFile(b'x'))
+        MediaBlob.objects.all().delete()
+        out = StringIO()
+        call_command('collect_media', stdout=out)
+        self.assertIn('Удалено файлов: 1', out.getvalue())
+        self.assertFalse(content_storage.exists(orphan))
+        self.assertTrue(content_storage.exists(post.image.name))
+        self.assertEqual(MediaBlob.objects.get(name=post.image.name).refs, 1)
+
+    def test_saving_new_image_queues_thumbnails(self):
+        """Миниатюры ставятся в очередь при любом сохранении картинки."""
+        with mock.patch.object(thumbnails, 'schedule') as schedule:
+            post = self.create_post()
+            schedule.assert_called_once_with(post)
+            post.text = 'Новый текст'
+            post.save()
+            schedule.assert_called_once_with(post)
+
+    def test_generate_thumbnails(self):
+        """generate_thumbnails создаёт только недостающие миниатюры."""
+        post = self.create_post()
+        Post.objects.create(text='Без картинки', author=self.author)
+        self.assertFalse(thumbnails.is_ready(post.image))
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Миниатюры созданы для постов: 1', out.getvalue())
+        self.assertTrue(thumbnails.is_ready(post.image))
+        out = StringIO()
+        call_command('generate_thumbnails', stdout=out)
+        self.assertIn('Миниатюры созданы для постов: 0', out.getvalue())
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class TransferTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'posts.ndjson')
+        self.checkpoint = os.path.join(directory.name, 'checkpoint.json')
+        author = User.objects.create_user(username='author_1')
+        reader = User.objects.create_user(username='reader_1')
+        group = Group.objects.create(title='Группа', slug='group')
+        self.posts = [
+            Post.objects.create(
+                text=f'Пост {number}', author=author, group=group,
+                image=SimpleUploadedFile(
+                    'small.gif', SMALL_GIF, 'image/gif'
+                ) if number == 0 else '',
+            )
+            for number in range(3)
+        ]
+        Comment.objects.create(
+            post=self.posts[0], author=reader, text='Комментарий'
+        )
+        Follow.objects.create(user=reader, author=author)
+
+    def snapshot(self):
+        return (
+            list(Post.objects.order_by('id').values_list(
+                'id', 'text', 'pub_date', 'author__username', 'group__slug',
+                'image',
+            )),
+            list(Comment.objects.values_list(
+                'post', 'text', 'author__username', 'created'
+            )),
+            list(Follow.objects.values_list(
+                'user__username', 'author__username'
+            )),
+        )
+
+    def wipe(self):
+        Post.objects.all().delete()
+        Group.objects.all().delete()
+        User.objects.all().delete()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_round_trip(self):
+        """Выгрузка и загрузка восстанавливают данные и картинки."""
+        before = self.snapshot()
+        call_command(
+            'export_posts', self.path, images=True, chunk_size=2,
+            stdout=StringIO(),
+        )
+        self.wipe()
+        out = StringIO()
+        call_command('import_posts', self.path, chunk_size=2, stdout=out)
+        self.assertIn('Загружено записей: 6', out.getvalue())
+        self.assertEqual(self.snapshot(), before)
+        self.assertTrue(content_storage.exists(before[0][0][5]))
+        self.assertEqual(len(search_ids('пост')), 3)
+        self.assertEqual(search_ids('Пост 1'), [self.posts[1].id])
+        self.assertTrue(
+            TimelineEntry.objects.filter(user__username='reader_1').exists()
+        )
+
+    def test_import_into_existing_data(self):
+        """Повторная загрузка пропускает записи, счётчики считаются точно."""
+        call_command('export_posts', self.path, stdout=StringIO())
+        other = User.objects.create_user(username='other')
+        AuthorStats.reset(other.id)
+        deleted_id = self.posts[2].id
+        self.posts[2].delete()
+        Follow.objects.all().delete()
+        # Счётчики, которые не сошлись бы при подсчёте приращениями.
+        AuthorStats.objects.filter(author__username='author_1').update(
+            posts=10, followers=10
+        )
+        with mock.patch('posts.transfer.search.index_posts') as index_posts:
+            call_command('import_posts', self.path, stdout=StringIO())
+        index_posts.assert_called_once()
+        self.assertEqual(
+            [post.id for post in index_posts.call_args[0][0]], [deleted_id]
+        )
+        self.assertEqual(Post.objects.count(), 3)
+        self.assertEqual(Comment.objects.count(), 1)
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertTrue(AuthorStats.objects.filter(author=other).exists())
+        stats = AuthorStats.objects.get(author__username='author_1')
+        self.assertEqual((stats.posts, stats.followers), (3, 1))
+
+    def test_import_reaches_existing_followers(self):
+        """Загруженные посты попадают в ленты подписчиков и миниатюры."""
+        call_command(
+            'export_posts', self.path, images=True, stdout=StringIO()
+        )
+        post_id = self.posts[0].id
+        self.posts[0].delete()
+        self.assertFalse(TimelineEntry.objects.filter(post=post_id).exists())
+        with mock.patch.object(thumbnails, 'schedule_many') as schedule:
+            call_command('import_posts', self.path, stdout=StringIO())
+        self.assertTrue(TimelineEntry.objects.filter(
+            user__username='reader_1', post=post_id
+        ).exists())
+        self.assertEqual(list(schedule.call_args[0][0]), [post_id])
+
+    def test_conflicting_ids(self):
+        """Чужая запись с тем же id останавливает загрузку."""
+        call_command('export_posts', self.path, stdout=StringIO())
+        post_id = self.posts[0].id
+        self.wipe()
+        other = User.objects.create_user(username='other')
+        Post.objects.create(id=post_id, text='Чужой пост', author=other)
+        with self.assertRaisesMessage(CommandError, str(post_id)):
+            call_command('import_posts', self.path, stdout=StringIO())
+        self.assertEqual(
+            list(Post.objects.values_list('text', flat=True)), ['Чужой пост']
+        )
+        self.assertFalse(Comment.objects.exists())
+
+    def test_resume(self):
+        """Команды продолжают работу с контрольной точки."""
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'model': 'post', 'after': self.posts[0].id}, checkpoint)
+        call_command(
+            'export_posts', self.path, checkpoint=self.checkpoint,
+            stdout=StringIO(),
+        )
+        with open(self.path) as exported:
+            records = [json.loads(line) for line in exported]
+        self.assertEqual(
+            [record['model'] for record in records],
+            ['post', 'post', 'comment', 'follow'],
+        )
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.wipe()
+        with open(self.checkpoint, 'w') as checkpoint:
+            json.dump({'line': 3}, checkpoint)
+        call_command(
+            'import_posts', self.path, checkpoint=self.checkpoint,
+            stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 0)
+        self.assertEqual(Follow.objects.count(), 1)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
+class BenchmarkTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def test_seed_and_benchmark(self):
+        """seed_data создаёт связные данные, benchmark_views их замеряет."""
+        call_command(
+            'seed_data', users=30, groups=3, posts=200, comments=100,
+            follows=3, images=2, stdout=StringIO(),
+        )
+        self.assertEqual(Post.objects.count(), 200)
+        self.assertEqual(Comment.objects.count(), 100)
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        follow = Follow.objects.first()
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=follow.user_id, post__author=follow.author_id
+        ).exists())
+        self.assertTrue(search_ids('кот'))
+        out = StringIO()
+        call_command(
+            'benchmark_views', repeat=3, warmup=1, json=True, stdout=out
+        )
+        results = json.loads(out.getvalue())
+        self.assertEqual(set(results), {
+            'index', 'group_posts', 'profile', 'post_detail', 'follow_index',
+        })
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertLessEqual(result['p50'], result['p99'])
+                self.assertGreater(result['memory_kb'], 0)
+
+
+class BulkFollowTests(TestCase):
+    def test_bulk_follow(self):
+        """Пачки подписок с пропуском повторов, себя и неизвестных."""
+        author, reader, other = (
+            User.objects.create_user(username=name)
+            for name in ('author', 'reader', 'other')
+        )
+        Post.objects.create(author=author, text='Пост автора')
+        Follow.follow(other, reader)
+        self.assertEqual(AuthorStats.get_for(author.id).followers, 0)
+        profile = reverse('posts:profile', args=[reader.username])
+        self.assertContains(self.client.get(profile), 'подписок: 0')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, 'follows.csv')
+        with open(path, 'w', encoding='utf-8') as edges:
+            edges.write(
+                'reader,author\nreader,author\nother,author\n'
+                'other,reader\nauthor,author\nnobody,author\n'
+                'author,reader\n'
+            )
+        out = StringIO()
+        call_command('bulk_follow', path, batch_size=3, stdout=out)
+        self.assertIn('создано: 3, пропущено: 4', out.getvalue())
+        self.assertEqual(Follow.objects.count(), 4)
+        stats = AuthorStats.get_for(author.id)
+        self.assertEqual(
+            (stats.followers, stats.following, stats.mutual), (2, 1, 1)
+        )
+        self.assertContains(self.client.get(profile), 'подписок: 1')
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=reader, post__author=author
+        ).exists())
+        self.assertIsNotNone(
+            TrendingPost.objects.get(post__author=author).follows
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_bulk_follow_keeps_celebrities(self):
+        """Посты автора, ставшего популярным, не раздаются подписчикам."""
+        author, *readers = (
+            User.objects.create_user(username=f'user_{number}')
+            for number in range(4)
+        )
+        Post.objects.create(author=author, text='Пост автора')
+        created, _ = bulk_follow(
+            [(reader.id, author.id) for reader in readers], batch_size=1
+        )
+        self.assertEqual(created, 3)
+        self.assertEqual(AuthorStats.objects.get(pk=author.id).followers, 3)
+        self.assertEqual(
+            TimelineEntry.objects.filter(post__author=author).count(), 1
+        )
+
+
+class SuggestionsTests(TestCase):
+    def test_build_suggestions(self):
+        """Друзья друзей и совместные подписки, без своих и себя."""
+        users = {
+            name: User.objects.create_user(username=name)
+            for name in ('a', 'b', 'c', 'd', 'e', 'f', 'x', 'z')
+        }
+        for user, authors in (
+            ('a', 'bc'), ('b', 'd'), ('c', 'de'), ('x', 'bcf'),
+        ):
+            for author in authors:
+                Follow.objects.create(
+                    user=users[user], author=users[author]
+                )
+        FollowSuggestion.objects.create(
+            user=users['z'], author=users['a'], score=1, rank=0
+        )
+        # Встроенная реализация и, если установлен, numpy.
+        for numpy in {suggestions.numpy, None}:
+            with self.subTest(numpy=numpy is not None):
+                with mock.patch.object(suggestions, 'numpy', numpy):
+                    call_command('build_suggestions', batch_size=2,
+                                 stdout=StringIO())
+                result = {
+                    user: [
+                        (author, round(score, 3)) for author, score in
+                        FollowSuggestion.objects.filter(
+                            user__username=user
+                        ).order_by('rank').values_list(
+                            'author__username', 'score'
+                        )
+                    ]
+                    for user in ('a', 'b', 'c', 'x', 'z')
+                }
+                self.assertEqual(result, {
+                    'a': [('d', 2.0), ('e', 1.0), ('f', 0.816)],
+                    'b': [('e', 0.707)],
+                    'c': [],
+                    'x': [('d', 2.0), ('e', 1.0)],
+                    'z': [],
+                })
@@ -0,0 +1,138 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.utils.html import escape
+
+from ..models import Comment, Post
+from ..utils import COMMENTS_ON_PAGE, REPLIES_ON_PAGE
+from .utils import name_to_url
+
+User = get_user_model()
+
+
+class CommentTreeTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.post = Post.objects.create(text='Пост', author=cls.author)
+        cls.other_post = Post.objects.create(text='Другой', author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.author)
+
+    def comment(self, text, parent=None, post=None):
+        return Comment.objects.create(
+            post=post or self.post, author=self.author, text=text,
+            parent=parent,
+        )
+
+    def json(self, url):
+        return self.client.get(url).json()
+
+    @override_settings(COMMENT_MAX_DEPTH=2)
+    def test_tree(self):
+        """Ответы идут после родителя, глубина ограничена."""
+        first = self.comment('1')
+        second = self.comment('2')
+        reply = self.comment('1.1', first)
+        nested = self.comment('1.1.1', reply)
+        too_deep = self.comment('1.1.1.1', nested)
+        self.comment('2.1', second)
+        self.assertEqual(
+            (nested.path, nested.depth, nested.root_id), (
+                f'{first.id}.{reply.id}', 2, first.id
+            )
+        )
+        self.assertEqual(too_deep.parent_id, reply.id)
+        self.assertEqual(
+            set(first.descendants()), {reply, nested, too_deep}
+        )
+        data = self.json(name_to_url(('posts:post_comments', [self.post.id])))
+        self.assertEqual(
+            [(item['text'], item['depth']) for item in data['comments']],
+            [('1', 0), ('1.1', 1), ('1.1.1', 2), ('1.1.1.1', 2), ('2', 0),
+             ('2.1', 1)],
+        )
+
+    def test_cursor_pages(self):
+        """Корневые комментарии подгружаются страницами по курсору."""
+        for number in range(COMMENTS_ON_PAGE + 3):
+            self.comment(f'Комментарий {number}')
+        url = name_to_url(('posts:post_comments', [self.post.id]))
+        first = self.json(url)
+        self.assertEqual(len(first['comments']), COMMENTS_ON_PAGE)
+        second = self.json(first['next'])
+        self.assertEqual(
+            [item['text'] for item in second['comments']],
+            [f'Комментарий {number}' for number in range(
+                COMMENTS_ON_PAGE, COMMENTS_ON_PAGE + 3
+            )],
+        )
+        self.assertIsNone(second['next'])
+        response = self.client.get(
+            name_to_url(('posts:post_detail', [self.post.id]))
+        )
+        self.assertContains(response, f'?comments={first["cursor"]}')
+        self.assertEqual(
+            self.client.get(
+                name_to_url(('posts:post_comments', [0]))
+            ).status_code,
+            404,
+        )
+
+    def test_replies_are_capped(self):
+        """Ветка показывает первые ответы, остальные — по ссылке."""
+        root = self.comment('Вопрос')
+        self.comment('Другой вопрос')
+        reply = self.comment('Ответ 0', root)
+        for number in range(1, REPLIES_ON_PAGE + 3):
+            self.comment(f'Ответ {number}', reply if number == 1 else root)
+        data = self.json(name_to_url(('posts:post_comments', [self.post.id])))
+        texts = [item['text'] for item in data['comments']]
+        self.assertEqual(
+            texts,
+            ['Вопрос', 'Ответ 0', 'Ответ 1'] + [
+                f'Ответ {number}' for number in range(2, REPLIES_ON_PAGE)
+            ] + ['Другой вопрос'],
+        )
+        more = data['comments'][REPLIES_ON_PAGE]['more_replies']
+        self.assertIn(f'root={root.id}', more)
+        self.assertIsNone(data['comments'][-1]['more_replies'])
+        rest = self.json(more)
+        self.assertEqual(
+            [item['text'] for item in rest['comments']],
+            [f'Ответ {number}' for number in range(
+                REPLIES_ON_PAGE, REPLIES_ON_PAGE + 3
+            )],
+        )
+        self.assertIsNone(rest['next'])
+        response = self.client.get(
+            name_to_url(('posts:post_detail', [self.post.id]))
+        )
+        self.assertContains(response, f'data-url="{escape(more)}"')
+
+    def test_reply_form(self):
+        """Ответить можно только на комментарий того же поста."""
+        parent = self.comment('Вопрос')
+        foreign = self.comment('Чужой', post=self.other_post)
+        url = name_to_url(('posts:add_comment', [self.post.id]))
+        self.client.post(url, {'text': 'Ответ', 'parent': parent.id})
+        self.client.post(url, {'text': 'Мимо', 'parent': foreign.id})
+        reply = Comment.objects.get(text='Ответ')
+        self.assertEqual((reply.parent, reply.root), (parent, parent))
+        # Ответ на комментарий другого поста сохраняется корневым.
+        misplaced = Comment.objects.get(text='Мимо')
+        self.assertEqual(
+            (misplaced.post, misplaced.parent), (self.post, None)
+        )
+        response = self.client.get(
+            name_to_url(('posts:post_detail', [self.post.id])),
+            {'reply': parent.id},
+        )
+        self.assertContains(
+            response,
+            f'<input type="hidden" name="parent" value="{parent.id}">',
+        )
@@ -1,10 +1,13 @@
 import shutil
 import tempfile
+from io import BytesIO
+from unittest import mock
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
+from PIL import Image
 
 from ..forms import PostForm
 from ..models import Group, Post
@@ -13,9 +16,10 @@ from .utils import name_to_url
 User = get_user_model()
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+IMAGE_NAME = r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.(png|jpg)$'
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -53,18 +57,18 @@ class PostFormTests(TestCase):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.author)
 
-    def assert_form_data(self, form_data, uploaded):
+    def assert_form_data(self, form_data):
         """Проваеряем поля на соответствие подготовленным данным"""
         new_post = Post.objects.all().first()
         post_fields = (
             [new_post.text, form_data['text']],
             [new_post.author, self.author],
             [new_post.group, self.group],
-            [new_post.image, f'posts/{uploaded.name}'],
         )
         for value, expected in post_fields:
             with self.subTest(value=value):
                 self.assertEqual(value, expected)
+        self.assertRegex(new_post.image.name, IMAGE_NAME)
 
     def test_create_post(self):
         """Отправка валидная форма -> создание поста в БД."""
@@ -86,7 +90,7 @@ class PostFormTests(TestCase):
         )
         self.assertRedirects(response, name_to_url(self.PROFILE))
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assert_form_data(form_data, uploaded)
+        self.assert_form_data(form_data)
 
     def test_edit_post(self):
         """Отправка валидная форма -> изменение поста в БД."""
@@ -113,4 +117,70 @@ class PostFormTests(TestCase):
         )
         self.assertRedirects(response, name_to_url(self.POST_DETAIL))
         self.assertEqual(Post.objects.count(), posts_count)
-        self.assert_form_data(form_data, uploaded)
+        self.assert_form_data(form_data)
+
+    def make_photo(self, size):
+        """JPEG с EXIF-ориентацией «повернуть на 90°»."""
+        exif = Image.Exif()
+        exif[0x0112] = 6
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile(
+            'photo.jpg', buffer.getvalue(), content_type='image/jpeg'
+        )
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_image_is_normalised(self):
+        """Фото уменьшается, поворачивается и теряет EXIF."""
+        post = Post.objects.create(
+            text='Фото', author=self.author, image=self.make_photo((400, 200))
+        )
+        self.assertRegex(post.image.name, IMAGE_NAME)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+            self.assertTrue(image.info.get('progressive'))
+
+    @override_settings(POST_IMAGE_MAX_SIDE=100)
+    def test_multi_frame_photo_is_normalised(self):
+        """Многокадровое фото (MPO) пересохраняется, а не копируется."""
+        open_image = Image.open
+
+        def open_mpo(*args, **kwargs):
+            # Pillow 8 не пишет MPO: JPEG выдаётся за серию кадров.
+            image = open_image(*args, **kwargs)
+            image.format, image.is_animated = 'MPO', True
+            return image
+
+        with mock.patch('posts.images.Image.open', open_mpo):
+            post = Post.objects.create(
+                text='Фото', author=self.author,
+                image=self.make_photo((400, 200)),
+            )
+        self.assertRegex(post.image.name, IMAGE_NAME)
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.format, 'JPEG')
+            self.assertEqual(image.size, (50, 100))
+            self.assertFalse(image.getexif())
+
+    def test_identical_uploads_share_file(self):
+        """Одинаковые загрузки хранятся одним файлом."""
+        posts = [
+            Post.objects.create(
+                text='Фото', author=self.author,
+                image=self.make_photo((40, 20)),
+            )
+            for _ in range(2)
+        ]
+        self.assertEqual(posts[0].image.name, posts[1].image.name)
+
+    @override_settings(POST_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_upload_size_limit(self):
+        """Слишком большой файл форма не принимает."""
+        form = PostForm(
+            data={'text': 'Текст'},
+            files={'image': self.make_photo((40, 20))},
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('image', form.errors)
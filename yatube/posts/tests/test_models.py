@@ -1,7 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
 
-from ..models import Group, Post
+from ..counters import feed_counter
+from ..models import (AuthorStats, Comment, FeedCounter, Follow, Group, Post,
+                      TimelineEntry)
+from ..timeline import TimelinePaginator, timeline_posts, trim
 
 User = get_user_model()
 
@@ -31,3 +38,219 @@ class PostModelTest(TestCase):
             with self.subTest(expected_object_name=expected_object_name):
                 self.assertEqual(
                     expected_object_name, object_name_from_model)
+
+
+class FeedCounterTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='author_1')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-slug',
+            description='Тестовое описание',
+        )
+
+    def assert_counters(self, expected):
+        for (feed, object_id), value in expected.items():
+            with self.subTest(feed=feed, object_id=object_id):
+                self.assertEqual(
+                    FeedCounter.get_value(feed, object_id), value
+                )
+                self.assertEqual(
+                    FeedCounter.posts(feed, object_id).count(), value
+                )
+
+    def test_counters_follow_create_edit_and_delete(self):
+        """Счётчики лент меняются при создании, правке и удалении поста."""
+        post = Post.objects.create(
+            author=self.user, text='Тестовый пост', group=self.group
+        )
+        Post.objects.create(author=self.user, text='Без группы')
+        self.assert_counters({
+            (FeedCounter.ALL, 0): 2,
+            (FeedCounter.GROUP, self.group.id): 1,
+        })
+        post.group = self.other_group
+        post.save()
+        self.assert_counters({
+            (FeedCounter.GROUP, self.group.id): 0,
+            (FeedCounter.GROUP, self.other_group.id): 1,
+        })
+        post.delete()
+        self.assert_counters({
+            (FeedCounter.ALL, 0): 1,
+            (FeedCounter.GROUP, self.other_group.id): 0,
+        })
+
+    def test_missing_counter_is_rebuilt(self):
+        """Отсутствующий счётчик пересчитывается по таблице постов."""
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        FeedCounter.objects.all().delete()
+        self.assert_counters({(FeedCounter.ALL, 0): 1})
+
+    @override_settings(POSTS_COUNT_STRATEGY='cached')
+    def test_cached_strategy(self):
+        """Кэширующий счётчик не повторяет COUNT в пределах TTL."""
+        cache.clear()
+        Post.objects.create(author=self.user, text='Тестовый пост')
+        counter = feed_counter('author', self.user.id)
+        self.assertEqual(counter.count(self.user.posts.all()), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(counter.count(self.user.posts.all()), 1)
+
+
+class AuthorStatsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.reader = User.objects.create_user(username='reader_1')
+
+    def assert_stats(self, user, **expected):
+        stats = AuthorStats.objects.get(pk=user.id)
+        for name, value in expected.items():
+            with self.subTest(user=user, name=name):
+                self.assertEqual(getattr(stats, name), value)
+
+    def test_stats_follow_changes(self):
+        """Статистика меняется вместе с постами, комментариями, подписками."""
+        AuthorStats.get_for(self.author.id)
+        AuthorStats.get_for(self.reader.id)
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assert_stats(
+            self.author, posts=1, comments=1, followers=1, following=0
+        )
+        self.assert_stats(self.reader, posts=0, following=1)
+        follow.delete()
+        post.delete()
+        self.assert_stats(self.author, posts=0, comments=0, followers=0)
+        self.assert_stats(self.reader, following=0)
+
+    def test_deleted_user_leaves_no_mutual(self):
+        """Удаление пользователя обнуляет взаимные подписки соседей."""
+        AuthorStats.get_for(self.author.id)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Follow.objects.create(user=self.author, author=self.reader)
+        self.assert_stats(self.author, mutual=1)
+        User.objects.get(pk=self.reader.id).delete()
+        self.assert_stats(self.author, followers=0, following=0, mutual=0)
+
+    def test_missing_stats_are_counted_on_read(self):
+        """Статистика без строки считается при первом чтении."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        AuthorStats.objects.all().delete()
+        stats = AuthorStats.get_for(self.author.id)
+        self.assertEqual((stats.posts, stats.comments), (1, 1))
+
+    def test_rebuild_command(self):
+        """Команда rebuild_author_stats пересчитывает всех авторов."""
+        post = Post.objects.create(author=self.author, text='Тестовый пост')
+        Comment.objects.create(post=post, author=self.reader, text='Текст')
+        Follow.objects.create(user=self.reader, author=self.author)
+        AuthorStats.objects.update(posts=100, comments=100)
+        call_command('rebuild_author_stats', stdout=StringIO())
+        self.assert_stats(
+            self.author, posts=1, comments=1, followers=1, following=0
+        )
+        self.assert_stats(
+            self.reader, posts=0, comments=0, followers=0, following=1
+        )
+
+
+class TimelineTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.reader = User.objects.create_user(username='reader_1')
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        """Подписка добавляет посты автора в ленту, отписка убирает."""
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(list(timeline_posts(self.reader)), [post])
+        follow.delete()
+        self.assertFalse(TimelineEntry.objects.exists())
+
+    def test_new_post_is_fanned_out(self):
+        """Новый пост попадает в ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_read_on_request(self):
+        """Посты популярного автора не раздаются, но видны в ленте."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(list(timeline_posts(self.reader)), [post])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=2)
+    def test_trim_keeps_newest_entries(self):
+        """Обрезка оставляет только новые записи ленты."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+            for number in range(4)
+        ]
+        trim(self.reader.id)
+        self.assertEqual(list(timeline_posts(self.reader)), posts[:1:-1])
+
+    @override_settings(TIMELINE_MAX_ENTRIES=2, TIMELINE_TRIM_EVERY=1)
+    def test_fan_out_trims(self):
+        """Раздача обрезает ленты подписчиков."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(4):
+            Post.objects.create(author=self.author, text=f'Пост {number}')
+        self.assertEqual(TimelineEntry.objects.count(), 2)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_paginator_merges_popular_authors(self):
+        """Страницы сливают записи ленты и посты популярных авторов."""
+        other = User.objects.create_user(username='other')
+        popular = User.objects.create_user(username='popular')
+        for user in (self.reader, other):
+            Follow.objects.create(user=user, author=popular)
+        Follow.objects.create(user=self.reader, author=self.author)
+        for number in range(5):
+            for author in (self.author, popular):
+                Post.objects.create(author=author, text=f'Пост {number}')
+        self.assertEqual(TimelineEntry.objects.count(), 5)
+        paginator = TimelinePaginator(
+            timeline_posts(self.reader), 3, user=self.reader
+        )
+        page, posts = paginator.cursor_page(), []
+        posts += page
+        while page.has_next():
+            page = paginator.cursor_page(page.next_cursor)
+            posts += page
+        self.assertEqual(posts, list(
+            timeline_posts(self.reader).order_by('-pub_date', '-id')
+        ))
+        self.assertEqual(len(posts), 10)
+        self.assertEqual(list(paginator.page(2)), posts[3:6])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_demoted_author_is_fanned_out(self):
+        """Автор, опустившийся до порога, раздаёт свои посты."""
+        other = User.objects.create_user(username='other')
+        for user in (self.reader, other):
+            Follow.follow(user, self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        self.assertFalse(TimelineEntry.objects.exists())
+        Follow.unfollow(other, self.author)
+        self.assertTrue(TimelineEntry.objects.filter(
+            user=self.reader, post=post
+        ).exists())
@@ -0,0 +1,123 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+
+from ..models import AuthorStats, Comment, Follow, Group, Post
+from .utils import name_to_url
+
+User = get_user_model()
+
+SMALL_PAGE = 1
+FULL_PAGE = 10
+POSTS_ON_PAGE = 10
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов каждого view не зависит от размера страницы.
+
+    Бюджет включает загрузку сессии и пользователя для авторизованного
+    клиента.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.reader = User.objects.create_user(username='reader_1')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test-slug',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+
+    def create_posts(self, count):
+        posts = [
+            Post.objects.create(
+                text=f'Тестовый пост {number}',
+                author=self.author,
+                group=self.group,
+            )
+            for number in range(count)
+        ]
+        for _ in range(count):
+            Comment.objects.create(
+                post=posts[0], author=self.reader, text='Комментарий'
+            )
+        for user in (self.author, self.reader):
+            AuthorStats.get_for(user.id)
+        return posts[0]
+
+    def assert_budget(self, client, url, budget, method='get', data=None):
+        cache.clear()
+        with self.assertNumQueries(budget):
+            getattr(client, method)(url, data)
+
+    def test_feed_views(self):
+        """Ленты постов выполняют фиксированное число запросов."""
+        feeds = (
+            (('posts:index', None), 4),
+            (('posts:group_list', [self.group.slug]), 5),
+            (('posts:profile', [self.author.username]), 7),
+            (('posts:follow_index', None), 7),
+            (('posts:trending', None), 5),
+        )
+        for page_size in (SMALL_PAGE, FULL_PAGE):
+            Post.objects.all().delete()
+            self.create_posts(POSTS_ON_PAGE + page_size)
+            for name, budget in feeds:
+                with self.subTest(name=name, page_size=page_size):
+                    self.assert_budget(
+                        self.client, name_to_url(name) + '?page=2', budget
+                    )
+
+    def test_post_detail(self):
+        """Страница поста выполняет фиксированное число запросов.
+
+        Комментарии: страница корневых и одним запросом ответы на них.
+        """
+        for page_size in (SMALL_PAGE, FULL_PAGE):
+            Post.objects.all().delete()
+            post = self.create_posts(page_size)
+            with self.subTest(page_size=page_size):
+                self.assert_budget(
+                    self.client,
+                    name_to_url(('posts:post_detail', [post.id])),
+                    6,
+                )
+
+    def test_post_forms(self):
+        """Формы создания и редактирования поста."""
+        post = self.create_posts(SMALL_PAGE)
+        views = (
+            (('posts:post_create', None), 3),
+            (('posts:post_edit', [post.id]), 4),
+        )
+        for name, budget in views:
+            with self.subTest(name=name):
+                self.assert_budget(
+                    self.author_client, name_to_url(name), budget
+                )
+
+    def test_write_views(self):
+        """Комментарий, подписка и отписка."""
+        post = self.create_posts(SMALL_PAGE)
+        Follow.objects.all().delete()
+        views = (
+            (('posts:add_comment', [post.id]), 6, 'post'),
+            (('posts:profile_follow', [self.author.username]), 12, 'get'),
+            (('posts:profile_unfollow', [self.author.username]), 9, 'get'),
+        )
+        for name, budget, method in views:
+            with self.subTest(name=name):
+                self.assert_budget(
+                    self.client, name_to_url(name), budget, method,
+                    {'text': 'Комментарий'},
+                )
@@ -0,0 +1,86 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.test import Client, TestCase
+
+from ..models import Post
+from ..search import search_ids, snippet
+from ..stemmer import builtin_stem
+from .utils import name_to_url
+
+User = get_user_model()
+
+SEARCH = ('posts:search', None)
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.cats = Post.objects.create(
+            text='Коты спят на тёплых подоконниках', author=cls.author
+        )
+        cls.cat = Post.objects.create(
+            text='Кот и кошка', author=cls.author
+        )
+        cls.dogs = Post.objects.create(
+            text='Собаки любят гулять', author=cls.author
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+
+    def test_stemmer(self):
+        """Разные формы слова сводятся к одной основе."""
+        for words in (
+            ('котики', 'котиками', 'котиков'),
+            ('подоконниках', 'подоконник'),
+            ('гулять', 'гуляли'),
+        ):
+            with self.subTest(words=words):
+                stems = {builtin_stem(word) for word in words}
+                self.assertEqual(len(stems), 1)
+
+    def test_word_forms_are_found(self):
+        """Поиск находит другие формы слова и ранжирует результаты."""
+        self.assertEqual(search_ids('подоконник'), [self.cats.id])
+        self.assertEqual(search_ids('гуляли собаки'), [self.dogs.id])
+        self.assertEqual(set(search_ids('кот')), {self.cats.id, self.cat.id})
+        self.assertEqual(search_ids('слон'), [])
+
+    def test_index_follows_changes(self):
+        """Индекс обновляется при правке и удалении поста."""
+        post = Post.objects.get(id=self.dogs.id)
+        post.text = 'Слоны любят гулять'
+        post.save()
+        self.assertEqual(search_ids('собака'), [])
+        self.assertEqual(search_ids('слон'), [post.id])
+        post.delete()
+        self.assertEqual(search_ids('слон'), [])
+
+    def test_snippet(self):
+        """Совпадения в фрагменте подсвечены, текст экранирован."""
+        self.assertEqual(
+            snippet('<b>Коты</b> и коты', 'кот'),
+            '<mark>&lt;b&gt;Коты&lt;/b&gt;</mark> и <mark>коты</mark>',
+        )
+
+    def test_search_page(self):
+        """Страница поиска показывает найденные посты с подсветкой."""
+        response = self.client.get(name_to_url(SEARCH), {'q': 'собаки'})
+        self.assertEqual(
+            [post for post, _ in response.context['results']], [self.dogs]
+        )
+        self.assertContains(response, '<mark>Собаки</mark>')
+
+    def test_admin_search(self):
+        """Поиск в админке идёт через индекс."""
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass'
+        )
+        self.client.force_login(admin)
+        response = self.client.get('/admin/posts/post/', {'q': 'подоконник'})
+        self.assertEqual(
+            list(response.context['cl'].result_list), [self.cats]
+        )
@@ -0,0 +1,114 @@
+import math
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.utils import timezone
+
+from .. import trending
+from ..models import Comment, Follow, Group, Post, TrendingPost
+from .utils import name_to_url
+
+User = get_user_model()
+
+HALF_LIFE = timedelta(hours=6)
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.start = timezone.now()
+        cls.author = User.objects.create_user(username='author_1')
+        cls.reader = User.objects.create_user(username='reader_1')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test-slug', description='Описание'
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.now = self.start
+        patcher = mock.patch.object(
+            timezone, 'now', side_effect=lambda: self.now
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, text, group=None):
+        return Post.objects.create(
+            text=text, author=self.author, group=group
+        )
+
+    def comment(self, post, count=1):
+        for _ in range(count):
+            Comment.objects.create(
+                post=post, author=self.reader, text='Комментарий'
+            )
+
+    def test_comment_velocity_with_decay(self):
+        """Свежие комментарии весят больше старых."""
+        old, new, quiet = self.post('Старый'), self.post('Новый'), (
+            self.post('Тихий')
+        )
+        self.comment(old, 3)
+        self.now += 2 * HALF_LIFE
+        self.comment(new)
+        self.assertEqual(trending.rank()['posts'], [new.id, old.id])
+        self.assertFalse(TrendingPost.objects.filter(post=quiet).exists())
+        scores = dict(TrendingPost.objects.values_list('post', 'score'))
+        # Три комментария, остывших вдвое дважды, против одного свежего.
+        self.assertAlmostEqual(
+            scores[new.id] - scores[old.id], math.log(4) - math.log(3)
+        )
+
+    def test_follow_activity(self):
+        """Подписка поднимает только недавние посты автора."""
+        stale = self.post('Давний')
+        self.now += timedelta(hours=100)
+        fresh = self.post('Свежий')
+        commented = self.post('Обсуждаемый')
+        self.comment(commented)
+        Follow.follow(self.reader, self.author)
+        self.assertEqual(
+            trending.rank()['posts'], [commented.id, fresh.id]
+        )
+        self.assertFalse(TrendingPost.objects.filter(post=stale).exists())
+        entry = TrendingPost.objects.get(post=commented)
+        self.assertAlmostEqual(
+            entry.score, trending.logaddexp(entry.comments, entry.follows)
+        )
+
+    def test_page_reads_ranked_ids(self):
+        """Страница читает готовый список, пока он не устареет."""
+        first, second = self.post('Первый', self.group), self.post('Второй')
+        self.comment(first)
+        client = Client()
+        response = client.get(name_to_url(('posts:trending', None)))
+        self.assertEqual(response.context['posts'], [first])
+        self.assertEqual(response.context['groups'], [self.group])
+        self.comment(second, 2)
+        # Посты и группы, без запросов к Comment и TrendingPost.
+        with self.assertNumQueries(2):
+            response = client.get(name_to_url(('posts:trending', None)))
+        self.assertEqual(response.context['posts'], [first])
+        call_command('rank_trending', stdout=StringIO())
+        response = client.get(name_to_url(('posts:trending', None)))
+        self.assertEqual(response.context['posts'], [second, first])
+
+    def test_rebuild(self):
+        """Пересчёт совпадает с накопленными оценками и забывает старое."""
+        old, new = self.post('Старый'), self.post('Новый')
+        self.comment(old)
+        self.now += timedelta(hours=80)
+        self.comment(new, 2)
+        Follow.follow(self.reader, self.author)
+        before = dict(TrendingPost.objects.values_list('post', 'score'))
+        self.assertEqual(trending.rebuild(), 1)
+        after = dict(TrendingPost.objects.values_list('post', 'score'))
+        self.assertEqual(list(after), [new.id])
+        self.assertAlmostEqual(after[new.id], before[new.id])
+        self.assertEqual(cache.get(trending.RANKING_KEY)['posts'], [new.id])
@@ -5,11 +5,19 @@ import django.core.paginator
 from django import forms
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
 from django.test import Client, TestCase, override_settings
-
-from ..models import Comment, Follow, Group, Post
+from django.test.utils import CaptureQueriesContext
+
+from ..caching import get_versions
+from ..fragments import fragment_key
+from ..models import (AuthorStats, Comment, Follow, FollowSuggestion, Group,
+                      Post)
+from ..thumbnails import generate
+from ..utils import USERS_ON_PAGE
 from .utils import name_to_url
 
 User = get_user_model()
@@ -17,7 +25,7 @@ User = get_user_model()
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
-@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0)
 class PostPagesTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -161,6 +169,25 @@ class PostPagesTests(TestCase):
         response = self.authorized_client.get(name_to_url(self.GROUP2))
         self.assertNotIn(self.post, response.context['page_obj'])
 
+    def test_thumbnails_are_generated_in_background(self):
+        """Пока миниатюра не готова, страницы показывают заглушку."""
+        cache.clear()
+        pages = self.post_list + (self.POST_DETAIL,)
+        for name in pages:
+            with self.subTest(name=name):
+                response = self.authorized_client.get(name_to_url(name))
+                self.assertContains(response, 'Изображение обрабатывается')
+        generate(self.post.id)
+        for name in pages:
+            with self.subTest(name=name):
+                response = self.authorized_client.get(name_to_url(name))
+                self.assertNotContains(
+                    response, 'Изображение обрабатывается'
+                )
+                self.assertContains(response, '<img class="card-img my-2"')
+                for width in settings.POST_IMAGE_WIDTHS:
+                    self.assertContains(response, f' {width}w')
+
 
 class PaginatorViewsTest(TestCase):
     @classmethod
@@ -203,6 +230,112 @@ class PaginatorViewsTest(TestCase):
                     len(response.context['page_obj']), self.REMAIN_OF_POSTS
                 )
 
+    def test_cursor_pages(self):
+        """Переход по курсорам вперёд и назад."""
+        cache.clear()
+        for name in self.page_list:
+            with self.subTest(name=name):
+                first = self.client.get(name_to_url(name)).context['page_obj']
+                response = self.client.get(
+                    name_to_url(name), {'cursor': first.next_cursor}
+                )
+                second = response.context['page_obj']
+                self.assertEqual(second.number, 2)
+                self.assertEqual(len(second), self.REMAIN_OF_POSTS)
+                self.assertFalse(second.has_next())
+                response = self.client.get(
+                    name_to_url(name), {'cursor': second.previous_cursor}
+                )
+                self.assertEqual(
+                    list(response.context['page_obj']), list(first)
+                )
+                self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_pages_with_same_pub_date(self):
+        """Посты с одинаковой датой не теряются и не дублируются."""
+        cache.clear()
+        Post.objects.update(pub_date=Post.objects.first().pub_date)
+        first = self.client.get(
+            name_to_url(self.PROFILE)
+        ).context['page_obj']
+        second = self.client.get(
+            name_to_url(self.PROFILE), {'cursor': first.next_cursor}
+        ).context['page_obj']
+        ids = [post.id for post in list(first) + list(second)]
+        self.assertEqual(len(set(ids)), 13)
+
+    def test_cursor_page_does_not_count(self):
+        """Страница по курсору не выполняет COUNT."""
+        first = self.client.get(name_to_url(self.GROUP)).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(
+                name_to_url(self.GROUP), {'cursor': first.next_cursor}
+            )
+        for query in queries:
+            with self.subTest(sql=query['sql']):
+                self.assertNotIn('COUNT(', query['sql'])
+
+    def test_page_links_window(self):
+        """Ссылки на страницы ограничены окном и ведут на последнюю."""
+        for post in range(30):
+            Post.objects.create(text=f'more{post}', author=self.author)
+        response = self.client.get(name_to_url(self.PROFILE), {'page': 3})
+        page = response.context['page_obj']
+        self.assertEqual(
+            [number for number, query in page.page_links], [1, 2, 3, 4, 5]
+        )
+        response = self.client.get(
+            name_to_url(self.PROFILE), {'cursor': page.last_cursor}
+        )
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 5)
+        self.assertFalse(page.has_next())
+        # Последняя страница одинакова по курсору и по номеру.
+        by_number = self.client.get(name_to_url(self.PROFILE), {'page': 5})
+        self.assertEqual(list(page), list(by_number.context['page_obj']))
+
+    def test_page_links_use_cursors(self):
+        """Страницы окна открываются по курсору без OFFSET от начала."""
+        for post in range(30):
+            Post.objects.create(text=f'more{post}', author=self.author)
+        response = self.client.get(name_to_url(self.PROFILE), {'page': 3})
+        for number, query in response.context['page_obj'].page_links:
+            with self.subTest(number=number):
+                if number in (1, 3):
+                    self.assertEqual(query, f'page={number}')
+                    continue
+                self.assertTrue(query.startswith('cursor='))
+                by_cursor = self.client.get(
+                    name_to_url(self.PROFILE) + '?' + query
+                ).context['page_obj']
+                by_number = self.client.get(
+                    name_to_url(self.PROFILE), {'page': number}
+                ).context['page_obj']
+                self.assertEqual(by_cursor.number, number)
+                self.assertEqual(list(by_cursor), list(by_number))
+
+    def test_profile_does_not_load_all_posts(self):
+        """Профиль берёт число постов из счётчика, а не из выборки."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(name_to_url(self.PROFILE))
+        self.assertNotIn('posts', response.context)
+        self.assertEqual(response.context['stats'].posts, 13)
+        self.assertContains(response, 'Всего постов: 13')
+        for query in queries:
+            if query['sql'].startswith('SELECT "posts_post"."id"'):
+                with self.subTest(sql=query['sql']):
+                    self.assertIn(' LIMIT ', query['sql'])
+
+    def test_invalid_cursor_returns_first_page(self):
+        """Некорректный курсор ведёт на первую страницу."""
+        response = self.client.get(
+            name_to_url(self.GROUP), {'cursor': 'broken'}
+        )
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(
+            len(response.context['page_obj']), self.POSTS_ON_PAGE
+        )
+
 
 class CacheTests(TestCase):
     @classmethod
@@ -215,6 +348,7 @@ class CacheTests(TestCase):
         )
 
     def setUp(self):
+        cache.clear()
         self.authorized_client = Client()
         self.authorized_client.force_login(self.author)
 
@@ -222,13 +356,108 @@ class CacheTests(TestCase):
         """Тест кэширования страницы index.html"""
         self.INDEX = ('posts:index', None)
         response1 = self.authorized_client.get(name_to_url(self.INDEX))
-        self.post.delete()
+        Post.objects.filter(pk=self.post.pk).update(text='Без сигнала')
         response2 = self.authorized_client.get(name_to_url(self.INDEX))
         self.assertEqual(response1.content, response2.content)
         cache.clear()
         response3 = self.authorized_client.get(name_to_url(self.INDEX))
         self.assertNotEqual(response1.content, response3.content)
 
+    def test_cache_is_invalidated_by_post_changes(self):
+        """Изменение поста сразу сбрасывает кэш затронутых лент."""
+        pages = (
+            ('posts:index', None),
+            ('posts:profile', [self.author.username]),
+        )
+        for name in pages:
+            with self.subTest(name=name):
+                response = self.authorized_client.get(name_to_url(name))
+                self.assertContains(response, self.post.text)
+        self.post.text = 'Новый текст'
+        self.post.save()
+        for name in pages:
+            with self.subTest(name=name):
+                response = self.authorized_client.get(name_to_url(name))
+                self.assertContains(response, 'Новый текст')
+        Post.objects.create(text='Ещё один пост', author=self.author)
+        response = self.authorized_client.get(name_to_url(pages[0]))
+        self.assertContains(response, 'Ещё один пост')
+
+    def test_cache_is_invalidated_by_renames(self):
+        """Новое название группы и имя автора видны в лентах сразу."""
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(text='В группе', author=self.author, group=group)
+        index = name_to_url(('posts:index', None))
+        group_page = name_to_url(('posts:group_list', [group.slug]))
+        self.authorized_client.get(index)
+        self.authorized_client.get(group_page)
+        group.title = 'Переименованная'
+        group.save()
+        self.assertContains(
+            self.authorized_client.get(index), 'Переименованная'
+        )
+        self.assertContains(
+            self.authorized_client.get(group_page), 'Переименованная'
+        )
+        feeds = ('all', f'group:{group.slug}', 'author:author_1')
+        versions = get_versions(*feeds)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name, author.last_name = 'Лев', 'Толстой'
+        author.save()
+        changed = get_versions(*feeds)
+        for feed, old, new in zip(feeds, versions, changed):
+            with self.subTest(feed=feed):
+                self.assertNotEqual(old, new)
+        author.save(update_fields=['last_login'])
+        self.assertEqual(get_versions(*feeds), changed)
+
+    def test_post_fragments_follow_renames(self):
+        """Карточки поста показывают новое имя автора и группы."""
+        group = Group.objects.create(title='Группа', slug='group')
+        Post.objects.create(text='В группе', author=self.author, group=group)
+        index = name_to_url(('posts:index', None))
+        self.authorized_client.get(index)
+        author = User.objects.get(pk=self.author.pk)
+        author.first_name, author.last_name = 'Антон', 'Чехов'
+        author.save()
+        self.assertContains(self.authorized_client.get(index), 'Антон Чехов')
+        group.title = 'Переименованная'
+        group.save()
+        profile = name_to_url(('posts:profile', [self.author.username]))
+        self.assertContains(
+            self.authorized_client.get(profile), 'Переименованная'
+        )
+
+    def test_comments_fragment_is_invalidated(self):
+        """Новый комментарий виден на странице поста сразу."""
+        post_detail = name_to_url(('posts:post_detail', [self.post.id]))
+        self.authorized_client.get(post_detail)
+        Comment.objects.create(
+            post=self.post, author=self.author, text='Свежий комментарий'
+        )
+        response = self.authorized_client.get(post_detail)
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_post_fragments(self):
+        """Правка поста сбрасывает только его карточку."""
+        other = Post.objects.create(text='Другой пост', author=self.author)
+        self.authorized_client.get(name_to_url(('posts:index', None)))
+        keys = {
+            post.id: fragment_key(post.id, post.updated_at, 'feed')
+            for post in Post.objects.all()
+        }
+        self.assertEqual(len(cache.get_many(keys.values())), 2)
+        self.authorized_client.post(
+            name_to_url(('posts:post_edit', [self.post.id])),
+            {'text': 'Отредактированный текст'},
+        )
+        self.assertIsNone(cache.get(keys[self.post.id]))
+        self.assertIsNotNone(cache.get(keys[other.id]))
+        response = self.authorized_client.get(
+            name_to_url(('posts:index', None))
+        )
+        self.assertContains(response, 'Отредактированный текст')
+
 
 class FollowTests(TestCase):
     @classmethod
@@ -278,11 +507,159 @@ class FollowTests(TestCase):
         response = self.client_not_follower.get(name_to_url(self.FOLLOW))
         self.assertNotContains(response, self.post.text)
 
+    def test_follow_updates_follower_profile(self):
+        """Подписка и отписка обновляют и профиль подписчика."""
+        profile = name_to_url(
+            ('posts:profile', [self.user_follower.username])
+        )
+        self.assertContains(self.guest_client.get(profile), 'подписок: 0')
+        self.client_follower.get(name_to_url(self.PROFILE_FOLLOW))
+        self.assertContains(self.guest_client.get(profile), 'подписок: 1')
+        self.client_follower.get(name_to_url(self.PROFILE_UNFOLLOW))
+        self.assertContains(self.guest_client.get(profile), 'подписок: 0')
+
     def test_follow_for_guest_client(self):
         """Неавторизованный пользователь не может подписаться"""
         self.guest_client.get(name_to_url(self.PROFILE_FOLLOW))
         self.assertEqual(Follow.objects.all().count(), 0)
 
+    def test_follow_is_idempotent(self):
+        """Повторная подписка и отписка ничего не меняют."""
+        for _ in range(2):
+            self.client_follower.get(name_to_url(self.PROFILE_FOLLOW))
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(
+            AuthorStats.get_for(self.user_following.id).followers, 1
+        )
+        self.assertFalse(
+            Follow.follow(self.user_follower, self.user_following)
+        )
+        for _ in range(2):
+            self.client_follower.get(name_to_url(self.PROFILE_UNFOLLOW))
+        self.assertEqual(Follow.objects.count(), 0)
+        self.assertEqual(
+            AuthorStats.get_for(self.user_following.id).followers, 0
+        )
+
+    def test_self_follow(self):
+        """На себя подписаться нельзя даже в обход представления."""
+        self.assertFalse(
+            Follow.follow(self.user_follower, self.user_follower)
+        )
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Follow.objects.create(
+                user=self.user_follower, author=self.user_follower
+            )
+        self.assertEqual(Follow.objects.count(), 0)
+
+    def test_unknown_author(self):
+        """Подписка на несуществующего автора отвечает 404."""
+        for name in ('posts:profile_follow', 'posts:profile_unfollow'):
+            with self.subTest(name=name):
+                response = self.client_follower.get(
+                    name_to_url((name, ['nobody']))
+                )
+                self.assertEqual(response.status_code, 404)
+
+    def test_followed_authors(self):
+        """Подписки на нескольких авторов проверяются одним запросом."""
+        Follow.follow(self.user_follower, self.user_following)
+        authors = [self.user_following.id, self.user_not_follower.id]
+        with self.assertNumQueries(1):
+            followed = Follow.followed_authors(self.user_follower, authors)
+        self.assertEqual(followed, {self.user_following.id})
+        self.assertEqual(
+            Follow.followed_authors(AnonymousUser(), authors), set()
+        )
+
+    def test_suggestions(self):
+        """Рекомендации в ленте подписок без уже читаемых авторов."""
+        for rank, author in enumerate(
+            (self.user_following, self.user_not_follower)
+        ):
+            FollowSuggestion.objects.create(
+                user=self.user_follower, author=author, score=1, rank=rank
+            )
+        response = self.client_follower.get(name_to_url(self.FOLLOW))
+        self.assertEqual(
+            [s.author for s in response.context['suggestions']],
+            [self.user_following, self.user_not_follower],
+        )
+        Follow.follow(self.user_follower, self.user_following)
+        response = self.client_follower.get(name_to_url(self.FOLLOW))
+        self.assertEqual(
+            [s.author for s in response.context['suggestions']],
+            [self.user_not_follower],
+        )
+
+
+class FollowListTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.fans = [
+            User.objects.create_user(username=f'fan_{number}')
+            for number in range(USERS_ON_PAGE + 2)
+        ]
+        for fan in cls.fans:
+            Follow.follow(fan, cls.author)
+        Follow.follow(cls.author, cls.fans[0])
+        Follow.follow(cls.author, cls.fans[-1])
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(self.fans[-1])
+
+    def test_mutual_counter(self):
+        """Взаимные подписки считаются сигналами и при пересчёте."""
+        stats = AuthorStats.get_for(self.author.id)
+        self.assertEqual((stats.followers, stats.mutual), (
+            USERS_ON_PAGE + 2, 2
+        ))
+        self.assertEqual(AuthorStats.get_for(self.fans[0].id).mutual, 1)
+        Follow.unfollow(self.fans[0], self.author)
+        self.assertEqual(AuthorStats.get_for(self.author.id).mutual, 1)
+        self.assertEqual(AuthorStats.get_for(self.fans[0].id).mutual, 0)
+        self.assertEqual(AuthorStats.reset(self.author.id).mutual, 1)
+        Follow.follow(self.fans[0], self.author)
+
+    def test_followers_page(self):
+        """Подписчики листаются страницами, новые первыми."""
+        url = name_to_url(('posts:followers', [self.author.username]))
+        response = self.client.get(url)
+        people = response.context['people']
+        self.assertEqual(len(people), USERS_ON_PAGE)
+        self.assertEqual(people[0], (self.fans[-1], True, False))
+        self.assertEqual(people[1][1:], (False, False))
+        response = self.client.get(
+            url, {'cursor': response.context['page_obj'].next_cursor}
+        )
+        self.assertEqual(
+            [person for person, _, _ in response.context['people']],
+            [self.fans[1], self.fans[0]],
+        )
+
+    def test_following_page(self):
+        """Подписки показывают, подписан ли читатель на каждого."""
+        response = self.client.get(
+            name_to_url(('posts:following', [self.author.username]))
+        )
+        self.assertEqual(response.context['people'], [
+            (self.fans[-1], True, False), (self.fans[0], True, False),
+        ])
+        self.client.force_login(self.fans[1])
+        response = self.client.get(
+            name_to_url(('posts:following', [self.fans[-1].username]))
+        )
+        self.assertEqual(
+            response.context['people'], [(self.author, True, True)]
+        )
+        response = self.client.get(
+            name_to_url(('posts:following', ['nobody']))
+        )
+        self.assertEqual(response.status_code, 404)
+
 
 class CommentTests(TestCase):
     @classmethod
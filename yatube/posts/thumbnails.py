@@ -0,0 +1,187 @@
+"""Фоновая подготовка миниатюр картинок постов.
+
+Сохранение поста с новой картинкой (posts.signals) и импорт ставят
+пост в очередь пула потоков после коммита транзакции, недостающие
+миниатюры старых постов создаёт команда generate_thumbnails. Шаблоны
+не создают миниатюры сами: тег post_picture только ищет готовые в
+хранилище sorl и возвращает None, пока они не созданы, а шаблон
+показывает заглушку. Для каждой картинки создаются кадры нескольких
+ширин (POST_IMAGE_WIDTHS) в JPEG и, если установленный Pillow их
+поддерживает, в AVIF и WebP. Когда миниатюры готовы, карточки и
+страницы поста сбрасываются.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from PIL import Image, features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.base import EXTENSIONS, ThumbnailBackend
+from sorl.thumbnail.conf import defaults as default_settings
+from sorl.thumbnail.conf import settings as thumbnail_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import fragments
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+# Кадр карточки поста и его ширины для srcset.
+FRAME_WIDTH = 960
+FRAME_HEIGHT = 339
+BASE_FORMAT = 'JPEG'
+# Дополнительные форматы по убыванию сжатия и их MIME-типы.
+MODERN_FORMATS = (('AVIF', 'image/avif'), ('WEBP', 'image/webp'))
+
+
+def available_formats():
+    """Форматы, которые умеют сохранять и Pillow, и sorl."""
+    return [
+        (image_format, mime) for image_format, mime in MODERN_FORMATS
+        if image_format in EXTENSIONS
+        and features.check(image_format.lower())
+        and image_format in Image.SAVE
+    ]
+
+
+def rendition_options(width, image_format=BASE_FORMAT):
+    height = round(width * FRAME_HEIGHT / FRAME_WIDTH)
+    return f'{width}x{height}', {
+        'crop': 'center', 'upscale': True, 'format': image_format,
+    }
+
+
+def renditions():
+    """Все миниатюры поста: (геометрия, опции sorl)."""
+    formats = [BASE_FORMAT] + [name for name, _ in available_formats()]
+    return [
+        rendition_options(width, image_format)
+        for image_format in formats
+        for width in settings.POST_IMAGE_WIDTHS
+    ]
+
+
+_executor = None
+
+
+class ReadyThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, который только читает готовые миниатюры."""
+
+    def get_ready(self, file_, geometry_string, **options):
+        # Опции дополняются так же, как в ThumbnailBackend.get_thumbnail,
+        # иначе имя файла миниатюры не совпадёт.
+        source = ImageFile(file_)
+        if thumbnail_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault('format', self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(thumbnail_settings, attr)
+            if value != getattr(default_settings, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry_string, options)
+        return default.kvstore.get(ImageFile(name, default.storage))
+
+
+backend = ReadyThumbnailBackend()
+
+
+def ready_thumbnail(image, geometry_string, **options):
+    if not image:
+        return None
+    return backend.get_ready(image, geometry_string, **options)
+
+
+def srcset(image, image_format=BASE_FORMAT):
+    """Строка srcset из готовых миниатюр или None, пока их нет."""
+    candidates = []
+    for width in settings.POST_IMAGE_WIDTHS:
+        geometry_string, options = rendition_options(width, image_format)
+        thumbnail = ready_thumbnail(image, geometry_string, **options)
+        if thumbnail is None:
+            return None
+        candidates.append(f'{thumbnail.url} {width}w')
+    return ', '.join(candidates)
+
+
+def picture(image):
+    """Источники для <picture>: основная миниатюра и srcset по форматам.
+
+    None, пока основная миниатюра не создана.
+    """
+    if not image:
+        return None
+    geometry_string, options = rendition_options(FRAME_WIDTH)
+    fallback = ready_thumbnail(image, geometry_string, **options)
+    if fallback is None:
+        return None
+    sources = []
+    for image_format, mime in available_formats():
+        candidates = srcset(image, image_format)
+        if candidates:
+            sources.append({'type': mime, 'srcset': candidates})
+    return {
+        'src': fallback.url,
+        'srcset': srcset(image),
+        'sources': sources,
+    }
+
+
+def is_ready(image):
+    """Созданы ли все миниатюры картинки."""
+    return all(
+        ready_thumbnail(image, geometry_string, **options) is not None
+        for geometry_string, options in renditions()
+    )
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def generate(post_id):
+    """Создать все миниатюры поста и сбросить его кэш."""
+    from .signals import bump_post_feeds
+
+    try:
+        post = Post.objects.select_related('author').filter(
+            id=post_id
+        ).first()
+        if post is None or not post.image:
+            return
+        for geometry_string, options in renditions():
+            get_thumbnail(post.image, geometry_string, **options)
+        fragments.forget(post.id, post.updated_at)
+        bump_post_feeds(post, post.group_id)
+    except Exception:
+        logger.exception('Не удалось создать миниатюры поста %s', post_id)
+    finally:
+        close_old_connections()
+
+
+def schedule(post):
+    """Поставить миниатюры поста в очередь после коммита."""
+    if post.image:
+        schedule_many([post.id])
+
+
+def schedule_many(post_ids):
+    """Поставить миниатюры постов с картинками в очередь после коммита."""
+    post_ids = list(post_ids)
+    if not post_ids:
+        return
+    if not settings.THUMBNAIL_WORKERS:
+        transaction.on_commit(lambda: [
+            generate(post_id) for post_id in post_ids
+        ])
+        return
+    transaction.on_commit(lambda: [
+        get_executor().submit(generate, post_id) for post_id in post_ids
+    ])
@@ -0,0 +1,192 @@
+"""Лента подписок с раздачей постов при записи (fan-out on write).
+
+Новый пост сразу копируется в TimelineEntry каждого подписчика автора,
+поэтому follow_index читает готовый список вместо соединения Follow и
+Post. Посты авторов, у которых больше TIMELINE_FANOUT_LIMIT
+подписчиков, не раздаются, а подмешиваются при чтении: TimelinePaginator
+читает записи ленты и посты таких авторов по их индексам и сливает.
+Когда автор опускается до порога, его последние посты раздаются
+подписчикам заново (author_demoted).
+
+Длина ленты ограничивается TIMELINE_MAX_ENTRIES при подписке, командой
+trim_timelines и при раздаче: каждый пост обрезает ленту подписчика с
+вероятностью 1 / TIMELINE_TRIM_EVERY, так что лента в среднем
+превышает предел не больше чем на TIMELINE_TRIM_EVERY записей.
+"""
+import random
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+from .models import AuthorStats, Follow, Post, TimelineEntry
+from .utils import KeysetPaginator
+
+FANOUT_BATCH_SIZE = 500
+
+
+def is_celebrity(author_id):
+    followers = AuthorStats.get_for(author_id).followers
+    return followers > settings.TIMELINE_FANOUT_LIMIT
+
+
+def add_entries(entries):
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+
+
+def fan_out(post):
+    """Добавить новый пост в ленты подписчиков автора."""
+    if is_celebrity(post.author_id):
+        return
+    spread(post.author_id, [(post.id, post.pub_date)])
+
+
+def spread(author_id, posts):
+    """Добавить посты [(id, pub_date)] в ленты всех подписчиков автора."""
+    followers = Follow.objects.filter(
+        author_id=author_id
+    ).values_list('user_id', flat=True)
+    batch, trimmed = [], []
+    for user_id in followers.iterator():
+        batch.extend(
+            TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+            for post_id, pub_date in posts
+        )
+        if len(posts) > 1 or (
+            random.random() * settings.TIMELINE_TRIM_EVERY < 1
+        ):
+            trimmed.append(user_id)
+        if len(batch) >= FANOUT_BATCH_SIZE:
+            add_entries(batch)
+            batch = []
+    if batch:
+        add_entries(batch)
+    for user_id in trimmed:
+        trim(user_id)
+
+
+def author_unfollowed(author_id):
+    if AuthorStats.objects.filter(
+        pk=author_id, followers=settings.TIMELINE_FANOUT_LIMIT
+    ).exists():
+        author_demoted(author_id)
+
+
+def author_demoted(author_id):
+    """Раздать последние посты автора, опустившегося до порога.
+
+    Пока подписчиков было больше TIMELINE_FANOUT_LIMIT, его посты
+    читались вместе с лентой, а теперь лента читается без них.
+    """
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.TIMELINE_MAX_ENTRIES]
+    spread(author_id, list(posts))
+
+
+def backfill(user_id, author_id):
+    """Добавить в ленту последние посты автора после подписки."""
+    if is_celebrity(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by(
+        '-pub_date', '-id'
+    ).values_list('id', 'pub_date')[:settings.TIMELINE_MAX_ENTRIES]
+    add_entries([
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    ])
+    trim(user_id)
+
+
+def backfill_many(user_id, author_ids):
+    """backfill для многих авторов сразу: запросы не зависят от их числа."""
+    celebrities = AuthorStats.objects.filter(
+        pk__in=author_ids, followers__gt=settings.TIMELINE_FANOUT_LIMIT
+    ).values_list('pk', flat=True)
+    posts = Post.objects.filter(author_id__in=author_ids).exclude(
+        author_id__in=celebrities
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'pub_date'
+    )[:settings.TIMELINE_MAX_ENTRIES]
+    add_entries([
+        TimelineEntry(user_id=user_id, post_id=post_id, pub_date=pub_date)
+        for post_id, pub_date in posts
+    ])
+    trim(user_id)
+
+
+def remove_author(user_id, author_id):
+    TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+
+
+def trim(user_id):
+    """Оставить в ленте не больше TIMELINE_MAX_ENTRIES записей."""
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    kept = entries.order_by('-pub_date', '-post_id').values_list(
+        'pub_date', 'post_id'
+    )
+    try:
+        pub_date, post_id = kept[settings.TIMELINE_MAX_ENTRIES - 1]
+    except IndexError:
+        return
+    entries.filter(
+        Q(pub_date__lt=pub_date) | Q(pub_date=pub_date, post_id__lt=post_id)
+    ).delete()
+
+
+class TimelinePaginator(KeysetPaginator):
+    """Лента подписок: записи ленты и посты популярных авторов.
+
+    Каждый источник читается по своему индексу от ключа страницы,
+    результаты сливаются по (pub_date, id), а посты загружаются одним
+    запросом по id.
+    """
+
+    def __init__(self, object_list, per_page, counter=None, user=None,
+                 **kwargs):
+        super().__init__(object_list, per_page, counter, **kwargs)
+        self.user = user
+
+    @cached_property
+    def celebrities(self):
+        return list(Follow.objects.filter(
+            user=self.user,
+            author__stats__followers__gt=settings.TIMELINE_FANOUT_LIMIT,
+        ).values_list('author', flat=True))
+
+    def source(self, queryset, keys, values, reverse, stop):
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, reverse, keys))
+        ordering = [key if reverse else f'-{key}' for key in keys]
+        return list(queryset.order_by(*ordering).values_list(*keys)[:stop])
+
+    def rows(self, values, reverse, start, stop):
+        keys = self.source(
+            TimelineEntry.objects.filter(user=self.user),
+            ('pub_date', 'post'), values, reverse, stop,
+        )
+        if self.celebrities:
+            keys = set(keys).union(self.source(
+                Post.objects.filter(author__in=self.celebrities),
+                ('pub_date', 'id'), values, reverse, stop,
+            ))
+        keys = sorted(keys, reverse=not reverse)[start:stop]
+        posts = self.object_list.in_bulk([post_id for _, post_id in keys])
+        return [posts[post_id] for _, post_id in keys if post_id in posts]
+
+
+def timeline_posts(user):
+    """Посты ленты подписок: раздача плюс посты популярных авторов.
+
+    Запрос с OR подходит для подсчёта; страницы читает TimelinePaginator.
+    """
+    entries = TimelineEntry.objects.filter(user=user).values('post')
+    celebrities = Follow.objects.filter(
+        user=user,
+        author__stats__followers__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values('author')
+    return Post.objects.filter(
+        Q(id__in=entries) | Q(author__in=celebrities)
+    )
@@ -0,0 +1,352 @@
+"""Перенос постов между окружениями в формате NDJSON.
+
+Одна строка — одна запись: {"model": "post", "id": ..., ...}. Записи
+идут в порядке group, post, comment, follow, внутри модели — по id.
+Первичные ключи постов и комментариев сохраняются: id, занятый другой
+записью, останавливает импорт с ImportConflict. Группы связываются по
+slug, пользователи — по username и создаются при импорте без пароля.
+Экспорт читает таблицы через iterator(), импорт пишет пачками через
+bulk_create, поэтому память не зависит от размера таблиц. Состояние
+после каждой пачки пишется в файл контрольной точки, и прерванная
+команда продолжает с него.
+"""
+import base64
+import json
+import os
+from collections import defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+
+from . import search, thumbnails, timeline
+from .models import (AuthorStats, Comment, FeedCounter, Follow, Group,
+                     MediaBlob, Post)
+
+User = get_user_model()
+
+MODELS = ('group', 'post', 'comment', 'follow')
+DATES = ('pub_date', 'updated_at', 'created')
+# Поля связей выгружаются естественными ключами.
+RELATIONS = {
+    'author_name': 'author', 'user_name': 'user', 'group_slug': 'group',
+}
+
+
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return {}
+    with open(path) as checkpoint:
+        return json.load(checkpoint)
+
+
+def write_checkpoint(path, state):
+    if not path:
+        return
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as checkpoint:
+        json.dump(state, checkpoint)
+    os.replace(temporary, path)
+
+
+def clear_checkpoint(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+# Экспорт
+
+def export_queryset(model):
+    if model == 'group':
+        return Group.objects.values('id', 'title', 'slug', 'description')
+    if model == 'post':
+        return Post.objects.values(
+            'id', 'text', 'pub_date', 'updated_at', 'image',
+            author_name=F('author__username'),
+            group_slug=F('group__slug'),
+        )
+    if model == 'comment':
+        return Comment.objects.values(
+            'id', 'post', 'text', 'created', 'parent', 'root', 'path',
+            author_name=F('author__username'),
+        )
+    return Follow.objects.values(
+        'id',
+        user_name=F('user__username'),
+        author_name=F('author__username'),
+    )
+
+
+def export_record(model, row, images=False):
+    record = {'model': model}
+    for key, value in row.items():
+        key = RELATIONS.get(key, key)
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        record[key] = value
+    if images and model == 'post' and record['image']:
+        with Post.image.field.storage.open(record['image']) as image:
+            record['image_data'] = base64.b64encode(image.read()).decode()
+    return record
+
+
+def export_chunks(state, chunk_size, images=False):
+    """Пачки (модель, последний id, строки NDJSON) после state."""
+    models = MODELS[MODELS.index(state['model']):] if state else MODELS
+    for model in models:
+        after = state.get('after', 0) if model == state.get('model') else 0
+        rows = export_queryset(model).filter(id__gt=after).order_by('id')
+        lines = []
+        for row in rows.iterator(chunk_size=chunk_size):
+            lines.append(json.dumps(
+                export_record(model, row, images), ensure_ascii=False
+            ))
+            if len(lines) >= chunk_size:
+                yield model, row['id'], lines
+                lines = []
+        if lines:
+            yield model, row['id'], lines
+
+
+# Импорт
+
+class ImportConflict(Exception):
+    """Запись файла заняла бы id другой записи."""
+
+
+def restore_dates(model, fields, rows):
+    """Записать даты из файла поверх времени, которое поставил bulk_create.
+
+    bulk_create заполняет поля auto_now и auto_now_add текущим временем.
+    rows — пары (pk, значения fields); пустые значения не меняются.
+    """
+    fields = [model._meta.get_field(name) for name in fields]
+    quote = connection.ops.quote_name
+    sql = 'UPDATE {} SET {} WHERE {} = %s'.format(
+        quote(model._meta.db_table),
+        ', '.join(
+            '{0} = COALESCE(%s, {0})'.format(quote(field.column))
+            for field in fields
+        ),
+        quote(model._meta.pk.column),
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, [
+            [
+                field.get_db_prep_value(value, connection)
+                for field, value in zip(fields, values)
+            ] + [pk]
+            for pk, values in rows
+        ])
+
+
+def forget_derived_data(author_ids=(), group_ids=(), all_posts=False,
+                        images=()):
+    """Пересчитать производные данные затронутых записей.
+
+    bulk_create не вызывает сигналы. Статистика авторов и ссылки на
+    картинки пересчитываются сразу, счётчики лент — при первом
+    обращении.
+    """
+    if author_ids:
+        AuthorStats.reset_many(author_ids)
+    counters = Q(feed=FeedCounter.GROUP, object_id__in=set(group_ids))
+    if all_posts:
+        counters |= Q(feed=FeedCounter.ALL)
+    FeedCounter.objects.filter(counters).delete()
+    for name in set(images):
+        MediaBlob.reset(name)
+
+
+def new_records(model, records, identity):
+    """Записи, которых ещё нет в базе.
+
+    Записи с теми же id и identity уже загружены прошлым запуском.
+    Если id занят другой записью, загрузка останавливается: иначе
+    ignore_conflicts молча потерял бы запись, а ответы на неё
+    прикрепились бы к чужой.
+    """
+    existing = {
+        row[0]: row[1:] for row in model.objects.filter(
+            id__in=[record['id'] for record in records]
+        ).values_list('id', *identity.values())
+    }
+    fresh = []
+    for record in records:
+        if record['id'] not in existing:
+            fresh.append(record)
+            continue
+        values = tuple(
+            date(record[key]) if key in DATES else record[key]
+            for key in identity
+        )
+        if values != existing[record['id']]:
+            raise ImportConflict(
+                f'{model._meta.verbose_name} {record["id"]} уже есть '
+                f'в базе и не совпадает с файлом'
+            )
+    return fresh
+
+
+def user_ids(usernames):
+    usernames = set(usernames)
+    User.objects.bulk_create(
+        (
+            User(username=username, password=make_password(None))
+            for username in usernames
+        ),
+        ignore_conflicts=True,
+    )
+    return dict(
+        User.objects.filter(username__in=usernames).values_list(
+            'username', 'id'
+        )
+    )
+
+
+def group_ids(slugs):
+    return dict(
+        Group.objects.filter(slug__in=set(slugs)).values_list('slug', 'id')
+    )
+
+
+def date(value):
+    return parse_datetime(value) if value else None
+
+
+def import_image(record):
+    data = record.get('image_data')
+    if not data:
+        return record['image']
+    field = Post.image.field
+    return field.storage.save(
+        field.upload_to + os.path.basename(record['image']),
+        ContentFile(base64.b64decode(data)),
+    )
+
+
+def import_groups(records):
+    # Группы связываются по slug, поэтому их id не переносятся.
+    Group.objects.bulk_create(
+        (
+            Group(
+                title=record['title'], slug=record['slug'],
+                description=record['description'],
+            )
+            for record in records
+        ),
+        ignore_conflicts=True,
+    )
+
+
+def import_posts(records):
+    records = new_records(Post, records, {
+        'author': 'author__username', 'pub_date': 'pub_date',
+    })
+    users = user_ids(record['author'] for record in records)
+    groups = group_ids(
+        record['group'] for record in records if record['group']
+    )
+    posts = [
+        Post(
+            id=record['id'], text=record['text'],
+            author_id=users[record['author']],
+            group_id=groups.get(record['group']),
+            image=import_image(record),
+        )
+        for record in records
+    ]
+    Post.objects.bulk_create(posts)
+    restore_dates(Post, ('pub_date', 'updated_at'), [
+        (record['id'], (date(record['pub_date']), date(record['updated_at'])))
+        for record in records
+    ])
+    search.index_posts(posts)
+    forget_derived_data(
+        author_ids={post.author_id for post in posts},
+        group_ids={post.group_id for post in posts if post.group_id},
+        all_posts=bool(posts),
+        images=[post.image.name for post in posts if post.image],
+    )
+    # bulk_create не шлёт post_save: ленты подписчиков и миниатюры
+    # заполняются здесь.
+    by_author = defaultdict(list)
+    for record, post in zip(records, posts):
+        by_author[post.author_id].append(
+            (post.id, date(record['pub_date']))
+        )
+    for author_id, author_posts in by_author.items():
+        if not timeline.is_celebrity(author_id):
+            timeline.spread(author_id, author_posts)
+    thumbnails.schedule_many(post.id for post in posts if post.image)
+
+
+def import_comments(records):
+    records = new_records(Comment, records, {
+        'author': 'author__username', 'post': 'post', 'created': 'created',
+    })
+    users = user_ids(record['author'] for record in records)
+    Comment.objects.bulk_create(
+        Comment(
+            id=record['id'], post_id=record['post'], text=record['text'],
+            author_id=users[record['author']],
+            parent_id=record.get('parent'), root_id=record.get('root'),
+            path=record.get('path', ''),
+        )
+        for record in records
+    )
+    restore_dates(Comment, ('created',), [
+        (record['id'], (date(record['created']),)) for record in records
+    ])
+    forget_derived_data(author_ids=Post.objects.filter(
+        id__in={record['post'] for record in records}
+    ).values_list('author_id', flat=True))
+
+
+def import_follows(records):
+    # Подписки связываются по паре пользователей, их id не переносятся.
+    users = user_ids(
+        name for record in records
+        for name in (record['user'], record['author'])
+    )
+    pairs = {
+        (users[record['user']], users[record['author']])
+        for record in records
+        if record['user'] != record['author']
+    }
+    existing = Follow.objects.filter(
+        user__in={user_id for user_id, _ in pairs},
+        author__in={author_id for _, author_id in pairs},
+    ).values_list('user', 'author')
+    follows = [
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id, author_id in sorted(pairs - set(existing))
+    ]
+    Follow.objects.bulk_create(follows)
+    forget_derived_data(author_ids={
+        user_id for follow in follows
+        for user_id in (follow.user_id, follow.author_id)
+    })
+    for follow in follows:
+        timeline.backfill(follow.user_id, follow.author_id)
+
+
+IMPORTERS = {
+    'group': import_groups,
+    'post': import_posts,
+    'comment': import_comments,
+    'follow': import_follows,
+}
+
+
+def import_chunk(records):
+    """Записать пачку записей, сгруппировав их по моделям."""
+    by_model = {}
+    for record in records:
+        by_model.setdefault(record['model'], []).append(record)
+    for model in MODELS:
+        if model in by_model:
+            IMPORTERS[model](by_model[model])
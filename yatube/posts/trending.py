@@ -0,0 +1,149 @@
+"""Популярные посты и группы.
+
+Оценка поста — сумма весов событий (комментариев к посту и подписок на
+его автора), каждое из которых теряет половину веса за
+TRENDING_HALF_LIFE часов. Чтобы событие не требовало пересчёта
+остальных постов, веса приводятся к общей эпохе (forward decay):
+событие в момент t весит weight * 2 ** ((t - EPOCH) / half_life).
+Порядок таких сумм совпадает с порядком оценок на текущий момент, а
+хранятся их логарифмы, которые растут линейно и не переполняются.
+
+Новое событие прибавляется одним INSERT ... ON CONFLICT DO UPDATE,
+индекс по score держит посты отсортированными. Страница популярного
+читает готовый список id из кэша: он строится по индексу без агрегатов
+по Comment и живёт TRENDING_CACHE_TIMEOUT секунд. Команда rank_trending
+заново считает вклад комментариев за TRENDING_WINDOW часов, удаляет
+остывшие посты и обновляет список.
+"""
+import math
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import Comment, Post, TrendingPost
+
+EPOCH = datetime(2022, 1, 1, tzinfo=timezone.utc)
+RANKING_KEY = 'trending:ranking'
+
+CREDIT = (
+    'INSERT INTO {table} (post_id, comments, follows, score) '
+    'SELECT id, {comments}, {follows}, %s FROM {posts} WHERE {where} '
+    'ON CONFLICT (post_id) DO UPDATE SET '
+    '{column} = COALESCE(excluded.score '
+    '+ LN(1 + EXP({table}.{column} - excluded.score)), excluded.score), '
+    'score = excluded.score + LN(1 + EXP({table}.score - excluded.score))'
+)
+
+
+def log_weight(weight, when):
+    """Логарифм веса события, приведённого к эпохе."""
+    half_life = settings.TRENDING_HALF_LIFE * 3600
+    return (
+        math.log(weight)
+        + math.log(2) * (when - EPOCH).total_seconds() / half_life
+    )
+
+
+def logaddexp(first, second):
+    """log(e ** first + e ** second); None — пустая сумма."""
+    if first is None:
+        return second
+    if second is None:
+        return first
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def credit(column, weight, where, params):
+    """Прибавить событие к оценке постов, выбранных условием where."""
+    value = log_weight(weight, timezone.now())
+    values = {'comments': 'NULL', 'follows': 'NULL', column: '%s'}
+    with connection.cursor() as cursor:
+        cursor.execute(CREDIT.format(
+            table=TrendingPost._meta.db_table,
+            posts=Post._meta.db_table,
+            where=where,
+            column=column,
+            **values,
+        ), [value, value, *params])
+
+
+def comment_added(comment):
+    credit(
+        'comments', settings.TRENDING_COMMENT_WEIGHT, 'id = %s',
+        [comment.post_id],
+    )
+
+
+def author_followed(author_id, count=1):
+    """count подписок поднимают посты автора за окно TRENDING_WINDOW."""
+    since = timezone.now() - timedelta(hours=settings.TRENDING_WINDOW)
+    credit(
+        'follows', settings.TRENDING_FOLLOW_WEIGHT * count,
+        'author_id = %s AND pub_date >= %s',
+        [author_id, connection.ops.adapt_datetimefield_value(since)],
+    )
+
+
+def rank():
+    """Готовые списки id постов и групп по убыванию оценки.
+
+    Оценка группы — сумма оценок её постов из списка.
+    """
+    rows = list(TrendingPost.objects.order_by('-score').values_list(
+        'post_id', 'post__group_id', 'score'
+    )[:settings.TRENDING_SIZE])
+    groups = {}
+    for _, group_id, score in rows:
+        if group_id is not None:
+            groups[group_id] = logaddexp(groups.get(group_id), score)
+    return {
+        'posts': [post_id for post_id, _, _ in rows],
+        'groups': sorted(groups, key=lambda group: (-groups[group], group)),
+    }
+
+
+def ranking():
+    ranked = cache.get(RANKING_KEY)
+    if ranked is None:
+        ranked = rank()
+        cache.set(RANKING_KEY, ranked, settings.TRENDING_CACHE_TIMEOUT)
+    return ranked
+
+
+def rebuild():
+    """Пересчитать оценки за окно TRENDING_WINDOW; вернуть число постов.
+
+    Вклад комментариев считается заново по таблице Comment, вклад
+    подписок сохраняется, пока не остынет ниже веса 1 на краю окна.
+    Чтение Comment и замена оценок идут в одной транзакции, иначе
+    комментарий, добавленный между ними, пропал бы из оценки.
+    """
+    since = timezone.now() - timedelta(hours=settings.TRENDING_WINDOW)
+    weight = settings.TRENDING_COMMENT_WEIGHT
+    comments = {}
+    with transaction.atomic():
+        for post_id, created in Comment.objects.filter(
+            created__gte=since
+        ).values_list('post_id', 'created').iterator():
+            comments[post_id] = logaddexp(
+                comments.get(post_id), log_weight(weight, created)
+            )
+        follows = dict(TrendingPost.objects.filter(
+            follows__gte=log_weight(1, since)
+        ).values_list('post_id', 'follows'))
+        TrendingPost.objects.all().delete()
+        TrendingPost.objects.bulk_create(
+            TrendingPost(
+                post_id=post_id,
+                comments=comments.get(post_id),
+                follows=follows.get(post_id),
+                score=logaddexp(comments.get(post_id), follows.get(post_id)),
+            )
+            for post_id in comments.keys() | follows.keys()
+        )
+    cache.set(RANKING_KEY, rank(), settings.TRENDING_CACHE_TIMEOUT)
+    return len(comments.keys() | follows.keys())
@@ -1,10 +1,245 @@
-from django.core.paginator import Paginator
+import json
+from math import ceil
+
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Paginator
+from django.db.models import Q
+from django.utils.encoding import force_bytes, force_str
+from django.utils.functional import cached_property
+from django.utils.http import urlsafe_base64_decode, urlsafe_base64_encode
+
+from .counters import ExactCounter
 
 POSTS_ON_PAGE = 10
+COMMENTS_ON_PAGE = 20
+REPLIES_ON_PAGE = 10
+USERS_ON_PAGE = 50
+SUGGESTIONS_ON_PAGE = 5
+GROUPS_ON_PAGE = 5
+PAGE_LINKS_ON_EACH_SIDE = 2
+
+
+class KeysetPaginator(Paginator):
+    """Пагинация по ключу (pub_date, id) вместо COUNT и OFFSET.
+
+    Позиция, направление и номер страницы зашиты в непрозрачный курсор,
+    поэтому стоимость запроса не зависит от глубины страницы. Курсоры
+    на страницы через одну от текущей пропускают не больше
+    PAGE_LINKS_ON_EACH_SIDE страниц после ключа, курсор последней
+    страницы знает её размер. Ссылки вида ?page=N обслуживаются обычной
+    постраничной выборкой.
+    Общее количество постов берётся из counter (см. posts.counters).
+    """
+    keys = ('pub_date', 'id')
+    descending = True
+
+    def __init__(self, object_list, per_page, counter=None, **kwargs):
+        ordering = [
+            ('-' if self.descending else '') + key for key in self.keys
+        ]
+        super().__init__(object_list.order_by(*ordering), per_page, **kwargs)
+        self.counter = counter or ExactCounter()
+        self.window = None
+
+    @cached_property
+    def count(self):
+        return self.counter.count(self.object_list)
+
+    @property
+    def last_page_number(self):
+        return max(1, ceil(self.count / self.per_page))
+
+    @property
+    def num_pages(self):
+        # Для страницы по курсору известны только номер и наличие
+        # следующей страницы, общее количество не считается.
+        if self.window is None:
+            return super().num_pages
+        number, has_next = self.window
+        return number + 1 if has_next else number
+
+    def make_cursor(self, obj, number, reverse=False, skip=0, size=None):
+        """Курсор страницы number после (или до) obj.
+
+        skip — сколько строк пропустить после ключа, size — размер
+        страницы, если он меньше per_page (последняя страница).
+        """
+        values = None
+        if obj is not None:
+            values = [
+                self.object_list.model._meta.get_field(key)
+                .value_to_string(obj)
+                for key in self.keys
+            ]
+        data = json.dumps([number, reverse, values, skip, size])
+        return urlsafe_base64_encode(force_bytes(data))
+
+    def read_cursor(self, cursor):
+        try:
+            # Курсоры без skip и size остались от прежних ссылок.
+            number, reverse, values, skip, size = (json.loads(
+                force_str(urlsafe_base64_decode(cursor))
+            ) + [0, None])[:5]
+            if not isinstance(number, int) or number < 1:
+                raise ValueError(number)
+            max_skip = self.per_page * PAGE_LINKS_ON_EACH_SIDE
+            if not isinstance(skip, int) or not 0 <= skip <= max_skip:
+                raise ValueError(skip)
+            if size is not None and (
+                not isinstance(size, int) or not 0 < size <= self.per_page
+            ):
+                raise ValueError(size)
+            if values is None and not reverse:
+                raise ValueError(values)
+            if values is not None:
+                if len(values) != len(self.keys):
+                    raise ValueError(values)
+                values = [
+                    self.object_list.model._meta.get_field(key)
+                    .to_python(value)
+                    for key, value in zip(self.keys, values)
+                ]
+        except (TypeError, ValueError, ValidationError):
+            raise InvalidPage('Некорректный курсор')
+        return number, bool(reverse), values, skip, size
+
+    def seek(self, values, reverse=False, keys=None):
+        keys = keys or self.keys
+        lookup = 'lt' if reverse != self.descending else 'gt'
+        condition = Q()
+        for position, key in enumerate(keys):
+            equal = dict(zip(keys[:position], values))
+            equal[f'{key}__{lookup}'] = values[position]
+            condition |= Q(**equal)
+        return condition
+
+    def rows(self, values, reverse, start, stop):
+        """Строки start:stop после ключа values (без него — от начала)."""
+        queryset = self.object_list
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, reverse))
+        if reverse:
+            queryset = queryset.reverse()
+        return list(queryset[start:stop])
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        return self._get_page(
+            self.rows(None, False, bottom, bottom + self.per_page),
+            number, self,
+        )
+
+    def cursor_page(self, cursor=None):
+        """Страница, следующая за курсором (или первая страница).
+
+        Курсор без значений ключа в обратном направлении указывает
+        на последнюю страницу ленты.
+        """
+        number, reverse, values, skip, size = 1, False, None, 0, None
+        if cursor is not None:
+            number, reverse, values, skip, size = self.read_cursor(cursor)
+        limit = size or self.per_page
+        object_list = self.rows(values, reverse, skip, skip + limit + 1)
+        has_more = len(object_list) > limit
+        object_list = object_list[:limit]
+        if reverse:
+            object_list.reverse()
+            number = max(number, 2) if has_more else 1
+            has_next = values is not None
+        else:
+            has_next = has_more
+        if not object_list and number > 1:
+            return self.cursor_page()
+        self.window = (number, has_next)
+        return self._get_page(object_list, number, self)
+
+    def get_cursor_page(self, cursor):
+        try:
+            return self.cursor_page(cursor)
+        except InvalidPage:
+            return self.cursor_page()
+
+    def _get_page(self, object_list, number, paginator):
+        object_list = list(object_list)
+        page = super()._get_page(object_list, number, paginator)
+        page.next_cursor = page.previous_cursor = None
+        if page.has_next():
+            page.next_cursor = self.make_cursor(object_list[-1], number + 1)
+        if page.has_previous() and object_list:
+            page.previous_cursor = self.make_cursor(
+                object_list[0], number - 1, reverse=True
+            )
+        page.page_links, page.last_cursor = self.page_links(page), None
+        if page.has_next():
+            last = max(self.last_page_number, number + 1)
+            size = self.count - (last - 1) * self.per_page
+            page.last_cursor = self.make_cursor(
+                None, last, reverse=True,
+                size=size if 0 < size < self.per_page else None,
+            )
+        return page
+
+    def page_links(self, page):
+        """Ограниченное окно ссылок на соседние страницы.
+
+        Страницы окна открываются по курсору от краёв текущей
+        страницы, первая — по номеру, чтобы шаблон не перебирал весь
+        page_range.
+        """
+        last = page.number
+        if page.has_next():
+            last = max(self.last_page_number, page.number + 1)
+        first = max(1, page.number - PAGE_LINKS_ON_EACH_SIDE)
+        last = min(last, page.number + PAGE_LINKS_ON_EACH_SIDE)
+        links = []
+        for number in range(first, last + 1):
+            distance = abs(number - page.number)
+            skip = (distance - 1) * self.per_page
+            if number > page.number and page.object_list:
+                cursor = self.make_cursor(
+                    page.object_list[-1], number, skip=skip
+                )
+                query = f'cursor={cursor}'
+            elif 1 < number < page.number and page.object_list:
+                cursor = self.make_cursor(
+                    page.object_list[0], number, reverse=True, skip=skip
+                )
+                query = f'cursor={cursor}'
+            else:
+                query = f'page={number}'
+            links.append((number, query))
+        return links
+
+
+class CommentPaginator(KeysetPaginator):
+    """Комментарии от старых к новым, только вперёд по курсору.
+
+    Страницы подгружаются одна за другой, поэтому ни количество, ни
+    ссылки на соседние страницы не нужны.
+    """
+    keys = ('created', 'id')
+    descending = False
+
+    def _get_page(self, object_list, number, paginator):
+        page = Paginator._get_page(self, list(object_list), number, paginator)
+        page.next_cursor = None
+        if page.has_next():
+            page.next_cursor = self.make_cursor(
+                page.object_list[-1], number + 1
+            )
+        return page
+
+
+class FollowPaginator(KeysetPaginator):
+    """Подписки от новых к старым по id."""
+    keys = ('id',)
 
 
-def paginator(post_list, request):
-    paginator = Paginator(post_list, POSTS_ON_PAGE)
+def paginator(post_list, request, counter=None,
+              paginator_class=KeysetPaginator, per_page=POSTS_ON_PAGE):
+    paginator = paginator_class(post_list, per_page, counter)
     page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    return page_obj
+    if 'cursor' not in request.GET and page_number is not None:
+        return paginator.get_page(page_number)
+    return paginator.get_cursor_page(request.GET.get('cursor'))
@@ -1,63 +1,168 @@
+from functools import partial
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
+from django.core.paginator import Paginator
+from django.http import Http404, JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
-from django.views.decorators.cache import cache_page
 
+from .caching import cache_feed, get_versions
+from .comments import CommentPage, serialize
+from .counters import AuthorCounter, feed_counter
+from .fragments import forget
 from .forms import CommentForm, PostForm
-from .models import Follow, Group, Post
-from .utils import paginator
+from .models import (AuthorStats, FeedCounter, Follow, FollowSuggestion,
+                     Group, Post)
+from .search import search_ids, snippet
+from .timeline import TimelinePaginator, timeline_posts
+from .trending import ranking
+from .utils import (GROUPS_ON_PAGE, POSTS_ON_PAGE, SUGGESTIONS_ON_PAGE,
+                    USERS_ON_PAGE, FollowPaginator, paginator)
 
 
-@cache_page(20, key_prefix='index_page')
+@cache_feed('all')
 def index(request):
     post_list = Post.objects.select_related('author', 'group')
     context = {
-        'page_obj': paginator(post_list, request),
+        'page_obj': paginator(
+            post_list, request, feed_counter(FeedCounter.ALL)
+        ),
     }
     return render(request, 'posts/index.html', context)
 
 
+@cache_feed('group:{slug}')
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
+    post_list = group.posts.select_related('author', 'group')
     context = {
         'group': group,
-        'page_obj': paginator(post_list, request),
+        'page_obj': paginator(
+            post_list, request, feed_counter(FeedCounter.GROUP, group.id)
+        ),
         'is_group': True,
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@cache_feed('author:{username}')
 def profile(request, username):
     user = get_object_or_404(User, username=username)
-    post_list = user.posts.all()
-    if request.user.is_authenticated:
-        following = Follow.objects.filter(
-            user=request.user, author=user
-        ).exists()
-    else:
-        following = False
+    post_list = user.posts.select_related('author', 'group')
+    following = user.id in Follow.followed_authors(request.user, [user.id])
     context = {
         'author': user,
-        'posts': post_list,
-        'page_obj': paginator(post_list, request),
+        'stats': AuthorStats.get_for(user.id),
+        'page_obj': paginator(
+            post_list, request, feed_counter('author', user.id)
+        ),
         'following': following,
     }
     return render(request, 'posts/profile.html', context)
 
 
+def follow_list(request, author, follows, relation):
+    """Страница подписчиков или подписок author.
+
+    Взаимность и подписки читателя проверяются одним запросом на
+    страницу каждая.
+    """
+    page_obj = paginator(
+        follows, request, AuthorCounter(author.id, relation),
+        FollowPaginator, USERS_ON_PAGE,
+    )
+    person = 'user' if relation == 'followers' else 'author'
+    people = [getattr(follow, person) for follow in page_obj]
+    ids = [user.id for user in people]
+    if relation == 'followers':
+        mutual = Follow.followed_authors(author, ids)
+    else:
+        mutual = Follow.followers_among(author, ids)
+    followed = Follow.followed_authors(request.user, ids)
+    context = {
+        'author': author,
+        'relation': relation,
+        'page_obj': page_obj,
+        'people': [
+            (user, user.id in mutual, user.id in followed)
+            for user in people
+        ],
+    }
+    return render(request, 'posts/follow_list.html', context)
+
+
+def followers(request, username):
+    author = get_object_or_404(User, username=username)
+    follows = Follow.objects.filter(author=author).select_related('user')
+    return follow_list(request, author, follows, 'followers')
+
+
+def following(request, username):
+    author = get_object_or_404(User, username=username)
+    follows = Follow.objects.filter(user=author).select_related('author')
+    return follow_list(request, author, follows, 'following')
+
+
+@cache_feed('all')
+def search(request):
+    query = request.GET.get('q', '').strip()
+    page_obj = Paginator(
+        search_ids(query) if query else [], POSTS_ON_PAGE
+    ).get_page(request.GET.get('page'))
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list
+    )
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'results': [
+            (posts[post_id], snippet(posts[post_id].text, query))
+            for post_id in page_obj if post_id in posts
+        ],
+    }
+    return render(request, 'posts/search.html', context)
+
+
+def trending(request):
+    """Популярные посты по готовому списку id, см. posts.trending."""
+    ranked = ranking()
+    page_obj = Paginator(ranked['posts'], POSTS_ON_PAGE).get_page(
+        request.GET.get('page')
+    )
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        page_obj.object_list
+    )
+    groups = Group.objects.in_bulk(ranked['groups'][:GROUPS_ON_PAGE])
+    context = {
+        'page_obj': page_obj,
+        'posts': [posts[post_id] for post_id in page_obj if post_id in posts],
+        'groups': [
+            groups[group_id] for group_id in ranked['groups']
+            if group_id in groups
+        ],
+    }
+    return render(request, 'posts/trending.html', context)
+
+
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
-    of_posts = post.author.posts.count()
+    post = get_object_or_404(
+        Post.objects.select_related('author', 'group'), id=post_id
+    )
+    of_posts = AuthorStats.get_for(post.author_id).posts
+    reply = request.GET.get('reply')
     form = CommentForm(request.POST or None)
-    comments = post.comments.all()
+    comments = CommentPage(post.id, request.GET.get('comments'))
 
     context = {
         'post': post,
         'of_posts': of_posts,
         'form': form,
+        'reply': reply if reply and reply.isdigit() else None,
         'comments': comments,
+        'comments_version': get_versions(f'post:{post.id}')[0],
+        'cache_timeout': settings.FEED_CACHE_TIMEOUT,
     }
     return render(request, 'posts/post_detail.html', context)
 
@@ -77,12 +182,13 @@ def post_create(request):
 @login_required
 def post_edit(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    if request.user != post.author:
+    if request.user.id != post.author_id:
         return redirect('posts:post_detail', post_id)
     form = PostForm(request.POST or None,
                     files=request.FILES or None,
                     instance=post)
     if request.method == "POST" and form.is_valid():
+        forget(post.id, post.updated_at)
         post = form.save(commit=False)
         post.author = request.user
         post.save()
@@ -93,39 +199,72 @@ def post_edit(request, post_id):
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+    post = get_object_or_404(Post.objects.select_related('author'), id=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
         comment.author = request.user
         comment.post = post
+        parent = request.POST.get('parent', '')
+        if parent.isdigit():
+            # Отвечать можно только на комментарии того же поста; ответ
+            # на чужой или удалённый комментарий становится корневым.
+            comment.parent = post.comments.filter(id=parent).first()
         comment.save()
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@cache_feed('post:{post_id}')
+def post_comments(request, post_id):
+    """Следующая страница комментариев в JSON для подгрузки при прокрутке.
+
+    С параметром root — следующая страница ответов этой ветки.
+    """
+    if not Post.objects.filter(id=post_id).exists():
+        raise Http404
+    root = request.GET.get('root', '')
+    comments = CommentPage(
+        post_id, request.GET.get('cursor'),
+        root=int(root) if root.isdigit() else None,
+    )
+    return JsonResponse({
+        'comments': [serialize(comment) for comment in comments.comments],
+        'cursor': comments.next_cursor,
+        'next': comments.next_url,
+    })
+
+
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = timeline_posts(request.user).select_related(
+        'author', 'group'
+    )
+    # Авторов, на которых читатель подписался после расчёта
+    # рекомендаций, отсеивает тот же запрос.
+    suggestions = FollowSuggestion.objects.filter(
+        user=request.user
+    ).exclude(
+        author__following__user=request.user
+    ).select_related('author').order_by('rank')[:SUGGESTIONS_ON_PAGE]
     context = {
-        'page_obj': paginator(post_list, request),
+        'page_obj': paginator(
+            post_list, request, feed_counter('follow', request.user.id),
+            partial(TimelinePaginator, user=request.user),
+        ),
+        'suggestions': suggestions,
     }
     return render(request, 'posts/follow.html', context)
 
 
 @login_required
 def profile_follow(request, username):
-    user = request.user
-    author = User.objects.get(username=username)
-    is_follower = Follow.objects.filter(user=user, author=author)
-    if user != author and not is_follower.exists():
-        Follow.objects.create(user=user, author=author)
+    author = get_object_or_404(User, username=username)
+    Follow.follow(request.user, author)
     return redirect(reverse('posts:profile', args=[username]))
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    is_follower = Follow.objects.filter(user=request.user, author=author)
-    if is_follower.exists():
-        is_follower.delete()
+    Follow.unfollow(request.user, author)
     return redirect('posts:profile', username=author)
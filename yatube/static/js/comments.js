@@ -0,0 +1,103 @@
+// Подгрузка комментариев при прокрутке: ссылка «Показать ещё»
+// заменяется запросом к JSON-странице комментариев. Ссылки «Показать
+// ещё ответы» подгружают следующую страницу ответов своей ветки.
+(function () {
+  var container = document.getElementById('comments');
+  if (!container || !('fetch' in window)) {
+    return;
+  }
+  var list = container.querySelector('.comment-list');
+  var loading = false;
+
+  function moreReplies(url) {
+    var link = document.createElement('a');
+    link.className = 'replies-more d-block small mb-4';
+    link.style.marginLeft = '30px';
+    link.href = url;
+    link.dataset.url = url;
+    link.textContent = 'Показать ещё ответы';
+    return link;
+  }
+
+  function append(parent, before, comment) {
+    parent.insertBefore(render(comment), before);
+    if (comment.more_replies) {
+      parent.insertBefore(moreReplies(comment.more_replies), before);
+    }
+  }
+
+  function render(comment) {
+    var item = document.createElement('div');
+    item.className = 'media mb-4';
+    item.id = 'comment-' + comment.id;
+    item.style.marginLeft = comment.depth * 30 + 'px';
+    var body = document.createElement('div');
+    body.className = 'media-body';
+    var title = document.createElement('h5');
+    title.className = 'mt-0';
+    var author = document.createElement('a');
+    author.href = comment.author_url;
+    author.textContent = comment.author;
+    title.appendChild(author);
+    var text = document.createElement('p');
+    text.textContent = comment.text;
+    var reply = document.createElement('a');
+    reply.className = 'small';
+    reply.href = '?reply=' + comment.id + '#comment-form';
+    reply.textContent = 'Ответить';
+    body.append(title, text, reply);
+    item.appendChild(body);
+    return item;
+  }
+
+  function load(more, observer) {
+    var url = container.dataset.url + '?cursor=' + more.dataset.cursor;
+    loading = true;
+    fetch(url, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        data.comments.forEach(function (comment) {
+          append(list, null, comment);
+        });
+        if (data.cursor) {
+          more.dataset.cursor = data.cursor;
+          more.href = '?comments=' + data.cursor + '#comments';
+        } else {
+          observer.disconnect();
+          more.remove();
+        }
+      })
+      .finally(function () { loading = false; });
+  }
+
+  container.addEventListener('click', function (event) {
+    var link = event.target.closest('.replies-more');
+    if (!link) {
+      return;
+    }
+    event.preventDefault();
+    fetch(link.dataset.url, {credentials: 'same-origin'})
+      .then(function (response) { return response.json(); })
+      .then(function (data) {
+        data.comments.forEach(function (comment) {
+          append(link.parentNode, link, comment);
+        });
+        if (data.next) {
+          link.dataset.url = data.next;
+          link.href = data.next;
+        } else {
+          link.remove();
+        }
+      });
+  });
+
+  var more = container.querySelector('.comments-more');
+  if (!more || !('IntersectionObserver' in window)) {
+    return;
+  }
+  new IntersectionObserver(function (entries, observer) {
+    if (entries[0].isIntersecting && !loading) {
+      load(more, observer);
+    }
+  }).observe(more);
+})();
@@ -51,6 +51,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.perf.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -66,7 +67,9 @@ ROOT_URLCONF = 'yatube.urls'
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени отрисовки, см. core.perf
+        'BACKEND': 'core.perf.templates.DjangoTemplates',
+        'NAME': 'django',
         # Добавлено: Искать шаблоны на уровне проекта
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
@@ -139,12 +142,106 @@ STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Общий кэш для всех воркеров: путь к файлу SQLite в YATUBE_SHARED_CACHE.
+# Без него общий уровень живёт в памяти процесса (разработка и тесты).
+SHARED_CACHE_LOCATION = os.environ.get('YATUBE_SHARED_CACHE')
+
 CACHES = {
     'default': {
+        'BACKEND': 'core.cache.backends.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_MAX_ENTRIES': 1000,
+            'LOCAL_TIMEOUT': 5,
+            'LOCAL_SKIP_PREFIXES': ['feed_version:', 'lock:'],
+        },
+    },
+    'shared': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
-    }
+        'LOCATION': 'shared',
+    } if SHARED_CACHE_LOCATION is None else {
+        'BACKEND': 'core.cache.backends.SQLiteCache',
+        'LOCATION': SHARED_CACHE_LOCATION,
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
 }
 
+# Страницы лент кэшируются до изменения ленты, см. posts.caching
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+
+# Карточки постов, см. posts.fragments
+POST_FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Потоки для миниатюр, см. posts.thumbnails; 0 — создавать сразу после
+# коммита в потоке запроса (так настроены тесты). Число потоков можно
+# задать через YATUBE_THUMBNAIL_WORKERS.
+THUMBNAIL_WORKERS = int(os.environ.get('YATUBE_THUMBNAIL_WORKERS', 2))
+# Приём картинок постов, см. posts.images
+POST_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POST_IMAGE_MAX_SIDE = 2560
+# Файлы картинок моложе этого числа секунд не удаляются, см. posts.storage
+MEDIA_COLLECT_GRACE = 60 * 10
+
+# Сколько найденных постов показывает поиск, см. posts.search
+SEARCH_MAX_RESULTS = 1000
+
+# Ширины миниатюр картинок постов для srcset
+POST_IMAGE_WIDTHS = [480, 720, 960]
+
+# Пересчёт записей кэша одним исполнителем, см. core.cache.flight
+CACHE_LOCK_TIMEOUT = 10
+CACHE_LOCK_WAIT = 0.5
+CACHE_EARLY_EXPIRATION_BETA = 1.0
+
+# Подсчёт постов для пагинатора: exact, cached или table
+POSTS_COUNT_STRATEGY = 'table'
+POSTS_COUNT_CACHE_TIMEOUT = 60
+
+# Лента подписок: максимум записей на читателя, порог подписчиков,
+# после которого посты автора не раздаются, а читаются при запросе, и
+# как часто (в среднем раз в столько постов) раздача обрезает ленту
+TIMELINE_MAX_ENTRIES = 1000
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_TRIM_EVERY = 50
+
+# Рекомендации «на кого подписаться», см. posts.suggestions: сколько
+# хранить на читателя и порог подписчиков, после которого автор не
+# учитывается при поиске похожих читателей
+SUGGESTIONS_COUNT = 20
+SUGGESTIONS_FANOUT_LIMIT = 1000
+
+# Популярное, см. posts.trending: период полураспада оценки и окно
+# пересчёта в часах, веса комментария и подписки на автора, длина
+# готового списка и время его жизни в кэше
+TRENDING_HALF_LIFE = 6
+TRENDING_WINDOW = 72
+TRENDING_COMMENT_WEIGHT = 1.0
+TRENDING_FOLLOW_WEIGHT = 2.0
+TRENDING_SIZE = 200
+TRENDING_CACHE_TIMEOUT = 60
+
+# Замеры запросов, см. core.perf: доля замеряемых запросов, доля из них
+# с замером памяти, заголовок Server-Timing и замеряемые представления.
+# Показатели /metrics/ отдаются администраторам и по заголовку
+# Authorization: Bearer <METRICS_TOKEN>, если токен задан.
+PERF_SAMPLE_RATE = float(os.environ.get('YATUBE_PERF_SAMPLE_RATE', 1.0))
+PERF_MEMORY_SAMPLE_RATE = float(
+    os.environ.get('YATUBE_PERF_MEMORY_SAMPLE_RATE', 0.01)
+)
+PERF_SERVER_TIMING = DEBUG
+PERF_VIEW_MODULES = ['posts.views', 'users.views', 'core.views']
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN')
+# Журнал медленных запросов к БД, см. core.perf.slowlog: порог в
+# секундах (None — выключен) и число хранимых форм запросов
+SLOW_QUERY_THRESHOLD = 0.1
+SLOW_QUERY_LOG_SIZE = 200
+# Тесты не печатают предупреждения журнала, см. core.runner
+TEST_RUNNER = 'core.runner.QuietTestRunner'
+
+# Глубина дерева ответов на комментарии; 0 — без ответов
+COMMENT_MAX_DEPTH = 4
+
 LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'posts:index'
 # LOGOUT_REDIRECT_URL = 'posts:index'